@@ -1,4 +1,5 @@
 import tkinter as tk
+import multiprocessing
 import os
 import frame_manager
 
@@ -37,4 +38,6 @@ def main():
     main_frame.save_settings()
 
 if __name__ == '__main__':
+    # Solvers start worker processes, which needs this in the frozen executable.
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
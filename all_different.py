@@ -0,0 +1,128 @@
+# Generalized arc consistency for the all-different constraint of one unit (Regin's filtering).
+#
+# The cells of a unit and the digits they can still take form a bipartite graph, and the unit is consistent only if
+# the graph has a matching that covers every cell. A candidate d of a cell c belongs to some such matching (so it has
+# a support) iff it is the digit matched to c, or c and the cell matched to d lie in the same strongly connected
+# component of the directed graph with an edge c -> c' for every candidate of c matched to c'. Since a unit has as
+# many free cells as free digits, every digit is matched and no alternating paths from free digits are needed.
+# Filtering removes every candidate without a support, which subsumes hidden singles, naked and hidden subsets of any
+# size and dead units.
+#
+# Matchings are found with augmenting paths (Kuhn's algorithm) starting from the matching of the previous call, so
+# after a few eliminations only the cells that lost their matched digit have to be re-matched. Candidates are int
+# bitmasks as in bitmask_solver.py, and the components are found with bitmask closures over digits: usually the free
+# cells of a unit form a single component, which takes one forward and one backward closure, so a call costs a few
+# Python operations per cell rather than per candidate.
+#
+# Depends on no other project files.
+
+
+def filter_unit(masks, matching):
+    """
+    :param masks: list of int candidate bitmasks of the free cells of a unit, as many cells as digits in their union.
+    :param matching: list of the same length, for every cell the bit of the digit matched to it by an earlier call, or
+        0. Entries may be stale (no longer a candidate, or the same bit twice); they are only used as a starting point.
+        Updated in place to a matching covering every cell, unless None is returned.
+    :return: list of int bitmasks, the candidates of each cell that belong to some matching covering every cell, or
+        None if there is no such matching.
+    """
+    number_of_cells = len(masks)
+    owner = {}  # digit bit -> cell matched to it
+    for cell in range(number_of_cells):
+        bit = matching[cell]
+        if bit and masks[cell] & bit and bit not in owner:
+            owner[bit] = cell
+        else:
+            matching[cell] = 0
+
+    for cell in range(number_of_cells):
+        if not matching[cell] and not _augment(cell, masks, matching, owner, [0]):
+            return None
+
+    # Cells and digits are matched one to one, so the graph can be taken over digits instead of cells: the digit of
+    # a cell has an edge to every candidate of the cell. Successors are bitmasks over digits, and the strongly
+    # connected components are found as intersections of forward and backward closures.
+    successors = dict(zip(matching, masks))
+    component_of = {}
+    remaining = 0
+    for bit in matching:
+        remaining |= bit
+    while remaining:
+        root = remaining & -remaining
+        component = _closure(root, successors, remaining)
+        component &= _reverse_closure(root, successors, component)
+        remaining &= ~component
+        if not remaining and component_of == {}:
+            return masks  # a single component, every candidate is supported
+        bits = component
+        while bits:
+            bit = bits & -bits
+            bits ^= bit
+            component_of[bit] = component
+    return [masks[cell] & component_of[matching[cell]] for cell in range(number_of_cells)]
+
+
+def _closure(root, edges, within):
+    """
+    :param root: int. Bit of the start digit.
+    :param edges: dict from digit bits to bitmasks of their neighbours.
+    :param within: int. Bitmask of the digits the closure is restricted to.
+    :return: int. Bitmask of the digits in within reachable from root.
+    """
+    reached = root
+    frontier = root
+    while frontier:
+        bit = frontier & -frontier
+        frontier ^= bit
+        new = edges[bit] & within & ~reached
+        reached |= new
+        frontier |= new
+    return reached
+
+
+def _reverse_closure(root, edges, within):
+    """
+    :param root: int. Bit of the target digit.
+    :param edges: dict from digit bits to bitmasks of their neighbours.
+    :param within: int. Bitmask of the digits the closure is restricted to.
+    :return: int. Bitmask of the digits in within from which root can be reached inside within.
+    """
+    reached = root
+    changed = True
+    while changed:
+        changed = False
+        others = within & ~reached
+        while others:
+            bit = others & -others
+            others ^= bit
+            if edges[bit] & reached:
+                reached |= bit
+                changed = True
+    return reached
+
+
+def _augment(cell, masks, matching, owner, visited):
+    """
+    Looks for an augmenting path from the unmatched cell and flips it.
+    :param visited: [int] one-element list holding the bitmask of the digits visited in this search.
+    :return: bool. True if cell got matched.
+    """
+    free = masks[cell] & ~visited[0]
+    # Digits that are not matched yet end the path right away, so they are tried first.
+    bits = free
+    while bits:
+        bit = bits & -bits
+        bits ^= bit
+        if bit not in owner:
+            owner[bit] = cell
+            matching[cell] = bit
+            return True
+    visited[0] |= free
+    while free:
+        bit = free & -free
+        free ^= bit
+        if _augment(owner[bit], masks, matching, owner, visited):
+            owner[bit] = cell
+            matching[cell] = bit
+            return True
+    return False
@@ -0,0 +1,130 @@
+# Batch solving of many sudokus of the same size at once.
+#
+# Boards are stacked into one (M, N**2, N**2) array and their candidates into a (M, N**4, N**2) boolean tensor.
+# Naked singles, hidden singles and dead units are propagated for all boards together with a few matrix products
+# against the unit membership matrix from sudoku_geometry.py. Only boards that are still undecided afterwards are
+# handed over, one by one, to the search of bitmask_solver.py.
+#
+# Results agree with solving every board separately by Sudoku.solve(engine='bitmask') with the same random_state and
+# rules, including the number of guesses.
+#
+# Depends only on sudoku_geometry.py and bitmask_solver.py.
+
+
+import math
+
+import numpy as np
+
+import bitmask_solver
+from sudoku_geometry import geometry
+
+
+def propagate_batch(candidates, N, rules=bitmask_solver.DEFAULT_RULES):
+    """
+    Propagates naked singles (and hidden singles and dead units, if in rules) on a stack of boards until a fixpoint.
+    :param candidates: (M, N**4, N**2) bool ndarray. candidates[m, cell, d - 1] is True if d is possible in cell
+        of board m. Modified in place.
+    :param N: int. Side of the small square, or a sudoku_geometry.Geometry.
+    :param rules: collection of rule names from bitmask_solver.ALL_RULES. Locked candidates, naked subsets and
+        all-different filtering are left to the per-board search.
+    :return: (M,) bool ndarray. False for the boards where a contradiction was found.
+    """
+    board_geometry = geometry(N)
+    membership = board_geometry.unit_membership.astype(np.float32)
+    # Cells of variants can be in more than three units, so per-cell sums over units are products with the transposed
+    # membership table.
+    cell_membership = np.ascontiguousarray(membership.T)
+    units_per_cell = membership.sum(axis=0)[:, None]
+    hidden_singles = bitmask_solver.HIDDEN_SINGLES in rules
+    dead_units = bitmask_solver.DEAD_UNITS in rules
+
+    consistent = np.ones(len(candidates), dtype=bool)
+    active = np.flatnonzero(consistent)
+    while active.size:
+        current = candidates[active]
+        fixed = current & (current.sum(axis=2) == 1)[:, :, None]
+        unit_fixed = membership @ fixed.astype(np.float32)
+        # Each cell is counted once in each of its units, so the sum over them minus that many times fixed counts peers.
+        peer_fixed = cell_membership @ unit_fixed - units_per_cell * fixed
+        new = current & (peer_fixed == 0)
+        dead = (unit_fixed > 1).any(axis=(1, 2))
+
+        if hidden_singles or dead_units:
+            unit_counts = membership @ new.astype(np.float32)
+            if dead_units:
+                dead |= (unit_counts == 0).any(axis=(1, 2))
+            if hidden_singles:
+                single_place = new & (cell_membership @ (unit_counts == 1).astype(np.float32) > 0)
+                number_of_single_places = single_place.sum(axis=2)
+                dead |= (number_of_single_places > 1).any(axis=1)
+                new = np.where((number_of_single_places == 1)[:, :, None], single_place, new)
+
+        dead |= ~new.any(axis=2).all(axis=1)
+        changed = (new != current).any(axis=(1, 2))
+        candidates[active] = new
+        consistent[active[dead]] = False
+        active = active[changed & ~dead]
+    return consistent
+
+
+def solve_batch(boards, max_solutions=1, random_state=None, rules=None, N=None):
+    """
+    Solves a stack of sudokus of the same size.
+    :param boards: (M, N**2, N**2) int ndarray, 0 for empty cells.
+    :param max_solutions: int >= 1 or 'all'. Same as maximal_number_of_solutions of Sudoku.solve.
+    :param random_state: None or int. Every board that needs guessing is searched with this random_state.
+    :param rules: None or collection of rule names from bitmask_solver.ALL_RULES. Use () to get the number of
+        guesses used by the difficulty estimation. None picks the default for the board size, see
+        bitmask_solver.default_rules.
+    :param N: None, int or sudoku_geometry.Geometry. Side of the small square, computed from the shape of boards if
+        None. A Geometry gives boards with rectangular boxes or the extra units of variants.
+    :return: (solutions, solution_counts, guess_counts)
+        solutions: (M, N**2, N**2) int16 ndarray. First solution found for each board, zeros if it has none.
+        solution_counts: (M,) int ndarray. Number of solutions found, at most max_solutions.
+        guess_counts: (M,) int ndarray. Number of guesses used to find the first solution, -1 if there is none.
+    """
+    boards = np.asarray(boards)
+    if boards.ndim != 3 or boards.shape[1] != boards.shape[2]:
+        raise ValueError("boards has to be an array of shape (M, N**2, N**2)")
+    size = boards.shape[1]
+    if N is None:
+        N = math.isqrt(size)
+        if N * N != size:
+            raise ValueError("Board side has to be a square, got " + str(size) +
+                             ". Pass a sudoku_geometry.Geometry as N for rectangular boxes")
+    if geometry(N).size != size:
+        raise ValueError("Boards of side " + str(size) + " do not fit " + str(geometry(N)))
+    if boards.min(initial=0) < 0 or boards.max(initial=0) > size:
+        raise ValueError("Board values have to be between 0 and N**2")
+    if rules is None:
+        rules = bitmask_solver.default_rules(N)
+
+    number_of_boards = len(boards)
+    flat_boards = boards.reshape(number_of_boards, size * size).astype(np.intp)
+    candidates = np.ones((number_of_boards, size * size, size), dtype=bool)
+    given = flat_boards > 0
+    candidates[given] = np.eye(size, dtype=bool)[flat_boards[given] - 1]
+    consistent = propagate_batch(candidates, N, rules=rules)
+
+    solutions = np.zeros((number_of_boards, size * size), dtype=np.int16)
+    solution_counts = np.zeros(number_of_boards, dtype=int)
+    guess_counts = np.full(number_of_boards, -1, dtype=int)
+
+    decided = consistent & (candidates.sum(axis=2) == 1).all(axis=1)
+    solutions[decided] = candidates[decided].argmax(axis=2) + 1
+    solution_counts[decided] = 1
+    guess_counts[decided] = 0
+
+    bit_values = 1 << np.arange(size, dtype=np.int64)
+    for board_number in np.flatnonzero(consistent & ~decided):
+        guesses = []
+        board_solutions = bitmask_solver.solve(
+            flat_boards[board_number].tolist(), N, maximal_number_of_solutions=max_solutions,
+            random_state=random_state, number_of_guesses_tracker=guesses,
+            candidates=(candidates[board_number] @ bit_values).tolist(), rules=rules)
+        solution_counts[board_number] = len(board_solutions)
+        if board_solutions:
+            solutions[board_number] = board_solutions[0]
+            guess_counts[board_number] = guesses[0]
+
+    return solutions.reshape(boards.shape), solution_counts, guess_counts
@@ -0,0 +1,1020 @@
+# Pure-integer bitmask engine for solving sudokus of any size, layout (rectangular boxes) and variant (extra units).
+#
+# Candidates of each cell are kept as one int bitmask (bit d-1 is set if d is still possible in the cell), together
+# with masks of digits already used in each row, column and box. Singles are found with lowest-bit tricks and the
+# branching cell (minimal remaining values, MRV) with popcounts, so no NumPy calls are made in the inner loop.
+# On 9x9 boards this is more than an order of magnitude faster than the ndarray based solver in sudoku.py.
+#
+# Naked singles are always propagated. Stronger rules (hidden singles, dead units, locked candidates and naked
+# subsets) can be switched on individually with the rules argument; they are applied until a fixpoint is reached
+# before every guess. Propagation is event driven: singles are queued as a side effect of eliminations, and every
+# elimination marks the units of its cell as dirty, so the rules only re-examine units that changed since they last
+# looked at them. The cost of a fixpoint is proportional to the number of eliminations, not to the board size.
+# Failed literal probing (FAILED_LITERALS) is an optional lookahead on top of the rules: candidates of cells with few
+# candidates are set tentatively, and the ones whose propagation ends in a contradiction are removed. Tentative changes
+# are rolled back on the undo trail, and a budget bounds the number of probes per node.
+# ALL_DIFFERENT enforces generalized arc consistency on every unit (all_different.py): a candidate is removed unless
+# some matching of the free cells of the unit to its free digits uses it. The matching of every unit is kept in the
+# state and only repaired after eliminations. It is on by default for boards of at least ALL_DIFFERENT_MIN_N.
+#
+# The branching cell and the guessed digit are chosen by pluggable heuristics: minimal remaining values (MRV), MRV with
+# a degree tie-break, or dom/wdeg (candidates per conflict weight of the units of the cell), and a random or least
+# constraining digit. Defaults depend on the board size, see DEFAULT_HEURISTICS.
+#
+# Search times on hard boards are heavy tailed: one bad early guess can lock the search into a huge subtree that another
+# seed avoids. solve(restarts='luby') caps the backtracks of each attempt and restarts with a new seed when the cap is
+# hit; the caps grow, and the last attempt is not capped, so the search stays complete.
+#
+# The search either copies the state at every guess (search='copy') or works on a single state and records every
+# change on an undo trail that is rolled back on backtracking (search='trail', the default). With the trail, memory
+# is proportional to the number of changes along the current branch instead of depth times board size.
+#
+# All units, peers and intersections come from the tables of sudoku_geometry.py, so boards with rectangular boxes and
+# variants (pass a sudoku_geometry.Geometry as N) run through the same code as standard ones.
+#
+# Boards are flat lists of N**4 ints in row-major order, 0 for empty cells.
+# Sudoku.solve(engine='bitmask') wraps this module and keeps the output format of the original solver.
+#
+# Depends only on sudoku_geometry.py, search_limits.py and all_different.py.
+
+
+import itertools
+import random
+import time
+
+import all_different
+from search_limits import SearchBudgetExceeded, SearchLimits
+from sudoku_geometry import geometry
+
+# Propagation rules that can be passed to solve() and BitmaskState.propagate().
+HIDDEN_SINGLES = 'hidden_singles'  # a digit that fits in only one cell of a unit is set there
+DEAD_UNITS = 'dead_units'  # a digit that fits nowhere in a unit makes the state a contradiction
+LOCKED_CANDIDATES = 'locked_candidates'  # pointing and claiming on box/line (and other unit) intersections
+NAKED_SUBSETS = 'naked_subsets'  # naked pairs and triples
+FAILED_LITERALS = 'failed_literals'  # candidates whose tentative assignment propagates to a contradiction are removed
+ALL_DIFFERENT = 'all_different'  # candidates that no matching of the cells and digits of a unit uses are removed
+ALL_RULES = (HIDDEN_SINGLES, DEAD_UNITS, LOCKED_CANDIDATES, NAKED_SUBSETS, FAILED_LITERALS, ALL_DIFFERENT)
+NAKED_SINGLES = 'naked_singles'  # always applied, only used as a key of SolverStats.eliminations
+# Branching heuristics (choice of the cell to guess in) that can be passed to solve().
+MRV = 'mrv'  # fewest candidates, the first such cell
+MRV_DEGREE = 'mrv_degree'  # fewest candidates, ties broken by the most empty cells in the units of the cell
+DOM_WDEG = 'dom_wdeg'  # fewest candidates per weight of the units of the cell; units of failed guesses gain weight
+BRANCHING_HEURISTICS = (MRV, MRV_DEGREE, DOM_WDEG)
+# Value orderings (choice of the digit to guess) that can be passed to solve().
+RANDOM_VALUES = 'random'  # uniformly random candidate
+LCV = 'lcv'  # least constraining value: the candidate possible in the fewest peers, ties broken at random
+VALUE_ORDERINGS = (RANDOM_VALUES, LCV)
+# Hidden singles give most of the benefit (3x faster on hard 9x9 and 20x on 16x16 bank puzzles); locked candidates
+# and naked subsets save a few more guesses but cost about as much time as they save.
+DEFAULT_RULES = (HIDDEN_SINGLES, DEAD_UNITS)
+# ALL_DIFFERENT is added to DEFAULT_RULES for N >= ALL_DIFFERENT_MIN_N. On hard 25x25 boards it cuts the guesses 4-5x
+# and the time about 2x (first solutions and uniqueness checks alike), and a search that ran over 30s took 17s. On
+# hard 16x16 boards it cuts the guesses 2.5x, but each node costs more than that saves: 1.1-1.3x slower in total.
+ALL_DIFFERENT_MIN_N = 5
+# Failed literal probing tries at most PROBE_BUDGET tentative assignments per propagation, in cells with at most
+# PROBE_ARITY candidates, and the search only probes in the first PROBE_DEPTH levels below the root. On hard 16x16
+# uniqueness checks this cuts the number of guesses 2.5x and the time 1.3x; probing deeper costs more than it saves.
+PROBE_BUDGET = 256
+PROBE_ARITY = 2
+PROBE_DEPTH = 3
+# Restarted searches (solve(restarts=...)) cap the backtracks of the first attempt at RESTART_BASE and scale the caps
+# of later attempts by the Luby sequence or by RESTART_GROWTH, for at most MAX_RESTARTS restarts. On hard 16x16 boards
+# Luby restarts with these values bring the 99th percentile of the solve time from 2.4s to 1.3s (first solution) and
+# from 2.2s to 1.7s (uniqueness check), and the worst case from over 15s to 2s; larger bases and geometric caps did
+# worse.
+RESTART_BASE = 10
+RESTART_GROWTH = 1.5
+MAX_RESTARTS = 30
+# (branching, value_order) for each N; other sizes use the entry of the nearest N. On 9x9 bank puzzles all heuristics
+# are within 10% of each other, so plain MRV is kept. On 16x16, MRV_DEGREE with LCV makes the uniqueness checks of the
+# generator (can_remove_positions on bank and generated puzzles) 1.7x faster than MRV with random values; DOM_WDEG with
+# LCV finds first solutions of hard puzzles 2.4x faster but makes those checks 2.5-4x slower.
+DEFAULT_HEURISTICS = {3: (MRV, RANDOM_VALUES), 4: (MRV_DEGREE, LCV)}
+
+try:
+    popcount = int.bit_count
+except AttributeError:  # Python < 3.10
+    def popcount(mask):
+        return bin(mask).count("1")
+
+
+def default_heuristics(N) -> (str, str):
+    """
+    :param N: int. Side of the small square, or a sudoku_geometry.Geometry.
+    :return: (branching, value_order) used when solve() is not given them, see DEFAULT_HEURISTICS.
+    """
+    N = geometry(N).N
+    return DEFAULT_HEURISTICS[min(DEFAULT_HEURISTICS, key=lambda measured_N: (abs(measured_N - N), measured_N))]
+
+
+def default_rules(N) -> tuple:
+    """
+    :param N: int. Side of the small square, or a sudoku_geometry.Geometry.
+    :return: tuple of the rules used when solve() is not given them: DEFAULT_RULES, plus ALL_DIFFERENT for
+        N >= ALL_DIFFERENT_MIN_N.
+    """
+    N = geometry(N).N
+    return DEFAULT_RULES + (ALL_DIFFERENT,) if N >= ALL_DIFFERENT_MIN_N else DEFAULT_RULES
+
+
+def digits_of(mask):
+    """
+    :param mask: int bitmask of candidates.
+    :return: [int] sorted list of digits whose bits are set in mask.
+    """
+    digits = []
+    while mask:
+        lowest_bit = mask & -mask
+        digits.append(lowest_bit.bit_length())
+        mask ^= lowest_bit
+    return digits
+
+
+class BitmaskState:
+    """
+    Mutable search state of the bitmask engine: candidates and values of all cells plus used digits of every unit.
+    Copying a state is a handful of list copies, which is what makes guessing cheap compared to Sudoku.__copy__.
+    dirty is a bitmask over geometry.units of the units whose candidates changed since the last call to propagate().
+    trail is None, or a list that records every change as (cell, old candidates) for eliminations and
+    (-1 - cell, old candidates) for assignments, so that undo() can roll the state back.
+    matchings is None until ALL_DIFFERENT first runs, then for every unit the bit of the digit matched to each of its
+    cells. It is only a starting point for the next matching and is left alone by undo(), so it needs no trail.
+    """
+    __slots__ = ('geometry', 'candidates', 'values', 'row_used', 'column_used', 'box_used', 'empty', 'dirty',
+                 'trail', 'matchings')
+
+    def __init__(self, N):
+        """
+        Creates an empty board where every digit is possible in every cell.
+        :param N: int. Side of the small square, or a sudoku_geometry.Geometry.
+        """
+        self.geometry = geometry(N)
+        size = self.geometry.size
+        self.candidates = [self.geometry.full_mask] * self.geometry.number_of_cells
+        self.values = [0] * self.geometry.number_of_cells
+        self.row_used = [0] * size
+        self.column_used = [0] * size
+        self.box_used = [0] * size
+        self.empty = self.geometry.number_of_cells
+        self.dirty = (1 << len(self.geometry.units)) - 1
+        self.trail = None
+        self.matchings = None
+
+    @classmethod
+    def from_board(cls, board, N, candidates=None):
+        """
+        :param board: flat sequence of N**4 ints, 0 for empty cells.
+        :param N: int. Side of the small square, or a sudoku_geometry.Geometry for other layouts and variants.
+        :param candidates: None or flat sequence of N**4 int bitmasks restricting the candidates of each cell.
+        :return: BitmaskState with all singles propagated, or None if the board is contradictory.
+        """
+        state = cls(N)
+        board_geometry = state.geometry
+        row_of, column_of, box_of = board_geometry.row_of, board_geometry.column_of, board_geometry.box_of
+        row_used, column_used, box_used = state.row_used, state.column_used, state.box_used
+        values = state.values
+        if candidates is not None:
+            state.candidates = [int(mask) for mask in candidates]
+        cell_candidates = state.candidates
+
+        # Givens only need the used masks of their units, peers are pruned from those masks in one pass.
+        for cell, value in enumerate(board):
+            if value:
+                bit = 1 << (int(value) - 1)
+                row, column, box = row_of[cell], column_of[cell], box_of[cell]
+                if not cell_candidates[cell] & bit or (row_used[row] | column_used[column] | box_used[box]) & bit:
+                    return None
+                row_used[row] |= bit
+                column_used[column] |= bit
+                box_used[box] |= bit
+                values[cell] = int(value)
+                cell_candidates[cell] = bit
+                state.empty -= 1
+
+        # Digits given in the extra units of variants, which have no used masks; after this, assign() keeps them out
+        # of the candidates of the peers.
+        extra_used = None
+        if board_geometry.extra_units:
+            extra_used = [0] * board_geometry.number_of_cells
+            for unit in board_geometry.extra_units:
+                used = 0
+                for cell in unit:
+                    if values[cell]:
+                        bit = 1 << (values[cell] - 1)
+                        if used & bit:
+                            return None
+                        used |= bit
+                for cell in unit:
+                    extra_used[cell] |= used
+
+        singles = []
+        for cell in range(board_geometry.number_of_cells):
+            if not values[cell]:
+                mask = cell_candidates[cell] & ~(row_used[row_of[cell]] | column_used[column_of[cell]] |
+                                                 box_used[box_of[cell]])
+                if extra_used is not None:
+                    mask &= ~extra_used[cell]
+                if not mask:
+                    return None
+                cell_candidates[cell] = mask
+                if not mask & (mask - 1):
+                    singles.append(cell)
+        for cell in singles:
+            if not state.assign(cell, cell_candidates[cell].bit_length()):
+                return None
+        return state
+
+    def copy(self):
+        new_state = BitmaskState.__new__(BitmaskState)
+        new_state.geometry = self.geometry
+        new_state.candidates = self.candidates.copy()
+        new_state.values = self.values.copy()
+        new_state.row_used = self.row_used.copy()
+        new_state.column_used = self.column_used.copy()
+        new_state.box_used = self.box_used.copy()
+        new_state.empty = self.empty
+        new_state.dirty = self.dirty
+        new_state.trail = None
+        new_state.matchings = None if self.matchings is None else [matching.copy() for matching in self.matchings]
+        return new_state
+
+    def undo(self, trail_length):
+        """
+        Rolls back all changes recorded on self.trail after its first trail_length entries.
+        self.dirty is not restored, the caller should keep it together with trail_length.
+        """
+        trail = self.trail
+        candidates = self.candidates
+        values = self.values
+        geometry = self.geometry
+        while len(trail) > trail_length:
+            key, old_mask = trail.pop()
+            if key < 0:
+                cell = -1 - key
+                bit = 1 << (values[cell] - 1)
+                self.row_used[geometry.row_of[cell]] ^= bit
+                self.column_used[geometry.column_of[cell]] ^= bit
+                self.box_used[geometry.box_of[cell]] ^= bit
+                values[cell] = 0
+                self.empty += 1
+                candidates[cell] = old_mask
+            else:
+                candidates[key] = old_mask
+
+    def removed_candidates(self, trail_length) -> int:
+        """
+        :param trail_length: int. Length of self.trail before the changes to count.
+        :return: int. Number of candidates removed from cells by the changes recorded on self.trail after its first
+            trail_length entries, including the ones removed by setting cells. Used for SolverStats.eliminations.
+        """
+        trail = self.trail
+        candidates = self.candidates
+        first_masks = {}  # cell -> its candidates before the first change of the segment
+        for position in range(trail_length, len(trail)):
+            key, old_mask = trail[position]
+            cell = -1 - key if key < 0 else key
+            if cell not in first_masks:
+                first_masks[cell] = old_mask
+        removed = 0
+        for cell, old_mask in first_masks.items():
+            removed += popcount(old_mask & ~candidates[cell])
+        return removed
+
+    def assign(self, cell, digit) -> bool:
+        """
+        Sets cell to digit and removes digit from the candidates of all peers. Peers that are left with a single
+        candidate are set as well, until no more naked singles appear.
+        :param cell: int. Flat index of the cell.
+        :param digit: int. 1 <= digit <= N**2
+        :return: bool. False if a contradiction was found (the state is then unusable), else True.
+        """
+        geometry = self.geometry
+        row_of, column_of, box_of, peers = geometry.row_of, geometry.column_of, geometry.box_of, geometry.peers
+        unit_bits_of = geometry.unit_bits_of
+        candidates = self.candidates
+        values = self.values
+        row_used, column_used, box_used = self.row_used, self.column_used, self.box_used
+        dirty = self.dirty
+        trail = self.trail
+
+        queue = [(cell, digit)]
+        while queue:
+            cell, digit = queue.pop()
+            if values[cell]:
+                if values[cell] != digit:
+                    return False
+                continue
+            bit = 1 << (digit - 1)
+            row, column, box = row_of[cell], column_of[cell], box_of[cell]
+            if not candidates[cell] & bit or (row_used[row] | column_used[column] | box_used[box]) & bit:
+                return False
+            if trail is not None:
+                trail.append((-1 - cell, candidates[cell]))
+            row_used[row] |= bit
+            column_used[column] |= bit
+            box_used[box] |= bit
+            values[cell] = digit
+            candidates[cell] = bit
+            self.empty -= 1
+            dirty |= unit_bits_of[cell]
+            for peer in peers[cell]:
+                mask = candidates[peer]
+                if mask & bit:
+                    if not mask ^ bit:
+                        return False
+                    if trail is not None:
+                        trail.append((peer, mask))
+                    mask ^= bit
+                    candidates[peer] = mask
+                    dirty |= unit_bits_of[peer]
+                    if not mask & (mask - 1):
+                        queue.append((peer, mask.bit_length()))
+        self.dirty = dirty
+        return True
+
+    def eliminate(self, cell, digit) -> bool:
+        """
+        Removes digit from the candidates of cell, setting the cell if a single candidate remains.
+        :return: bool. False if a contradiction was found (the state is then unusable), else True.
+        """
+        return self.remove_candidates(cell, 1 << (digit - 1))
+
+    def remove_candidates(self, cell, mask) -> bool:
+        """
+        Removes all digits of mask from the candidates of cell, setting the cell if a single candidate remains.
+        :return: bool. False if a contradiction was found (the state is then unusable), else True.
+        """
+        current = self.candidates[cell]
+        if not current & mask:
+            return True
+        if self.values[cell]:
+            return False
+        if not current & ~mask:
+            return False
+        if self.trail is not None:
+            self.trail.append((cell, current))
+        current &= ~mask
+        self.candidates[cell] = current
+        self.dirty |= self.geometry.unit_bits_of[cell]
+        if not current & (current - 1):
+            return self.assign(cell, current.bit_length())
+        return True
+
+    def propagate(self, rules, stats=None, probe_budget=PROBE_BUDGET):
+        """
+        Applies rules until none of them changes the state. Each rule only looks at units that changed since it last
+        ran, and cheaper rules are always rerun first on fresh changes. Failed literals are only probed once all other
+        rules are at a fixpoint.
+        :param rules: collection of rule names from ALL_RULES.
+        :param stats: None or SolverStats. If given, eliminations of each rule are counted; needs self.trail.
+        :param probe_budget: int. Maximal number of tentative assignments made by FAILED_LITERALS in this call.
+        :return: bool. False if a contradiction was found (the state is then unusable), else True.
+        """
+        failed_literals = FAILED_LITERALS in rules
+        if failed_literals:
+            rules = tuple(rule for rule in rules if rule != FAILED_LITERALS)
+        hidden_singles = HIDDEN_SINGLES in rules
+        dead_units = DEAD_UNITS in rules
+        unit_rules = hidden_singles or dead_units
+        locked_candidates = LOCKED_CANDIDATES in rules
+        naked_subsets = NAKED_SUBSETS in rules
+        all_different = ALL_DIFFERENT in rules
+        unit_rules_pending = locked_candidates_pending = naked_subsets_pending = all_different_pending = 0
+
+        while self.empty:
+            changes = self.dirty
+            self.dirty = 0
+            unit_rules_pending |= changes
+            locked_candidates_pending |= changes
+            naked_subsets_pending |= changes
+            all_different_pending |= changes
+
+            if unit_rules and unit_rules_pending:
+                trail_length = None if stats is None else len(self.trail)
+                consistent = self._apply_unit_rules(unit_rules_pending, hidden_singles, dead_units)
+                if stats is not None:
+                    stats.eliminations[HIDDEN_SINGLES] += self.removed_candidates(trail_length)
+                if not consistent:
+                    return False
+                unit_rules_pending = 0
+                if self.dirty:
+                    continue
+            if locked_candidates and locked_candidates_pending:
+                trail_length = None if stats is None else len(self.trail)
+                consistent = self._apply_locked_candidates(locked_candidates_pending)
+                if stats is not None:
+                    stats.eliminations[LOCKED_CANDIDATES] += self.removed_candidates(trail_length)
+                if not consistent:
+                    return False
+                locked_candidates_pending = 0
+                if self.dirty:
+                    continue
+            if naked_subsets and naked_subsets_pending:
+                trail_length = None if stats is None else len(self.trail)
+                consistent = self._apply_naked_subsets(naked_subsets_pending)
+                if stats is not None:
+                    stats.eliminations[NAKED_SUBSETS] += self.removed_candidates(trail_length)
+                if not consistent:
+                    return False
+                naked_subsets_pending = 0
+                if self.dirty:
+                    continue
+            if all_different and all_different_pending:
+                trail_length = None if stats is None else len(self.trail)
+                consistent = self._apply_all_different(all_different_pending)
+                if stats is not None:
+                    stats.eliminations[ALL_DIFFERENT] += self.removed_candidates(trail_length)
+                if not consistent:
+                    return False
+                all_different_pending = 0
+            if not self.dirty and failed_literals and probe_budget > 0:
+                trail_length = None if stats is None else len(self.trail)
+                consistent, probe_budget = self._probe_failed_literals(rules, probe_budget)
+                if stats is not None:
+                    stats.eliminations[FAILED_LITERALS] += self.removed_candidates(trail_length)
+                if not consistent:
+                    return False
+            if not self.dirty:
+                break
+        return True
+
+    def _probe_failed_literals(self, rules, budget):
+        """
+        Tentatively sets each candidate of the cells with at most PROBE_ARITY candidates (fewest first) and propagates
+        rules. Candidates that lead to a contradiction are removed for good, everything else is rolled back on the
+        trail (a temporary one if self.trail is None). Stops after the first removal, so that the cheaper rules run on
+        it before probing goes on.
+        :param rules: collection of rule names from ALL_RULES without FAILED_LITERALS.
+        :param budget: int. Maximal number of tentative assignments.
+        :return: (consistent, budget left)
+        """
+        candidates = self.candidates
+        values = self.values
+        cells = sorted((popcount(mask), cell) for cell, mask in enumerate(candidates)
+                       if not values[cell] and popcount(mask) <= PROBE_ARITY)
+        own_trail = self.trail is None
+        if own_trail:
+            self.trail = []
+        try:
+            for _, cell in cells:
+                for digit in digits_of(candidates[cell]):
+                    if budget <= 0:
+                        return True, budget
+                    budget -= 1
+                    trail_length = len(self.trail)
+                    dirty = self.dirty
+                    consistent = self.assign(cell, digit) and self.propagate(rules)
+                    self.undo(trail_length)
+                    self.dirty = dirty
+                    if not consistent:
+                        return self.eliminate(cell, digit), budget
+            return True, 0  # nothing left to probe until the state changes
+        finally:
+            if own_trail:
+                self.trail = None
+
+    def _apply_unit_rules(self, unit_mask, hidden_singles, dead_units):
+        """
+        For every unit in unit_mask:
+        If dead_units, checks that every digit has a place in the unit.
+        If hidden_singles, sets digits that have exactly one place in the unit.
+        :return: bool. False if a contradiction was found, else True.
+        """
+        full_mask = self.geometry.full_mask
+        units = self.geometry.units
+        candidates = self.candidates
+        values = self.values
+        while unit_mask:
+            lowest_bit = unit_mask & -unit_mask
+            unit_mask ^= lowest_bit
+            unit = units[lowest_bit.bit_length() - 1]
+            seen_once = 0
+            seen_twice = 0
+            for cell in unit:
+                mask = candidates[cell]
+                seen_twice |= seen_once & mask
+                seen_once |= mask
+            if dead_units and seen_once != full_mask:
+                return False
+            if not hidden_singles:
+                continue
+            single_place = seen_once & ~seen_twice
+            for cell in unit:
+                mask = candidates[cell] & single_place
+                if mask and not values[cell]:
+                    if mask & (mask - 1):
+                        return False  # two digits can only go to the same cell
+                    if not self.assign(cell, mask.bit_length()):
+                        return False
+        return True
+
+    def _apply_locked_candidates(self, unit_mask):
+        """
+        For every intersection of two units (a box and a line for standard sudokus, see Geometry.intersections) with
+        one of the units in unit_mask:
+        Pointing: if a digit of the first unit (the box) can only go to the intersection, removes it from the rest of
+            the second unit (the line).
+        Claiming: the same with the roles of the units swapped.
+        :return: bool. False if a contradiction was found, else True.
+        """
+        candidates = self.candidates
+        for (segment, rest_of_first, rest_of_second), unit_bits in zip(self.geometry.intersections,
+                                                                       self.geometry.intersection_unit_bits):
+            if not unit_bits & unit_mask:
+                continue
+            segment_mask = 0
+            for cell in segment:
+                segment_mask |= candidates[cell]
+            first_mask = 0
+            for cell in rest_of_first:
+                first_mask |= candidates[cell]
+            second_mask = 0
+            for cell in rest_of_second:
+                second_mask |= candidates[cell]
+            pointing = segment_mask & ~first_mask & second_mask
+            claiming = segment_mask & ~second_mask & first_mask
+            for mask, cells in ((pointing, rest_of_second), (claiming, rest_of_first)):
+                if mask:
+                    for cell in cells:
+                        if candidates[cell] & mask and not self.remove_candidates(cell, mask):
+                            return False
+        return True
+
+    def _apply_naked_subsets(self, unit_mask):
+        """
+        Naked pairs and triples in every unit of unit_mask: if k cells of a unit (k = 2, 3) together have only
+        k candidates, removes these candidates from the other cells of the unit.
+        :return: bool. False if a contradiction was found, else True.
+        """
+        units = self.geometry.units
+        candidates = self.candidates
+        values = self.values
+        while unit_mask:
+            lowest_bit = unit_mask & -unit_mask
+            unit_mask ^= lowest_bit
+            unit = units[lowest_bit.bit_length() - 1]
+            for subset_size in (2, 3):
+                small_cells = [cell for cell in unit
+                               if not values[cell] and popcount(candidates[cell]) <= subset_size]
+                for subset in itertools.combinations(small_cells, subset_size):
+                    subset_mask = 0
+                    for cell in subset:
+                        subset_mask |= candidates[cell]
+                    if popcount(subset_mask) != subset_size:
+                        continue
+                    for cell in unit:
+                        if cell not in subset and candidates[cell] & subset_mask:
+                            if not self.remove_candidates(cell, subset_mask):
+                                return False
+        return True
+
+    def _apply_all_different(self, unit_mask):
+        """
+        Generalized arc consistency of the all-different constraint of every unit in unit_mask: removes the candidates
+        that are not used by any matching of the free cells of the unit to its free digits (see all_different.py).
+        The matching of each unit is kept in self.matchings and repaired by the next call.
+        :return: bool. False if a contradiction was found, else True.
+        """
+        units = self.geometry.units
+        candidates = self.candidates
+        values = self.values
+        if self.matchings is None:
+            self.matchings = [[0] * len(unit) for unit in units]
+        while unit_mask:
+            lowest_bit = unit_mask & -unit_mask
+            unit_mask ^= lowest_bit
+            unit_index = lowest_bit.bit_length() - 1
+            unit = units[unit_index]
+            unit_matching = self.matchings[unit_index]
+            positions = [position for position, cell in enumerate(unit) if not values[cell]]
+            if len(positions) < 2:
+                continue
+            masks = [candidates[unit[position]] for position in positions]
+            matching = [unit_matching[position] for position in positions]
+            supported = all_different.filter_unit(masks, matching)
+            if supported is None:
+                return False
+            for position, bit in zip(positions, matching):
+                unit_matching[position] = bit
+            for position, mask, supported_mask in zip(positions, masks, supported):
+                if mask != supported_mask and not self.remove_candidates(unit[position], mask & ~supported_mask):
+                    return False
+        return True
+
+    def select_cell(self, cells=None, branching=MRV, unit_weights=None) -> int:
+        """
+        :param cells: None or sequence of cells to choose from, all cells if None.
+        :param branching: MRV, MRV_DEGREE or DOM_WDEG, see BRANCHING_HEURISTICS.
+        :param unit_weights: list of int weights of geometry.units, needed by DOM_WDEG.
+        :return: int. The empty cell chosen by the heuristic, -1 if there is none. Assumes that all singles were
+            propagated. MRV picks the first empty cell with the minimal number of candidates (same choice as np.argmin
+            in Sudoku.solve).
+        """
+        candidates = self.candidates
+        values = self.values
+        best_cell = -1
+        best_count = self.geometry.size + 1
+        cells = range(self.geometry.number_of_cells) if cells is None else cells
+        if branching == MRV:
+            for cell in cells:
+                if not values[cell]:
+                    count = popcount(candidates[cell])
+                    if count < best_count:
+                        best_cell = cell
+                        best_count = count
+                        if count == 2:
+                            break
+        elif branching == MRV_DEGREE:
+            # The number of empty cells in the units of a cell is size times the number of its units minus the filled
+            # cells in them, so the cell with the most empty peers is the one with the fewest filled cells in its
+            # units. In rows, columns and boxes these are the used digits; the extra units of variants (listed after
+            # them in cell_units) are counted cell by cell.
+            board_geometry = self.geometry
+            row_of, column_of, box_of = board_geometry.row_of, board_geometry.column_of, board_geometry.box_of
+            units, cell_units = board_geometry.units, board_geometry.cell_units
+            has_extra_units = bool(board_geometry.extra_units)
+            row_used, column_used, box_used = self.row_used, self.column_used, self.box_used
+            best_used = len(units) * board_geometry.size
+            for cell in cells:
+                if not values[cell]:
+                    count = popcount(candidates[cell])
+                    if count <= best_count:
+                        used = popcount(row_used[row_of[cell]]) + popcount(column_used[column_of[cell]]) + \
+                            popcount(box_used[box_of[cell]])
+                        if has_extra_units:
+                            for unit in cell_units[cell][3:]:
+                                used += sum(1 for other in units[unit] if values[other])
+                        if count < best_count or used < best_used:
+                            best_cell = cell
+                            best_count = count
+                            best_used = used
+        elif branching == DOM_WDEG:
+            cell_units = self.geometry.cell_units
+            best_weight = 1
+            for cell in cells:
+                if not values[cell]:
+                    count = popcount(candidates[cell])
+                    weight = 0
+                    for unit in cell_units[cell]:
+                        weight += unit_weights[unit]
+                    if count * best_weight < best_count * weight:  # count / weight < best_count / best_weight
+                        best_cell = cell
+                        best_count = count
+                        best_weight = weight
+        else:
+            raise ValueError("Unknown branching heuristic " + str(branching))
+        return best_cell
+
+
+def choose_digit(state, cell, mask, value_order, rng) -> int:
+    """
+    :param state: BitmaskState.
+    :param cell: int. The cell to guess in.
+    :param mask: int bitmask of the digits that may be guessed in cell.
+    :param value_order: one of VALUE_ORDERINGS.
+    :param rng: random.Random, breaks ties.
+    :return: int. The digit to guess.
+    """
+    digits = digits_of(mask)
+    if value_order == LCV and len(digits) > 1:
+        candidates = state.candidates
+        peers = state.geometry.peers[cell]
+        counts = [sum(1 for peer in peers if candidates[peer] & (1 << (digit - 1))) for digit in digits]
+        least = min(counts)
+        digits = [digit for digit, count in zip(digits, counts) if count == least]
+    return rng.choice(digits)
+
+
+class Search:
+    """
+    Depth-first search of the bitmask engine that can be paused and resumed. Guesses are binary: either the chosen
+    digit is set in the chosen cell, or (on backtracking) it is removed from the cell's candidates.
+    The current node is identified by its path: the sequence of decisions from the root of the whole search tree,
+    0 for a guess that was taken and 1 for a guess that was excluded. Paths of nodes compare in depth-first order.
+    """
+
+    def __init__(self, board, N, candidates=None, rules=None, search='trail', random_state=None, path=(),
+                 known_solution=None, divergence_cells=None, stats=None, limits=None, probe_budget=PROBE_BUDGET,
+                 probe_depth=PROBE_DEPTH, branching=None, value_order=None):
+        """
+        :param board: flat sequence of N**4 ints, 0 for empty cells.
+        :param N: int. Side of the small square, or a sudoku_geometry.Geometry.
+        :param candidates: None or flat sequence of N**4 int bitmasks restricting the candidates of each cell.
+        :param rules: None or collection of rule names from ALL_RULES applied (on top of naked singles) before every
+            guess. Empty collection applies naked singles only, like Sudoku.simplify. None picks the default for the
+            board size, see default_rules.
+        :param search: 'trail' or 'copy'. 'trail' undoes changes on backtracking, 'copy' keeps a copy of the state
+            for every pending guess. Both visit the same nodes in the same order.
+        :param random_state: None or int for deterministic behaviour.
+        :param path: tuple of decisions leading to board, if it is a subproblem of a bigger search (see split()).
+        :param known_solution: None or flat sequence of N**4 values of a solution of board. Its values are never
+            guessed, they are only reached by excluding all the others, so the known solution is the last one found.
+        :param divergence_cells: None or sequence of cells, used with known_solution. Promises that every solution
+            agreeing with known_solution on these cells is known_solution itself (e.g. board is a puzzle with unique
+            solution known_solution with the clues at these cells removed). Only solutions different from
+            known_solution are searched for: these cells are guessed first, and branches where all of them got their
+            known values are cut.
+        :param stats: None or SolverStats to record the search in.
+        :param limits: None or SearchLimits, checked before every guess. next_solution raises SearchBudgetExceeded
+            when a limit is hit; the search is left intact and can be continued with other limits.
+        :param probe_budget: int. Tentative assignments per node if FAILED_LITERALS is in rules, see
+            BitmaskState.propagate.
+        :param probe_depth: int. Failed literals are only probed at nodes with at most probe_depth pending guesses.
+        :param branching: None or one of BRANCHING_HEURISTICS, the choice of the cell to guess in. None picks the
+            default for the board size, see DEFAULT_HEURISTICS.
+        :param value_order: None or one of VALUE_ORDERINGS, the choice of the digit to guess. None picks the default
+            for the board size. With known_solution, the known digit is still never guessed.
+        """
+        if rules is None:
+            rules = default_rules(N)
+        unknown_rules = set(rules) - set(ALL_RULES)
+        if unknown_rules:
+            raise ValueError("Unknown propagation rules " + str(sorted(unknown_rules)))
+        if search not in ('trail', 'copy'):
+            raise ValueError("Unknown search mode " + str(search))
+        default_branching, default_value_order = default_heuristics(N)
+        self.branching = default_branching if branching is None else branching
+        self.value_order = default_value_order if value_order is None else value_order
+        if self.branching not in BRANCHING_HEURISTICS:
+            raise ValueError("Unknown branching heuristic " + str(self.branching))
+        if self.value_order not in VALUE_ORDERINGS:
+            raise ValueError("Unknown value ordering " + str(self.value_order))
+        # Weights of geometry.units for DOM_WDEG: a guess that leads to a contradiction adds 1 to the units of its cell.
+        self.unit_weights = [1] * len(geometry(N).units) if self.branching == DOM_WDEG else None
+        self.rules = tuple(rules)
+        self.probe_budget = probe_budget
+        self.probe_depth = probe_depth
+        self.use_trail = search == 'trail'
+        self.rng = random.Random(random_state)
+        self.known_values = None if known_solution is None else [int(value) for value in known_solution]
+        self.known_bits = None if known_solution is None else [1 << (value - 1) for value in self.known_values]
+        if divergence_cells is not None and known_solution is None:
+            raise ValueError("divergence_cells requires known_solution")
+        self.divergence_cells = None if divergence_cells is None else sorted(int(cell) for cell in divergence_cells)
+        self.stats = stats
+        self.limits = limits
+        start_time = time.perf_counter()
+        self.state = BitmaskState.from_board(board, N, candidates)
+        if self.state is not None and (self.use_trail or stats is not None):
+            self.state.trail = []  # with stats, eliminations are counted on the trail even if it is not undone
+        self.stack = []  # pending guesses: (state or (trail length, dirty units), cell, digit, path length)
+        self.consistent = self.state is not None and self._propagate(self.state, None, None, None)
+        if stats is not None:
+            stats.total_time += time.perf_counter() - start_time
+        self.path = list(path)
+        self.inherited_guesses = list(path).count(0)
+        self.guesses = 0  # guesses used to find the last solution, same as number_of_guesses_tracker
+        self.nodes = 0  # number of guesses made so far
+        self.backtracks = 0  # number of guesses excluded again so far
+        self.finished = False
+
+    def next_solution(self, node_budget=None, backtrack_budget=None):
+        """
+        Continues the search until the next solution.
+        :param node_budget: None or int. Maximal number of guesses to make in this call.
+        :param backtrack_budget: None or int. Maximal number of backtracks to make in this call.
+        :return: flat list of N**4 values of the solution, or None if the whole tree was searched (self.finished is
+            then True) or a budget ran out (call again to continue).
+        """
+        if self.stats is None:
+            return self._next_solution(node_budget, backtrack_budget)
+        start = time.perf_counter()
+        try:
+            solution = self._next_solution(node_budget, backtrack_budget)
+        finally:
+            self.stats.total_time += time.perf_counter() - start
+        if solution is not None:
+            self.stats.guesses_per_solution.append(self.guesses)
+        return solution
+
+    def _propagate(self, state, operation, cell, digit) -> bool:
+        """
+        Applies operation(cell, digit) (state.assign or state.eliminate, or nothing if operation is None) and
+        propagates self.rules.
+        :return: bool. False if a contradiction was found.
+        """
+        stats = self.stats
+        probe_budget = self.probe_budget if len(self.stack) <= self.probe_depth else 0
+        if stats is None:
+            return (operation is None or operation(cell, digit)) and \
+                (not self.rules or state.propagate(self.rules, probe_budget=probe_budget))
+        start = time.perf_counter()
+        trail = state.trail
+        trail_length = len(trail)
+        consistent = operation is None or operation(cell, digit)
+        stats.eliminations[NAKED_SINGLES] += state.removed_candidates(trail_length)
+        consistent = consistent and (not self.rules or state.propagate(self.rules, stats, probe_budget))
+        if self.use_trail:
+            stats.max_trail_length = max(stats.max_trail_length, len(trail))
+        else:
+            trail.clear()
+        stats.propagation_time += time.perf_counter() - start
+        return consistent
+
+    def _next_solution(self, node_budget, backtrack_budget):
+        stats = self.stats
+        stack = self.stack
+        path = self.path
+        state = self.state
+        node_limit = None if node_budget is None else self.nodes + node_budget
+        backtrack_limit = None if backtrack_budget is None else self.backtracks + backtrack_budget
+        divergence_cells = self.divergence_cells
+        while True:
+            cell = -1
+            if self.consistent and divergence_cells is not None:
+                cell = state.select_cell(divergence_cells, self.branching, self.unit_weights)
+                if cell < 0 and all(state.values[divergence_cell] == self.known_values[divergence_cell]
+                                    for divergence_cell in divergence_cells):
+                    self.consistent = False  # every completion of this node is the known solution
+
+            if self.consistent and not state.empty:
+                self.guesses = self.inherited_guesses + len(stack)
+                self.consistent = False  # the next call backtracks from this solution
+                return state.values.copy()
+
+            if not self.consistent:
+                if not stack:
+                    self.finished = True
+                    return None
+                if backtrack_limit is not None and self.backtracks >= backtrack_limit:
+                    return None
+                self.backtracks += 1
+                saved, cell, digit, path_length = stack.pop()
+                if self.use_trail:
+                    state.undo(saved[0])
+                    state.dirty = saved[1]
+                else:
+                    state = self.state = saved
+                    if stats is not None:
+                        state.trail = []
+                del path[path_length:]
+                path.append(1)
+                if stats is not None:
+                    stats.backtracks += 1
+                self.consistent = self._propagate(state, state.eliminate, cell, digit)
+                if not self.consistent and self.unit_weights is not None:
+                    self._add_conflict(state, cell)
+                continue
+
+            if node_limit is not None and self.nodes >= node_limit:
+                return None
+            if self.limits is not None:
+                self.limits.check(self.nodes)
+            self.nodes += 1
+            if cell < 0:
+                cell = state.select_cell(None, self.branching, self.unit_weights)
+            mask = state.candidates[cell]
+            if self.known_bits is not None:
+                mask &= ~self.known_bits[cell]
+            digit = choose_digit(state, cell, mask, self.value_order, self.rng)
+            if self.use_trail:
+                stack.append(((len(state.trail), state.dirty), cell, digit, len(path)))
+            else:
+                stack.append((state, cell, digit, len(path)))
+                state = self.state = state.copy()
+            path.append(0)
+            if stats is not None:
+                stats.nodes += 1
+                stats.max_depth = max(stats.max_depth, self.inherited_guesses + len(stack))
+                if not self.use_trail:
+                    stats.copies += 1
+                    state.trail = []
+            self.consistent = self._propagate(state, state.assign, cell, digit)
+            if not self.consistent and self.unit_weights is not None:
+                self._add_conflict(state, cell)
+
+    def _add_conflict(self, state, cell):
+        """
+        Adds 1 to the weights of the units of cell, after a guess in cell led to a contradiction (DOM_WDEG).
+        """
+        unit_weights = self.unit_weights
+        for unit in state.geometry.cell_units[cell]:
+            unit_weights[unit] += 1
+
+    def split(self):
+        """
+        Hands over the unexplored part of the tree and finishes this search.
+        :return: [(path, values, candidates)] independent subproblems in depth-first order: the current node
+            followed by the pending excluded guesses, deepest first. Each can be searched by
+            Search(values, N, candidates, path=path).
+        """
+        subproblems = []
+        state = self.state
+        if self.consistent:
+            subproblems.append((tuple(self.path), state.values.copy(), state.candidates.copy()))
+        for saved, cell, digit, path_length in reversed(self.stack):
+            if self.use_trail:
+                state.undo(saved[0])
+                state.dirty = saved[1]
+                branch = state
+            else:
+                branch = saved
+            if branch.eliminate(cell, digit):
+                subproblems.append((tuple(self.path[:path_length]) + (1,), branch.values.copy(),
+                                    branch.candidates.copy()))
+        self.stack = []
+        self.consistent = False
+        self.finished = True
+        return subproblems
+
+
+def luby(i) -> int:
+    """
+    :param i: int >= 1.
+    :return: int. i-th term of the Luby sequence 1, 1, 2, 1, 1, 2, 4, 1, 1, 2, 1, 1, 2, 4, 8, ...
+    """
+    while True:
+        k = i.bit_length()
+        if i == (1 << k) - 1:
+            return 1 << (k - 1)
+        i -= (1 << (k - 1)) - 1
+
+
+def restart_caps(schedule, base=RESTART_BASE, max_restarts=MAX_RESTARTS) -> [int]:
+    """
+    :param schedule: 'luby' or 'geometric'.
+    :param base: int >= 1. Backtrack cap of the first attempt.
+    :param max_restarts: int >= 0. Number of capped attempts.
+    :return: [int] backtrack caps of the capped attempts, base * luby(i) or base * RESTART_GROWTH**i.
+    """
+    if schedule == 'luby':
+        return [base * luby(i) for i in range(1, max_restarts + 1)]
+    if schedule == 'geometric':
+        return [int(base * RESTART_GROWTH ** i) for i in range(max_restarts)]
+    raise ValueError("Unknown restart schedule " + str(schedule))
+
+
+def solve(board, N, maximal_number_of_solutions=1, random_state=None, number_of_guesses_tracker=None,
+          candidates=None, rules=None, search='trail', known_solution=None, divergence_cells=None,
+          stats=None, limits=None, probe_budget=PROBE_BUDGET, probe_depth=PROBE_DEPTH, restarts=None,
+          restart_base=RESTART_BASE, max_restarts=MAX_RESTARTS, branching=None, value_order=None):
+    """
+    Finds solutions of a sudoku with the same guessing strategy as Sudoku.solve: propagate singles, guess a candidate
+    in a cell with few candidates (a random candidate in the MRV cell for 9x9 boards, see DEFAULT_HEURISTICS), and on
+    backtracking remove the guessed value from that cell.
+    :param board: flat sequence of N**4 ints, 0 for empty cells.
+    :param N: int. Side of the small square, or a sudoku_geometry.Geometry.
+    :param maximal_number_of_solutions: int >= 1 or 'all'.
+    :param random_state: None or int for deterministic behaviour.
+    :param number_of_guesses_tracker: None or []. Same meaning as in Sudoku.solve.
+    :param candidates: None or flat sequence of N**4 int bitmasks restricting the candidates of each cell.
+    :param rules: see Search.
+    :param search: 'trail' or 'copy', see Search.
+    :param known_solution: None or flat sequence of N**4 values of a solution of board, found last (see Search).
+        Then the first solution found differs from known_solution unless the solution is unique.
+    :param divergence_cells: None or sequence of cells, see Search. Used by Sudoku.can_remove_positions.
+    :param stats: None or SolverStats to record the search in.
+    :param limits: None or SearchLimits. If a limit is hit, raises SearchBudgetExceeded with the solutions found so
+        far. node_limit counts the guesses of all attempts.
+    :param probe_budget: int. See Search.
+    :param probe_depth: int. See Search.
+    :param restarts: None, 'luby' or 'geometric'. If given, the search is restarted with a new seed drawn from
+        random_state whenever an attempt backtracks more often than its cap (see restart_caps), and the attempt after
+        max_restarts restarts is not capped, so the answer is still complete. The first attempt uses random_state
+        itself, so if it finishes within its cap the result is the same as without restarts. Solutions found by
+        earlier attempts are kept, later attempts only add new ones.
+    :param restart_base: int >= 1. Backtrack cap of the first attempt.
+    :param max_restarts: int >= 0. Number of capped attempts.
+    :param branching: None or one of BRANCHING_HEURISTICS, see Search.
+    :param value_order: None or one of VALUE_ORDERINGS, see Search.
+    :return: [[int]] list of solutions, each a flat list of N**4 values.
+    """
+    caps = [None] if restarts is None else restart_caps(restarts, restart_base, max_restarts) + [None]
+    rng = random.Random(random_state)
+    answers = []
+    found = set()
+    nodes_used = 0
+    for attempt, cap in enumerate(caps):
+        attempt_limits = limits
+        if limits is not None and limits.node_limit is not None and nodes_used:
+            attempt_limits = SearchLimits(limits.deadline, limits.node_limit - nodes_used, limits.cancel_token)
+        tree_search = Search(board, N, candidates=candidates, rules=rules, search=search,
+                             random_state=random_state if attempt == 0 else rng.getrandbits(64),
+                             known_solution=known_solution, divergence_cells=divergence_cells, stats=stats,
+                             limits=attempt_limits, probe_budget=probe_budget, probe_depth=probe_depth,
+                             branching=branching, value_order=value_order)
+        while maximal_number_of_solutions == 'all' or len(answers) < maximal_number_of_solutions:
+            try:
+                solution = tree_search.next_solution(
+                    backtrack_budget=None if cap is None else cap - tree_search.backtracks)
+            except SearchBudgetExceeded as error:
+                error.solutions = answers
+                raise
+            if solution is None:
+                break
+            if restarts is not None:
+                key = tuple(solution)
+                if key in found:
+                    if stats is not None:
+                        stats.guesses_per_solution.pop()  # solutions found again are only reported once
+                    continue
+                found.add(key)
+            answers.append(solution)
+            if number_of_guesses_tracker is not None:
+                number_of_guesses_tracker.append(tree_search.guesses)
+        nodes_used += tree_search.nodes
+        if tree_search.finished or len(answers) == maximal_number_of_solutions:
+            break
+        if stats is not None:
+            stats.restarts += 1
+    return answers
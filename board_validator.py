@@ -0,0 +1,76 @@
+# Validation of many sudoku grids of the same size at once.
+#
+# Boards are stacked into one (M, size, size) array and checked against every unit of their geometry (rows, columns,
+# boxes and the extra units of variants) together: the values of each unit are gathered with the unit table of
+# sudoku_geometry.py and counted with a single np.bincount over all boards and units. A unit is in conflict if some
+# digit appears in it more than once, and a cell is in conflict if its digit is repeated in one of its units; the
+# cells are only located for the boards that have a conflict, with one product against the unit membership table.
+#
+# Nothing is printed: callers get per-board validity and the conflicting cells and units as arrays, so bank scans,
+# the correctness check of the game and the self-checks of the generator can report or highlight them as they like.
+#
+# Depends only on sudoku_geometry.py.
+
+
+import math
+
+import numpy as np
+
+from sudoku_geometry import geometry
+
+
+def validate_boards(boards, N=None, complete=False):
+    """
+    Checks a stack of boards for repeated digits in their units.
+    :param boards: (M, N**2, N**2) int array-like, 0 for empty cells.
+    :param N: None, int or sudoku_geometry.Geometry. Side of the small square, computed from the shape of boards if
+        None. A Geometry gives boards with rectangular boxes or the extra units of variants.
+    :param complete: bool. If True, boards with empty cells are invalid as well, so valid boards are solved grids.
+    :return: (valid, conflicting_cells, conflicting_units)
+        valid: (M,) bool ndarray. True for the boards without conflicts (and without empty cells if complete).
+        conflicting_cells: (M, N**2, N**2) bool ndarray. True for the cells whose digit appears more than once in one
+            of their units.
+        conflicting_units: (M, number of units) bool ndarray. True for the units with a repeated digit. Units are
+            numbered as in sudoku_geometry.Geometry.units: rows, columns, boxes, then the extra units of variants.
+    """
+    boards = np.asarray(boards)
+    if boards.ndim != 3 or boards.shape[1] != boards.shape[2]:
+        raise ValueError("boards has to be an array of shape (M, N**2, N**2)")
+    size = boards.shape[1]
+    if N is None:
+        N = math.isqrt(size)
+        if N * N != size:
+            raise ValueError("Board side has to be a square, got " + str(size) +
+                             ". Pass a sudoku_geometry.Geometry as N for rectangular boxes")
+    board_geometry = geometry(N)
+    if board_geometry.size != size:
+        raise ValueError("Boards of side " + str(size) + " do not fit " + str(board_geometry))
+    if boards.min(initial=0) < 0 or boards.max(initial=0) > size:
+        raise ValueError("Board values have to be between 0 and N**2")
+
+    number_of_boards = len(boards)
+    number_of_units = len(board_geometry.units)
+    values = boards.reshape(number_of_boards, board_geometry.number_of_cells).astype(np.intp)
+
+    # counts[m, unit, d] is the number of cells of the unit holding d on board m; empty cells are counted as digit 0.
+    unit_values = values[:, np.array(board_geometry.units, dtype=np.intp)]
+    bins = (np.arange(number_of_boards * number_of_units, dtype=np.intp).reshape(
+        number_of_boards, number_of_units, 1) * (size + 1) + unit_values)
+    counts = np.bincount(bins.ravel(), minlength=number_of_boards * number_of_units * (size + 1)).reshape(
+        number_of_boards, number_of_units, size + 1)
+    repeated = counts > 1
+    repeated[:, :, 0] = False
+    conflicting_units = repeated.any(axis=2)
+    has_conflict = conflicting_units.any(axis=1)
+
+    conflicting_cells = np.zeros((number_of_boards, board_geometry.number_of_cells), dtype=bool)
+    bad = np.flatnonzero(has_conflict)
+    if len(bad):
+        # repeats[b, cell, d] is the number of units of cell in which d is repeated on board bad[b].
+        repeats = board_geometry.unit_membership.T @ repeated[bad].astype(np.int32)
+        conflicting_cells[bad] = np.take_along_axis(repeats, values[bad, :, None], axis=2)[:, :, 0] > 0
+
+    valid = ~has_conflict
+    if complete:
+        valid &= (values != 0).all(axis=1)
+    return valid, conflicting_cells.reshape(boards.shape), conflicting_units
@@ -0,0 +1,231 @@
+# Exact cover (Algorithm X with Dancing Links) engine for solving sudokus of any size, layout and variant.
+#
+# A sudoku is encoded as an exact cover problem with one row for every (cell, digit) pair and two kinds of constraint
+# columns: each cell has a digit, and each unit (row, column, box and the extra units of variants, see
+# sudoku_geometry.py) contains each digit exactly once.
+# Given cells (and the constraints they already satisfy) are removed while the matrix is built, so only the
+# undecided part of the board is ever linked. Choosing the column with the fewest rows applies naked and hidden singles
+# for free, and backtracking only relinks nodes instead of copying boards.
+#
+# Nodes are kept in parallel lists (left, right, up, down, column) rather than objects, which is considerably faster
+# in Python. Boards are flat lists of N**4 ints in row-major order, 0 for empty cells, same as in bitmask_solver.py.
+# Sudoku.solve(engine='dlx') wraps this module and keeps the output format of the original solver.
+#
+# Depends only on sudoku_geometry.py and search_limits.py.
+
+
+import random
+import time
+
+from search_limits import SearchBudgetExceeded
+from sudoku_geometry import geometry
+
+
+def solve(board, N, maximal_number_of_solutions=1, random_state=None, number_of_guesses_tracker=None,
+          candidates=None, known_solution=None, stats=None, limits=None):
+    """
+    Finds solutions of a sudoku with Dancing Links. Rows of the branching column are tried in random order.
+    :param board: flat sequence of N**4 ints, 0 for empty cells.
+    :param N: int. Side of the small square, or a sudoku_geometry.Geometry.
+    :param maximal_number_of_solutions: int >= 1 or 'all'.
+    :param random_state: None or int for deterministic behaviour.
+    :param number_of_guesses_tracker: None or []. Same meaning as in Sudoku.solve: for each solution, the number of
+        choices on its path that still had untried alternatives.
+    :param candidates: None or flat sequence of N**4 int bitmasks restricting the candidates of each cell.
+    :param known_solution: None or flat sequence of N**4 values of a solution of board. Its rows are tried last in
+        every column, so the known solution is the last one found, and the first solution found differs from it
+        unless the solution is unique.
+    :param stats: None or SolverStats. Records nodes (choices between several rows), backtracks, max_depth, total_time
+        and guesses_per_solution.
+    :param limits: None or SearchLimits, checked before every choice between several rows. If a limit is hit, raises
+        SearchBudgetExceeded with the solutions found so far.
+    :return: [[int]] list of solutions, each a flat list of N**4 values.
+    """
+    start_time = time.perf_counter()
+    board_geometry = geometry(N)
+    size = board_geometry.size
+    number_of_cells = board_geometry.number_of_cells
+    cell_units = board_geometry.cell_units
+    values = [int(value) for value in board]
+
+    unit_used = [0] * len(board_geometry.units)
+    for cell, value in enumerate(values):
+        if value:
+            bit = 1 << (value - 1)
+            for unit in cell_units[cell]:
+                if unit_used[unit] & bit:
+                    return []
+                unit_used[unit] |= bit
+            if candidates is not None and not int(candidates[cell]) & bit:
+                return []
+
+    # Node 0 is the root, followed by column headers and then by the nodes of the rows.
+    left, right, up, down, column = [0], [0], [0], [0], [0]
+    column_size = [0]
+    node_row = [-1]
+    header_of = {}
+
+    def add_header(key):
+        node = len(left)
+        header_of[key] = node
+        left.append(node - 1)
+        right[node - 1] = node
+        right.append(0)
+        up.append(node)
+        down.append(node)
+        column.append(node)
+        column_size.append(0)
+        node_row.append(-1)
+
+    for cell in range(number_of_cells):
+        if not values[cell]:
+            add_header(cell)
+    for unit, used in enumerate(unit_used):
+        for digit in range(size):
+            if not used >> digit & 1:
+                add_header((unit, digit))
+    left[0] = len(left) - 1
+
+    for cell in range(number_of_cells):
+        if values[cell]:
+            continue
+        units = cell_units[cell]
+        mask = board_geometry.full_mask
+        for unit in units:
+            mask &= ~unit_used[unit]
+        if candidates is not None:
+            mask &= int(candidates[cell])
+        while mask:
+            lowest_bit = mask & -mask
+            mask ^= lowest_bit
+            digit = lowest_bit.bit_length() - 1
+            first = len(left)
+            keys = [cell] + [(unit, digit) for unit in units]
+            for offset, key in enumerate(keys):
+                header = header_of[key]
+                node = first + offset
+                left.append(first + (offset - 1) % len(keys))
+                right.append(first + (offset + 1) % len(keys))
+                up.append(up[header])
+                down.append(header)
+                down[up[header]] = node
+                up[header] = node
+                column.append(header)
+                column_size[header] += 1
+                node_row.append(cell * size + digit)
+
+    def cover(header):
+        left[right[header]] = left[header]
+        right[left[header]] = right[header]
+        i = down[header]
+        while i != header:
+            j = right[i]
+            while j != i:
+                up[down[j]] = up[j]
+                down[up[j]] = down[j]
+                column_size[column[j]] -= 1
+                j = right[j]
+            i = down[i]
+
+    def uncover(header):
+        i = up[header]
+        while i != header:
+            j = left[i]
+            while j != i:
+                column_size[column[j]] += 1
+                up[down[j]] = j
+                down[up[j]] = j
+                j = left[j]
+            i = up[i]
+        left[right[header]] = header
+        right[left[header]] = header
+
+    def select(node):
+        j = right[node]
+        while j != node:
+            cover(column[j])
+            j = right[j]
+
+    def unselect(node):
+        j = left[node]
+        while j != node:
+            uncover(column[j])
+            j = left[j]
+
+    rng = random.Random(random_state)
+    known_rows = None
+    if known_solution is not None:
+        known_rows = {cell * size + int(value) - 1 for cell, value in enumerate(known_solution)}
+    answers = []
+    nodes = 0
+    frames = []  # [header, rows of the header in the order they are tried, index of the current row]
+
+    while True:
+        dead_end = False
+        header = right[0]
+        if header == 0:
+            solution = values.copy()
+            for frame in frames:
+                row = node_row[frame[1][frame[2]]]
+                solution[row // size] = row % size + 1
+            answers.append(solution)
+            guesses = sum(1 for frame in frames if frame[2] < len(frame[1]) - 1)
+            if number_of_guesses_tracker is not None:
+                number_of_guesses_tracker.append(guesses)
+            if stats is not None:
+                stats.guesses_per_solution.append(guesses)
+            if maximal_number_of_solutions != 'all' and len(answers) >= maximal_number_of_solutions:
+                break
+            dead_end = True
+        else:
+            best_header = header
+            best_size = column_size[header]
+            header = right[header]
+            while header and best_size > 1:
+                if column_size[header] < best_size:
+                    best_header = header
+                    best_size = column_size[header]
+                header = right[header]
+            if best_size == 0:
+                dead_end = True
+            else:
+                if best_size > 1:
+                    if limits is not None:
+                        reason = limits.exceeded(nodes)
+                        if reason is not None:
+                            raise SearchBudgetExceeded(reason, answers)
+                    nodes += 1
+                cover(best_header)
+                rows = []
+                node = down[best_header]
+                while node != best_header:
+                    rows.append(node)
+                    node = down[node]
+                if len(rows) > 1:
+                    rng.shuffle(rows)
+                    if known_rows is not None:
+                        rows.sort(key=lambda node: node_row[node] in known_rows)
+                frames.append([best_header, rows, 0])
+                select(rows[0])
+                if stats is not None and best_size > 1:
+                    stats.nodes += 1
+                    stats.max_depth = max(stats.max_depth, len(frames))
+
+        if dead_end:
+            while frames:
+                frame = frames[-1]
+                unselect(frame[1][frame[2]])
+                frame[2] += 1
+                if frame[2] < len(frame[1]):
+                    select(frame[1][frame[2]])
+                    if stats is not None:
+                        stats.backtracks += 1
+                    break
+                uncover(frame[0])
+                frames.pop()
+            else:
+                break
+
+    if stats is not None:
+        stats.total_time += time.perf_counter() - start_time
+    return answers
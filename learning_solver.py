@@ -0,0 +1,587 @@
+# Nogood learning with conflict-directed backjumping, built on the bitmask state of bitmask_solver.py.
+#
+# The bitmask engine forgets why a branch failed as soon as it backtracks, so hard boards keep rediscovering the same
+# conflicts in sibling subtrees (and in every attempt of a restarted search). This engine remembers them:
+#
+# - Every elimination carries an explanation: a bitmask over decision levels (bit i for the i-th pending guess) of
+#   the guesses it follows from. Naked singles, hidden singles and dead units combine the explanations of the
+#   eliminations they are based on, so a contradiction comes with the set of guesses that jointly cause it.
+# - The guesses of a contradiction form a nogood, a set of assignments that can never hold together. Since it only
+#   consists of guesses (the eliminations made on backtracking are left out), it stays short. The search jumps back
+#   to the second latest guess of the nogood, skipping all guesses in between, which played no part in the conflict,
+#   and removes the value of the latest guess there, like a unit clause of a SAT solver.
+# - Nogoods are kept in a bounded store and watched by two of their assignments, so a stored nogood costs nothing
+#   until all but one of its assignments hold, when the last one is removed. When the store is full, the half that
+#   took part in the fewest recent conflicts is evicted. The store is shared by restarted attempts (restarts='luby').
+#
+# Propagation is fixed to naked singles, hidden singles and dead units (bitmask_solver.DEFAULT_RULES), the rules that
+# come with cheap explanations. Branching and value ordering are the heuristics of the bitmask engine.
+#
+# Boards are flat lists of N**4 ints in row-major order, 0 for empty cells.
+# Sudoku.solve(engine='learning') wraps this module and keeps the output format of the original solver.
+#
+# Depends only on bitmask_solver.py, search_limits.py, solver_stats.py and sudoku_geometry.py.
+
+
+import random
+import time
+
+import bitmask_solver
+from bitmask_solver import BitmaskState, choose_digit, default_heuristics
+from search_limits import SearchBudgetExceeded, SearchLimits
+from sudoku_geometry import geometry
+
+# Nogoods with more than MAX_NOGOOD_SIZE assignments are used for the backjump but not stored. At most MAX_NOGOODS are
+# stored; the activity of a nogood grows by the current increment whenever it removes a candidate or causes a
+# contradiction, and the increment grows by ACTIVITY_GROWTH with every conflict, so recent use counts more.
+MAX_NOGOODS = 2000
+MAX_NOGOOD_SIZE = 12
+ACTIVITY_GROWTH = 1.05
+NOGOOD_ELIMINATIONS = 'nogoods'  # key of SolverStats.eliminations
+
+
+class Nogood:
+    """
+    Attributes:
+        literals: [int] assignments (cell * N**2 + digit - 1) that cannot all hold. The first two are watched.
+        activity: float. Used to choose the nogoods to evict.
+        permanent: bool. Never evicted (blocks a solution that was already found).
+    """
+    __slots__ = ('literals', 'activity', 'permanent')
+
+    def __init__(self, literals, activity, permanent):
+        self.literals = literals
+        self.activity = activity
+        self.permanent = permanent
+
+
+class NogoodStore:
+    """
+    Learned nogoods of one solve, kept across restarted attempts.
+    Attributes:
+        nogoods: dict from ids to Nogoods.
+        watches: dict from literals to lists of ids of the nogoods watching them. Ids of evicted nogoods are dropped
+            from the lists when they are next looked at.
+        units: set of literals removed at the root (nogoods of a single assignment).
+        max_nogoods: int. Maximal number of stored nogoods that are not permanent.
+        max_size: int. Maximal number of assignments of a stored nogood.
+        learned: int. Number of nogoods stored so far, including evicted ones.
+    """
+
+    def __init__(self, max_nogoods=MAX_NOGOODS, max_size=MAX_NOGOOD_SIZE):
+        self.nogoods = {}
+        self.watches = {}
+        self.units = set()
+        self.max_nogoods = max_nogoods
+        self.max_size = max_size
+        self.learned = 0
+        self.increment = 1.0
+        self.evictable = 0
+        self.next_id = 0
+
+    def learn(self, literals, permanent=False):
+        """
+        Stores a nogood unless it is too long. Its first two literals are watched: the caller has to make sure the
+        first one is not true and the second one is not true or was the last one to become true.
+        :param literals: [int] at least one literal.
+        :param permanent: bool. Store regardless of size and never evict.
+        :return: None
+        """
+        self.increment *= ACTIVITY_GROWTH
+        if len(literals) == 1:
+            self.units.add(literals[0])
+            return
+        if not permanent and (len(literals) > self.max_size or self.max_nogoods <= 0):
+            return
+        nogood_id = self.next_id
+        self.next_id += 1
+        self.nogoods[nogood_id] = Nogood(literals, self.increment, permanent)
+        self.watches.setdefault(literals[0], []).append(nogood_id)
+        self.watches.setdefault(literals[1], []).append(nogood_id)
+        self.learned += 1
+        if not permanent:
+            self.evictable += 1
+            if self.evictable > self.max_nogoods:
+                self._evict()
+        if self.increment > 1e100:
+            for nogood in self.nogoods.values():
+                nogood.activity *= 1e-100
+            self.increment *= 1e-100
+
+    def bump(self, nogood):
+        nogood.activity += self.increment
+
+    def _evict(self):
+        """
+        Removes the less active half of the nogoods that are not permanent.
+        """
+        evictable = sorted((nogood.activity, nogood_id) for nogood_id, nogood in self.nogoods.items()
+                           if not nogood.permanent)
+        for _, nogood_id in evictable[:len(evictable) // 2]:
+            del self.nogoods[nogood_id]
+        self.evictable -= len(evictable) // 2
+
+
+class LearningState(BitmaskState):
+    """
+    BitmaskState that records an explanation (bitmask of decision levels) for every elimination and assignment.
+    reasons[cell * N**2 + digit - 1] explains why digit is not a candidate of cell (only meaningful while it is not),
+    removed_reasons[cell] is the union of the explanations of all digits missing from an empty cell, and
+    value_reasons[cell] explains why cell has its value. After a method returned False, conflict explains the
+    contradiction. pending is a list of cells whose assignment was not yet checked against the nogoods.
+    Trail entries carry the previous removed_reasons of the cell as a third element.
+    """
+    __slots__ = ('reasons', 'removed_reasons', 'value_reasons', 'conflict', 'nogoods', 'pending',
+                 'nogood_eliminations')
+
+    @classmethod
+    def from_board(cls, board, N, candidates=None, nogoods=None):
+        """
+        :param nogoods: NogoodStore. Its units are removed and its nogoods are checked at the root.
+        :return: LearningState with all singles propagated (but not the rules), or None if the board is
+            contradictory.
+        """
+        root = BitmaskState.from_board(board, N, candidates)
+        if root is None:
+            return None
+        state = cls.__new__(cls)
+        for name in BitmaskState.__slots__:
+            setattr(state, name, getattr(root, name))
+        board_geometry = state.geometry
+        state.trail = []
+        state.reasons = [0] * (board_geometry.number_of_cells * board_geometry.size)
+        state.removed_reasons = [0] * board_geometry.number_of_cells
+        state.value_reasons = [0] * board_geometry.number_of_cells
+        state.conflict = 0
+        state.nogoods = NogoodStore() if nogoods is None else nogoods
+        state.pending = [cell for cell in range(board_geometry.number_of_cells) if state.values[cell]]
+        state.nogood_eliminations = 0
+        size = board_geometry.size
+        for literal in state.nogoods.units:
+            if not state.remove_candidates(literal // size, 1 << (literal % size), 0):
+                return None
+        return state
+
+    def undo(self, trail_length):
+        """
+        Same as BitmaskState.undo, also restores removed_reasons.
+        """
+        trail = self.trail
+        candidates = self.candidates
+        values = self.values
+        removed_reasons = self.removed_reasons
+        board_geometry = self.geometry
+        while len(trail) > trail_length:
+            key, old_mask, old_reason = trail.pop()
+            if key < 0:
+                cell = -1 - key
+                bit = 1 << (values[cell] - 1)
+                self.row_used[board_geometry.row_of[cell]] ^= bit
+                self.column_used[board_geometry.column_of[cell]] ^= bit
+                self.box_used[board_geometry.box_of[cell]] ^= bit
+                values[cell] = 0
+                self.empty += 1
+                candidates[cell] = old_mask
+            else:
+                candidates[key] = old_mask
+                removed_reasons[key] = old_reason
+        self.pending.clear()
+
+    def assign(self, cell, digit, reason=0) -> bool:
+        """
+        Sets cell to digit and removes digit from the candidates of all peers, propagating naked singles.
+        :param reason: int. Explanation of the assignment.
+        :return: bool. False if a contradiction was found (explained by self.conflict).
+        """
+        board_geometry = self.geometry
+        row_of, column_of, box_of, peers = (board_geometry.row_of, board_geometry.column_of, board_geometry.box_of,
+                                            board_geometry.peers)
+        unit_bits_of = board_geometry.unit_bits_of
+        size = board_geometry.size
+        candidates = self.candidates
+        values = self.values
+        reasons = self.reasons
+        removed_reasons = self.removed_reasons
+        value_reasons = self.value_reasons
+        trail = self.trail
+
+        queue = [(cell, digit, reason)]
+        while queue:
+            cell, digit, reason = queue.pop()
+            if values[cell]:
+                if values[cell] != digit:
+                    self.conflict = reason | value_reasons[cell]
+                    return False
+                continue
+            bit = 1 << (digit - 1)
+            if not candidates[cell] & bit:
+                self.conflict = reason | reasons[cell * size + digit - 1]
+                return False
+            row, column, box = row_of[cell], column_of[cell], box_of[cell]
+            if (self.row_used[row] | self.column_used[column] | self.box_used[box]) & bit:
+                self.conflict = reason | next(value_reasons[peer] for peer in peers[cell] if values[peer] == digit)
+                return False
+            trail.append((-1 - cell, candidates[cell], 0))
+            self.row_used[row] |= bit
+            self.column_used[column] |= bit
+            self.box_used[box] |= bit
+            values[cell] = digit
+            value_reasons[cell] = reason
+            candidates[cell] = bit
+            self.empty -= 1
+            self.dirty |= unit_bits_of[cell]
+            self.pending.append(cell)
+            index = digit - 1
+            for peer in peers[cell]:
+                mask = candidates[peer]
+                if mask & bit:
+                    mask ^= bit
+                    if not mask:
+                        self.conflict = reason | removed_reasons[peer]
+                        return False
+                    trail.append((peer, mask | bit, removed_reasons[peer]))
+                    reasons[peer * size + index] = reason
+                    removed_reasons[peer] |= reason
+                    candidates[peer] = mask
+                    self.dirty |= unit_bits_of[peer]
+                    if not mask & (mask - 1):
+                        queue.append((peer, mask.bit_length(), removed_reasons[peer]))
+        return True
+
+    def remove_candidates(self, cell, mask, reason=0) -> bool:
+        """
+        Removes the single digit of mask from the candidates of cell, setting the cell if one candidate remains.
+        :param reason: int. Explanation of the removal.
+        :return: bool. False if a contradiction was found (explained by self.conflict).
+        """
+        current = self.candidates[cell]
+        if not current & mask:
+            return True
+        if self.values[cell]:
+            self.conflict = reason | self.value_reasons[cell]
+            return False
+        if not current & ~mask:
+            self.conflict = reason | self.removed_reasons[cell]
+            return False
+        self.trail.append((cell, current, self.removed_reasons[cell]))
+        self.reasons[cell * self.geometry.size + mask.bit_length() - 1] = reason
+        self.removed_reasons[cell] |= reason
+        current &= ~mask
+        self.candidates[cell] = current
+        self.dirty |= self.geometry.unit_bits_of[cell]
+        if not current & (current - 1):
+            return self.assign(cell, current.bit_length(), self.removed_reasons[cell])
+        return True
+
+    def _missing_reason(self, unit, index, skipped_cell=-1) -> int:
+        """
+        :return: int. Explanation of why digit index + 1 is not possible in the cells of unit (except skipped_cell).
+        """
+        values = self.values
+        reasons = self.reasons
+        value_reasons = self.value_reasons
+        size = self.geometry.size
+        reason = 0
+        for cell in unit:
+            if cell != skipped_cell:
+                reason |= value_reasons[cell] if values[cell] else reasons[cell * size + index]
+        return reason
+
+    def propagate(self) -> bool:
+        """
+        Applies hidden singles, dead units and the stored nogoods until none of them changes the state.
+        :return: bool. False if a contradiction was found (explained by self.conflict).
+        """
+        units = self.geometry.units
+        full_mask = self.geometry.full_mask
+        candidates = self.candidates
+        values = self.values
+        while True:
+            if self.dirty:
+                unit_mask = self.dirty
+                self.dirty = 0
+                while unit_mask:
+                    lowest_bit = unit_mask & -unit_mask
+                    unit_mask ^= lowest_bit
+                    unit = units[lowest_bit.bit_length() - 1]
+                    seen_once = 0
+                    seen_twice = 0
+                    for cell in unit:
+                        mask = candidates[cell]
+                        seen_twice |= seen_once & mask
+                        seen_once |= mask
+                    if seen_once != full_mask:
+                        missing = full_mask & ~seen_once
+                        self.conflict = self._missing_reason(unit, (missing & -missing).bit_length() - 1)
+                        return False
+                    single_place = seen_once & ~seen_twice
+                    for cell in unit:
+                        mask = candidates[cell] & single_place
+                        if mask and not values[cell]:
+                            bit = mask & -mask
+                            reason = self._missing_reason(unit, bit.bit_length() - 1, cell)
+                            if not self.assign(cell, bit.bit_length(), reason):
+                                return False
+            elif self.pending:
+                if not self._propagate_nogoods(self.pending.pop()):
+                    return False
+            else:
+                return True
+
+    def _propagate_nogoods(self, cell) -> bool:
+        """
+        Looks at the nogoods watching the assignment of cell: moves the watch to another assignment that does not
+        hold, or removes the last assignment of a nogood whose other assignments all hold.
+        :return: bool. False if a contradiction was found (explained by self.conflict).
+        """
+        store = self.nogoods
+        size = self.geometry.size
+        literal = cell * size + self.values[cell] - 1
+        watch_list = store.watches.get(literal)
+        if not watch_list:
+            return True
+        candidates = self.candidates
+        values = self.values
+        value_reasons = self.value_reasons
+        nogoods = store.nogoods
+        kept = []
+        consistent = True
+        for position, nogood_id in enumerate(watch_list):
+            nogood = nogoods.get(nogood_id)
+            if nogood is None:
+                continue  # evicted
+            literals = nogood.literals
+            if literals[0] == literal:
+                literals[0], literals[1] = literals[1], literals[0]
+            other = literals[0]
+            other_cell = other // size
+            other_bit = 1 << (other % size)
+            if not candidates[other_cell] & other_bit:
+                kept.append(nogood_id)  # the other watched assignment cannot hold any more
+                continue
+            for k in range(2, len(literals)):
+                candidate_literal = literals[k]
+                if values[candidate_literal // size] != candidate_literal % size + 1:
+                    literals[1], literals[k] = candidate_literal, literal
+                    store.watches.setdefault(candidate_literal, []).append(nogood_id)
+                    break
+            else:
+                kept.append(nogood_id)
+                store.bump(nogood)
+                reason = 0
+                for held in literals[1:]:
+                    reason |= value_reasons[held // size]
+                if values[other_cell]:
+                    self.conflict = reason | value_reasons[other_cell]
+                    consistent = False
+                else:
+                    self.nogood_eliminations += 1
+                    consistent = self.remove_candidates(other_cell, other_bit, reason)
+                if not consistent:
+                    kept.extend(watch_list[position + 1:])
+                    break
+        store.watches[literal] = kept
+        return consistent
+
+
+class LearningSearch:
+    """
+    Depth-first search with nogood learning and backjumping that can be paused and resumed, see the module comment.
+    Decision level i is the i-th pending guess; a guess is only undone by jumping back below it, after which its value
+    is removed at the level the jump went to.
+    """
+
+    def __init__(self, board, N, candidates=None, random_state=None, branching=None, value_order=None, nogoods=None,
+                 stats=None, limits=None):
+        """
+        :param board: flat sequence of N**4 ints, 0 for empty cells.
+        :param N: int. Side of the small square, or a sudoku_geometry.Geometry.
+        :param candidates: None or flat sequence of N**4 int bitmasks restricting the candidates of each cell.
+        :param random_state: None or int for deterministic behaviour.
+        :param branching: None or one of bitmask_solver.BRANCHING_HEURISTICS, see bitmask_solver.Search.
+        :param value_order: None or one of bitmask_solver.VALUE_ORDERINGS, see bitmask_solver.Search.
+        :param nogoods: None or NogoodStore to learn into, e.g. one shared with an earlier attempt.
+        :param stats: None or SolverStats to record the search in.
+        :param limits: None or SearchLimits, checked before every guess.
+        """
+        default_branching, default_value_order = default_heuristics(N)
+        self.branching = default_branching if branching is None else branching
+        self.value_order = default_value_order if value_order is None else value_order
+        if self.branching not in bitmask_solver.BRANCHING_HEURISTICS:
+            raise ValueError("Unknown branching heuristic " + str(self.branching))
+        if self.value_order not in bitmask_solver.VALUE_ORDERINGS:
+            raise ValueError("Unknown value ordering " + str(self.value_order))
+        self.unit_weights = [1] * len(geometry(N).units) if self.branching == bitmask_solver.DOM_WDEG else None
+        self.rng = random.Random(random_state)
+        self.nogoods = NogoodStore() if nogoods is None else nogoods
+        self.stats = stats
+        self.limits = limits
+        start_time = time.perf_counter()
+        self.state = LearningState.from_board(board, N, candidates, self.nogoods)
+        self.consistent = self.state is not None and self.state.propagate()
+        if stats is not None:
+            stats.total_time += time.perf_counter() - start_time
+        self.decisions = []  # (trail length, dirty units, literal) of every decision level
+        self.found_solution = False  # the current conflict is the solution that was just returned
+        self.guesses = 0  # guesses used to find the last solution, same as number_of_guesses_tracker
+        self.nodes = 0  # number of guesses made so far
+        self.backtracks = 0  # number of conflicts resolved so far
+        self.finished = self.state is None
+
+    def next_solution(self, backtrack_budget=None):
+        """
+        Continues the search until the next solution.
+        :param backtrack_budget: None or int. Maximal number of conflicts to resolve in this call.
+        :return: flat list of N**4 values of the solution, or None if the whole tree was searched (self.finished is
+            then True) or the budget ran out (call again to continue).
+        """
+        if self.finished:
+            return None
+        if self.stats is None:
+            return self._next_solution(backtrack_budget)
+        start = time.perf_counter()
+        state = self.state
+        eliminations_before = state.nogood_eliminations
+        learned_before = self.nogoods.learned
+        try:
+            solution = self._next_solution(backtrack_budget)
+        finally:
+            self.stats.total_time += time.perf_counter() - start
+            self.stats.eliminations[NOGOOD_ELIMINATIONS] += state.nogood_eliminations - eliminations_before
+            self.stats.nogoods += self.nogoods.learned - learned_before
+        if solution is not None:
+            self.stats.guesses_per_solution.append(self.guesses)
+        return solution
+
+    def _next_solution(self, backtrack_budget):
+        stats = self.stats
+        state = self.state
+        decisions = self.decisions
+        size = state.geometry.size
+        backtrack_limit = None if backtrack_budget is None else self.backtracks + backtrack_budget
+        while True:
+            if self.consistent:
+                if not state.empty:
+                    self.guesses = len(decisions)
+                    # Continuing the search means backtracking from this solution, because of all guesses.
+                    state.conflict = (1 << (len(decisions) + 1)) - 2
+                    self.found_solution = True
+                    self.consistent = False
+                    return state.values.copy()
+                if self.limits is not None:
+                    self.limits.check(self.nodes)
+                self.nodes += 1
+                cell = state.select_cell(None, self.branching, self.unit_weights)
+                digit = choose_digit(state, cell, state.candidates[cell], self.value_order, self.rng)
+                decisions.append((len(state.trail), state.dirty, cell * size + digit - 1))
+                if stats is not None:
+                    stats.nodes += 1
+                    stats.max_depth = max(stats.max_depth, len(decisions))
+                self.consistent = state.assign(cell, digit, 1 << len(decisions)) and state.propagate()
+                continue
+
+            conflict = state.conflict
+            if not conflict:
+                self.finished = True  # contradiction at the root
+                return None
+            if backtrack_limit is not None and self.backtracks >= backtrack_limit:
+                return None
+            self.backtracks += 1
+            levels = []
+            remaining = conflict
+            while remaining:
+                level = remaining.bit_length() - 1
+                levels.append(level)
+                remaining ^= 1 << level
+            # The latest guess of the conflict is refuted at the level of the second latest one.
+            target = levels[1] if len(levels) > 1 else 0
+            literals = [decisions[level - 1][2] for level in levels]
+            self.nogoods.learn(literals, permanent=self.found_solution)
+            self.found_solution = False
+            if self.unit_weights is not None:
+                self._add_conflict(literals[0] // size)
+            if stats is not None:
+                stats.backtracks += 1
+                stats.backjumps += len(decisions) - 1 - target
+            trail_length, dirty, _ = decisions[target]
+            del decisions[target:]
+            state.undo(trail_length)
+            state.dirty = dirty
+            literal = literals[0]
+            self.consistent = state.remove_candidates(literal // size, 1 << (literal % size),
+                                                      conflict & ~(1 << levels[0])) and state.propagate()
+
+    def _add_conflict(self, cell):
+        """
+        Adds 1 to the weights of the units of cell, whose guess was the latest one of a conflict (DOM_WDEG).
+        """
+        unit_weights = self.unit_weights
+        for unit in self.state.geometry.cell_units[cell]:
+            unit_weights[unit] += 1
+
+
+def solve(board, N, maximal_number_of_solutions=1, random_state=None, number_of_guesses_tracker=None,
+          candidates=None, branching=None, value_order=None, max_nogoods=MAX_NOGOODS, max_nogood_size=MAX_NOGOOD_SIZE,
+          restarts=None, restart_base=bitmask_solver.RESTART_BASE, max_restarts=bitmask_solver.MAX_RESTARTS,
+          stats=None, limits=None):
+    """
+    Finds solutions of a sudoku with nogood learning and backjumping.
+    :param board: flat sequence of N**4 ints, 0 for empty cells.
+    :param N: int. Side of the small square, or a sudoku_geometry.Geometry.
+    :param maximal_number_of_solutions: int >= 1 or 'all'.
+    :param random_state: None or int for deterministic behaviour.
+    :param number_of_guesses_tracker: None or []. Same meaning as in Sudoku.solve.
+    :param candidates: None or flat sequence of N**4 int bitmasks restricting the candidates of each cell.
+    :param branching: None or one of bitmask_solver.BRANCHING_HEURISTICS, see bitmask_solver.Search.
+    :param value_order: None or one of bitmask_solver.VALUE_ORDERINGS, see bitmask_solver.Search.
+    :param max_nogoods: int >= 0. Maximal number of stored nogoods, 0 to only backjump.
+    :param max_nogood_size: int. Nogoods with more assignments are not stored.
+    :param restarts: None, 'luby' or 'geometric'. Same as in bitmask_solver.solve, except that later attempts keep
+        the nogoods learned by earlier ones (and never find their solutions again).
+    :param restart_base: int >= 1. Backtrack cap of the first attempt.
+    :param max_restarts: int >= 0. Number of capped attempts.
+    :param stats: None or SolverStats to record the search in.
+    :param limits: None or SearchLimits. If a limit is hit, raises SearchBudgetExceeded with the solutions found so
+        far. node_limit counts the guesses of all attempts.
+    :return: [[int]] list of solutions, each a flat list of N**4 values.
+    """
+    if maximal_number_of_solutions != 'all' and maximal_number_of_solutions < 1:
+        return []
+    caps = [None] if restarts is None else bitmask_solver.restart_caps(restarts, restart_base, max_restarts) + [None]
+    rng = random.Random(random_state)
+    nogoods = NogoodStore(max_nogoods, max_nogood_size)
+    answers = []
+    found = set()
+    nodes_used = 0
+    for attempt, cap in enumerate(caps):
+        attempt_limits = limits
+        if limits is not None and limits.node_limit is not None and nodes_used:
+            attempt_limits = SearchLimits(limits.deadline, limits.node_limit - nodes_used, limits.cancel_token)
+        tree_search = LearningSearch(board, N, candidates=candidates,
+                                     random_state=random_state if attempt == 0 else rng.getrandbits(64),
+                                     branching=branching, value_order=value_order, nogoods=nogoods, stats=stats,
+                                     limits=attempt_limits)
+        while maximal_number_of_solutions == 'all' or len(answers) < maximal_number_of_solutions:
+            try:
+                solution = tree_search.next_solution(
+                    backtrack_budget=None if cap is None else cap - tree_search.backtracks)
+            except SearchBudgetExceeded as error:
+                error.solutions = answers
+                raise
+            if solution is None:
+                break
+            key = tuple(solution)
+            if key in found:
+                if stats is not None:
+                    stats.guesses_per_solution.pop()  # solutions found again are only reported once
+                continue
+            found.add(key)
+            answers.append(solution)
+            if number_of_guesses_tracker is not None:
+                number_of_guesses_tracker.append(tree_search.guesses)
+        nodes_used += tree_search.nodes
+        if tree_search.finished or len(answers) == maximal_number_of_solutions:
+            break
+        if stats is not None:
+            stats.restarts += 1
+    return answers
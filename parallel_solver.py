@@ -0,0 +1,230 @@
+# Parallel tree-splitting search for large boards, built on the resumable search of bitmask_solver.py.
+#
+# The search tree is cut into independent subproblems that are solved in a pool of worker processes. Every task
+# searches its subproblem for at most node_budget guesses; if it runs out, it hands the unexplored rest of its subtree
+# back as new subproblems (Search.split), so outstanding subtrees keep getting split and idle workers pick the pieces
+# up. The first task explores the root with a small budget, which expands the top of the tree into the first batch of
+# subproblems.
+#
+# Subproblems are identified by their path in the binary guess tree, and paths compare in depth-first order. Solutions
+# are merged in that order, not in the order workers happen to finish, and each subproblem is searched with a seed
+# derived from random_state and its path. How the tree is cut depends only on the budgets, so the result for a given
+# random_state does not depend on the number of processes or on timing. Once enough solutions are known in front of
+# every open subproblem, or a limit is hit, the remaining tasks are cancelled: queued ones are dropped and running ones
+# see a stop event shared with the workers and return early.
+# If the root finishes within the first budget, the result is identical to bitmask_solver.solve with the same
+# random_state. Solution counts and unique solutions always agree with the serial engine.
+#
+# Boards are flat lists of N**4 ints in row-major order, 0 for empty cells.
+# Sudoku.solve(engine='parallel') wraps this module and keeps the output format of the original solver.
+#
+# Depends only on bitmask_solver.py, search_limits.py and solver_stats.py (and numpy, for seeding subproblems).
+
+
+import concurrent.futures
+import heapq
+import multiprocessing
+import os
+import random
+
+import numpy as np
+
+import bitmask_solver
+from search_limits import SearchBudgetExceeded, SearchLimits
+from solver_stats import SolverStats
+
+# Running tasks look at the stop event once every this many guesses; reading it is a round trip to a manager process.
+STOP_CHECK_INTERVAL = 64
+
+
+class _StopToken:
+    """
+    Cancellation token of the tasks of one solve, set by the main process through an event shared with the workers.
+    """
+
+    def __init__(self, event):
+        self.event = event
+        self.reads = 0
+
+    @property
+    def cancelled(self):
+        self.reads += 1
+        return self.reads % STOP_CHECK_INTERVAL == 0 and self.event.is_set()
+
+
+def _subproblem_seed(seed, path):
+    """
+    :return: int seed of the subproblem with the given path. The root keeps the seed of the whole search, other
+        subproblems get independent streams spawned from it, keyed by their path.
+    """
+    if not path:
+        return seed
+    return int(np.random.SeedSequence(seed, spawn_key=path).generate_state(2, dtype=np.uint32).view(np.uint64)[0])
+
+
+def _explore(N, path, values, candidates, seed, node_budget, maximal_number_of_solutions, rules, collect_stats,
+             stop_event):
+    """
+    Searches a subproblem for at most node_budget guesses, or until stop_event is set. Runs in a worker process.
+    :param stop_event: Event shared with the main process (a multiprocessing.Manager proxy). Once it is set the
+        result is not used any more, and the task returns what it has.
+    :return: (solutions, subproblems, nodes, stats)
+        solutions: [(path, values, number of guesses)] solutions found in the subproblem, in depth-first order, at
+            most maximal_number_of_solutions.
+        subproblems: [(path, values, candidates)] unexplored rest of the subproblem, empty if it was finished.
+        nodes: int. Number of guesses made.
+        stats: SolverStats of the task if collect_stats, else None.
+    """
+    stats = SolverStats() if collect_stats else None
+    tree_search = bitmask_solver.Search(values, N, candidates=candidates, rules=rules,
+                                        random_state=_subproblem_seed(seed, path), path=path, stats=stats,
+                                        limits=SearchLimits(cancel_token=_StopToken(stop_event)))
+    solutions = []
+    nodes_left = node_budget
+    while maximal_number_of_solutions == 'all' or len(solutions) < maximal_number_of_solutions:
+        nodes_before = tree_search.nodes
+        try:
+            solution = tree_search.next_solution(node_budget=nodes_left)
+        except SearchBudgetExceeded:
+            return solutions, [], tree_search.nodes, stats
+        nodes_left -= tree_search.nodes - nodes_before
+        if solution is not None:
+            solutions.append((tuple(tree_search.path), solution, tree_search.guesses))
+        elif tree_search.finished:
+            return solutions, [], tree_search.nodes, stats
+        else:
+            return solutions, tree_search.split(), tree_search.nodes, stats
+    return solutions, [], tree_search.nodes, stats
+
+
+def solve(board, N, maximal_number_of_solutions=1, random_state=None, number_of_guesses_tracker=None,
+          candidates=None, rules=None, processes=None, node_budget=2000, root_budget=20,
+          executor=None, stats=None, limits=None):
+    """
+    Finds solutions of a sudoku by searching independent parts of the tree in parallel.
+    :param board: flat sequence of N**4 ints, 0 for empty cells.
+    :param N: int. Side of the small square, or a sudoku_geometry.Geometry.
+    :param maximal_number_of_solutions: int >= 1 or 'all'.
+    :param random_state: None or int for deterministic behaviour.
+    :param number_of_guesses_tracker: None or []. Same meaning as in Sudoku.solve.
+    :param candidates: None or flat sequence of N**4 int bitmasks restricting the candidates of each cell.
+    :param rules: see bitmask_solver.Search.
+    :param processes: None or int. Number of worker processes, defaults to the number of CPUs. Ignored if executor
+        is given.
+    :param node_budget: int >= 1. Number of guesses a task may make before its subtree is split.
+    :param root_budget: int >= 1. Budget of the first task, which expands the top of the tree.
+    :param executor: None or concurrent.futures.Executor to submit the tasks to. If None, a process pool is created
+        for this call.
+    :param stats: None or SolverStats. Counters and times are summed over all tasks, guesses_per_solution follows
+        the returned solutions.
+    :param limits: None or SearchLimits. Checked whenever a task finishes, node_limit against the guesses of all
+        finished tasks, and once more at the end. Task budgets are fixed before the search (node_budget and root_budget,
+        at most node_limit), so how the tree is cut does not depend on the order in which tasks finish; the search can
+        go past node_limit by the budgets of the tasks running when it is hit, and is then stopped even if those tasks
+        finished it. If a limit is hit, raises SearchBudgetExceeded with the
+        solutions found so far.
+    :return: [[int]] list of solutions in depth-first order, each a flat list of N**4 values.
+    """
+    if maximal_number_of_solutions != 'all' and maximal_number_of_solutions < 1:
+        return []
+    if node_budget < 1 or root_budget < 1:
+        raise ValueError("Node budgets have to be positive")
+    if rules is None:
+        rules = bitmask_solver.default_rules(N)
+    unknown_rules = set(rules) - set(bitmask_solver.ALL_RULES)
+    if unknown_rules:
+        raise ValueError("Unknown propagation rules " + str(sorted(unknown_rules)))
+    rules = tuple(rules)
+    seed = random_state if random_state is not None else random.SystemRandom().randrange(2 ** 63)
+    if candidates is not None:
+        candidates = [int(mask) for mask in candidates]
+
+    try:
+        with multiprocessing.Manager() as manager:
+            stop_event = manager.Event()
+            if executor is None:
+                with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as pool:
+                    found = _solve_in_pool(pool, [int(value) for value in board], N, candidates,
+                                           maximal_number_of_solutions, seed, rules, node_budget, root_budget,
+                                           processes, stats, limits, stop_event)
+            else:
+                found = _solve_in_pool(executor, [int(value) for value in board], N, candidates,
+                                       maximal_number_of_solutions, seed, rules, node_budget, root_budget, processes,
+                                       stats, limits, stop_event)
+    except SearchBudgetExceeded as error:
+        error.solutions = [values for path, values, guesses in error.solutions]
+        raise
+
+    answers = []
+    for path, values, guesses in found:
+        answers.append(values)
+        if number_of_guesses_tracker is not None:
+            number_of_guesses_tracker.append(guesses)
+        if stats is not None:
+            stats.guesses_per_solution.append(guesses)
+    return answers
+
+
+def _solve_in_pool(pool, board, N, candidates, maximal_number_of_solutions, seed, rules, node_budget, root_budget,
+                   processes, stats, limits, stop_event):
+    """
+    Schedules subproblems on the pool in depth-first order and merges their solutions. When it returns or raises,
+    stop_event is set and no task is running any more.
+    :return: [(path, values, number of guesses)] the first maximal_number_of_solutions solutions in depth-first order.
+        Raises SearchBudgetExceeded with the solutions found so far in the same format if a limit is hit.
+    """
+    workers = processes or os.cpu_count() or 1
+    waiting = [((), board, candidates)]  # heap of subproblems not submitted yet, ordered by path
+    open_paths = {()}  # paths of subproblems that are waiting or running
+    running = {}
+    solutions = []
+    nodes = 0
+    # With limits, wake up regularly to look at the deadline and the cancellation token.
+    timeout = None if limits is None else 0.05
+    try:
+        while open_paths:
+            if limits is not None:
+                reason = limits.exceeded(nodes)
+                if reason is not None:
+                    solutions.sort(key=lambda solution: solution[0])
+                    raise SearchBudgetExceeded(reason, solutions)
+
+            if maximal_number_of_solutions != 'all':
+                first_open = min(open_paths)
+                if sum(1 for solution in solutions if solution[0] < first_open) >= maximal_number_of_solutions:
+                    break
+
+            while waiting and len(running) < 2 * workers:
+                path, values, subproblem_candidates = heapq.heappop(waiting)
+                budget = root_budget if not path else node_budget
+                if limits is not None and limits.node_limit is not None:
+                    budget = max(1, min(budget, limits.node_limit))
+                future = pool.submit(_explore, N, path, values, subproblem_candidates, seed, budget,
+                                     maximal_number_of_solutions, rules, stats is not None, stop_event)
+                running[future] = path
+
+            done, _ = concurrent.futures.wait(running, timeout=timeout,
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                open_paths.discard(running.pop(future))
+                found, subproblems, task_nodes, task_stats = future.result()
+                solutions.extend(found)
+                nodes += task_nodes
+                if stats is not None:
+                    task_stats.guesses_per_solution = []  # only the merged solutions are reported
+                    stats.merge(task_stats)
+                for subproblem in subproblems:
+                    open_paths.add(subproblem[0])
+                    heapq.heappush(waiting, subproblem)
+    finally:
+        stop_event.set()
+        for future in running:
+            future.cancel()
+        concurrent.futures.wait(running)
+
+    solutions.sort(key=lambda solution: solution[0])
+    if maximal_number_of_solutions != 'all':
+        del solutions[maximal_number_of_solutions:]
+    if limits is not None and limits.node_limit is not None and nodes > limits.node_limit:
+        raise SearchBudgetExceeded('node_limit', solutions)
+    return solutions
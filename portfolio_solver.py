@@ -0,0 +1,198 @@
+# Portfolio solving: several search configurations race on the same board in worker processes, the first answer wins.
+#
+# No single configuration is best on every puzzle: restarts, failed-literal probing, Dancing Links and different seeds
+# all win on different boards, and which one wins is hard to predict. For the interactive path (loading a puzzle into
+# the game) latency matters more than total CPU time, so the configurations are started at once and the result of the
+# first one to finish is returned. Configurations sharing one CPU only slow each other down, so at most one per CPU is
+# raced and the rest of the portfolio is dropped; on a single CPU this is the first configuration alone.
+#
+# The worker processes are kept in a module level pool and reused by later calls, so only the first call pays for
+# starting them. Losing configurations are stopped through a shared race counter: every worker searches with a
+# cancellation token that reports cancelled as soon as the counter moves past the race it belongs to, and the parent
+# moves it when the race is decided. Races are run one at a time.
+#
+# Boards are flat lists of N**4 ints in row-major order, 0 for empty cells.
+# Sudoku.solve(portfolio=...) wraps this module and keeps the output format of the original solver.
+#
+# Depends only on bitmask_solver.py, dlx_solver.py, learning_solver.py, search_limits.py and solver_stats.py.
+
+
+import concurrent.futures
+import multiprocessing
+import os
+import random
+import threading
+
+import numpy as np
+
+import bitmask_solver
+import dlx_solver
+import learning_solver
+from search_limits import SearchBudgetExceeded, SearchLimits
+from solver_stats import SolverStats
+
+ENGINES = {'bitmask': bitmask_solver.solve, 'dlx': dlx_solver.solve, 'learning': learning_solver.solve}
+
+# Each configuration is a dict with the engine name under 'engine' and keyword options of its solve function.
+# Ordered by how well they do alone on hard 16x16 puzzles. Bare naked-single backtracking (rules=()) is fast on 9x9
+# but hopeless on 16x16, so it is not included. dom/wdeg branching is not the default for 16x16 (it slows down the
+# uniqueness checks of the generator) but is the fastest way to a first solution of many hard puzzles.
+DEFAULT_PORTFOLIO = (
+    {'engine': 'bitmask', 'restarts': 'luby'},
+    {'engine': 'bitmask', 'branching': bitmask_solver.DOM_WDEG, 'value_order': bitmask_solver.LCV},
+    {'engine': 'bitmask', 'rules': bitmask_solver.DEFAULT_RULES + (bitmask_solver.FAILED_LITERALS,)},
+    {'engine': 'dlx'},
+)
+
+_pool = None
+_pool_size = 0
+_race_counter = None  # shared with the workers: number of the race that is allowed to run
+_race_lock = threading.Lock()
+
+
+def _init_worker(race_counter):
+    global _race_counter
+    _race_counter = race_counter
+
+
+class _RaceToken:
+    """
+    Cancellation token of a configuration in a worker process, see search_limits.CancellationToken.
+    """
+
+    def __init__(self, race):
+        self.race = race
+
+    @property
+    def cancelled(self):
+        return _race_counter.value != self.race
+
+
+def _get_pool(workers):
+    """
+    :return: concurrent.futures.ProcessPoolExecutor with at least the given number of workers, reused between calls.
+    """
+    global _pool, _pool_size, _race_counter
+    if _pool is None or _pool_size < workers:
+        shutdown()
+        _race_counter = multiprocessing.RawValue('q', 0)
+        _pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                       initargs=(_race_counter,))
+        _pool_size = workers
+    return _pool
+
+
+def shutdown():
+    """
+    Stops the worker processes. They are started again by the next call of solve.
+    :return: None
+    """
+    global _pool, _pool_size
+    if _pool is not None:
+        _race_counter.value += 1
+        _pool.shutdown(wait=False, cancel_futures=True)
+    _pool = None
+    _pool_size = 0
+
+
+def _configuration_seed(seed, index):
+    """
+    :return: int seed of the configuration with the given index. The first configuration keeps the seed of the call.
+    """
+    if index == 0:
+        return seed
+    return int(np.random.SeedSequence(seed, spawn_key=(index,)).generate_state(2, dtype=np.uint32).view(np.uint64)[0])
+
+
+def _run(race, engine, options, board, N, maximal_number_of_solutions, seed, candidates, deadline, node_limit,
+         collect_stats):
+    """
+    Solves the board with one configuration. Runs in a worker process.
+    :return: (solutions, number of guesses, stats, reason)
+        solutions: [[int]] or None if the search was stopped, reason is then the reason why.
+    """
+    stats = SolverStats() if collect_stats else None
+    guesses = []
+    try:
+        solutions = ENGINES[engine](board, N, maximal_number_of_solutions=maximal_number_of_solutions,
+                                    random_state=seed, number_of_guesses_tracker=guesses, candidates=candidates,
+                                    stats=stats, limits=SearchLimits(deadline, node_limit, _RaceToken(race)),
+                                    **options)
+    except SearchBudgetExceeded as error:
+        return None, guesses, stats, error.reason
+    return solutions, guesses, stats, None
+
+
+def solve(board, N, maximal_number_of_solutions=1, random_state=None, number_of_guesses_tracker=None,
+          candidates=None, portfolio=DEFAULT_PORTFOLIO, processes=None, stats=None, limits=None):
+    """
+    Solves a sudoku with all configurations of portfolio at once and returns the result of the first one to finish.
+    :param board: flat sequence of N**4 ints, 0 for empty cells.
+    :param N: int. Side of the small square, or a sudoku_geometry.Geometry.
+    :param maximal_number_of_solutions: int >= 1 or 'all'.
+    :param random_state: None or int. The first configuration is searched with random_state, the others with seeds
+        derived from it (unless they set their own random_state). Which configuration wins depends on timing, so
+        for puzzles with several solutions the result can differ between calls.
+    :param number_of_guesses_tracker: None or []. Same meaning as in Sudoku.solve, for the winning configuration.
+    :param candidates: None or flat sequence of N**4 int bitmasks restricting the candidates of each cell.
+    :param portfolio: sequence of configurations, dicts with the engine name ('bitmask', 'dlx' or 'learning') under
+        'engine' and keyword options of the solve function of its module.
+    :param processes: None or int. Maximal number of configurations raced at once, defaults to the number of CPUs.
+        Configurations past it are dropped.
+    :param stats: None or SolverStats, filled in with the counters of the winning configuration.
+    :param limits: None or SearchLimits. deadline and node_limit apply to every configuration separately. If all of
+        them are stopped, or cancel_token is cancelled, raises SearchBudgetExceeded.
+    :return: [[int]] list of solutions, each a flat list of N**4 values.
+    """
+    if maximal_number_of_solutions != 'all' and maximal_number_of_solutions < 1:
+        return []
+    configurations = []
+    for configuration in portfolio:
+        options = dict(configuration)
+        engine = options.pop('engine', 'bitmask')
+        if engine not in ENGINES:
+            raise ValueError("Unknown portfolio engine " + str(engine))
+        configurations.append((engine, options))
+    if not configurations:
+        raise ValueError("The portfolio is empty")
+    del configurations[max(1, processes or os.cpu_count() or 1):]
+    seed = random_state if random_state is not None else random.SystemRandom().randrange(2 ** 63)
+    board = [int(value) for value in board]
+    if candidates is not None:
+        candidates = [int(mask) for mask in candidates]
+    deadline = None if limits is None else limits.deadline
+    node_limit = None if limits is None else limits.node_limit
+    cancel_token = None if limits is None else limits.cancel_token
+
+    with _race_lock:
+        pool = _get_pool(len(configurations))
+        race = _race_counter.value
+        futures = []
+        for index, (engine, options) in enumerate(configurations):
+            configuration_seed = options.pop('random_state', _configuration_seed(seed, index))
+            futures.append(pool.submit(_run, race, engine, options, board, N, maximal_number_of_solutions,
+                                       configuration_seed, candidates, deadline, node_limit, stats is not None))
+        reasons = []
+        try:
+            pending = set(futures)
+            while pending:
+                if cancel_token is not None and cancel_token.cancelled:
+                    raise SearchBudgetExceeded('cancelled')
+                # With a cancellation token, wake up regularly to look at it.
+                done, pending = concurrent.futures.wait(pending, timeout=None if cancel_token is None else 0.05,
+                                                        return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    solutions, guesses, task_stats, reason = future.result()
+                    if solutions is None:
+                        reasons.append(reason)
+                        continue
+                    if number_of_guesses_tracker is not None:
+                        number_of_guesses_tracker.extend(guesses)
+                    if stats is not None:
+                        stats.merge(task_stats)
+                    return solutions
+            raise SearchBudgetExceeded(reasons[0])
+        finally:
+            _race_counter.value += 1
+            for future in futures:
+                future.cancel()
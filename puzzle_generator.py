@@ -6,6 +6,7 @@
 # Formats are:
 # strings (for recording in puzzle banks),
 # numpy entries (for keeping puzzle bank in the memory during run time)
+# Board (sudoku_board.py, for holding a specific grid during run time)
 # Sudoku (for working with a specific sudoku during run time)
 # TODO: designate formatting to Sudoku methods instead.
 # TODO: (quality of life) change numpy entries to custom class (say SudokuInfo) for more natural interface.
@@ -20,16 +21,16 @@
 # Run the main script for a simple GUI to generate new puzzles. The UI is unresponsive during generating time.
 
 
-import random
 import time
 import numpy as np
-import itertools
-import copy
 import os
 import tkinter as tk
 import pop_up_messages
 
-from sudoku import Sudoku
+from board_validator import validate_boards
+from sudoku import Sudoku, random_generator
+from sudoku_board import Board
+from search_limits import SearchBudgetExceeded
 
 
 def read_from_files(file_names, separator=','):
@@ -175,7 +176,8 @@ def to_string(sudoku: Sudoku, tried_before=False, done_before=False, separator="
     if solution_unique and solution_complexity_precomputed is not None:
         solution_complexity = [solution_complexity_precomputed]
     else:
-        solutions = sudoku.solve(number_of_guesses_tracker=solution_complexity)
+        # Complexity in the puzzle banks is the number of guesses with naked singles only, keep it comparable.
+        solutions = sudoku.solve(number_of_guesses_tracker=solution_complexity, rules=())
         if len(solutions) == 0:
             return ""
     N = sudoku.N
@@ -215,21 +217,39 @@ def sudoku_from_string(string, N, separator=","):
     """
     Reads a sudoku from a string, with no other information.
     :param string: str
-    :return: Sudoku
+    :return: Board. Sudoku(board, N) gives a Sudoku to solve.
     """
     if N <= 1:
         raise ValueError("N has to be at least 2")
     list = string.split(separator)
     if len(list) != (N**4):
         raise ValueError('String has to contain exactly (N**2)**2 elements')
-    table = np.zeros((N*N, N*N))
-    count = 0
-    for i in range(N*N):
-        for j in range(N*N):
-            table[i][j] = list[count]
-            count+=1
-    sudoku = Sudoku(table, N)
-    return sudoku
+    return Board(np.array(list, dtype=float), N)
+
+def boards_from_numpy_entries(sudokus_info, N, separator=","):
+    """
+    Stacks the boards of all entries of size N into one array, e.g. for batch_solver.solve_batch.
+    :param sudokus_info: numpy entries, as returned by read_from_files.
+    :param N: int
+    :return: (M, N**2, N**2) int16 ndarray, boards in the order of the entries with entry['N'] == N.
+    """
+    strings = sudokus_info['sudoku_string'][sudokus_info['N'] == N]
+    boards = np.zeros((len(strings), N * N, N * N), dtype='int16')
+    for board_number, string in enumerate(strings):
+        boards[board_number] = np.array(string.split(separator), dtype=float).reshape((N * N, N * N))
+    return boards
+
+def conflicting_entries(sudokus_info, N, separator=","):
+    """
+    Integrity scan of a puzzle bank: finds the entries of size N whose clues repeat a digit in a row, column or box.
+    :param sudokus_info: numpy entries, as returned by read_from_files.
+    :param N: int
+    :return: (indices, conflicting_cells)
+        indices: int ndarray. Indices into sudokus_info of the conflicting entries.
+        conflicting_cells: (len(indices), N**2, N**2) bool ndarray. The clues in conflict in each of these entries.
+    """
+    valid, conflicting_cells, _ = validate_boards(boards_from_numpy_entries(sudokus_info, N, separator), N)
+    return np.flatnonzero(sudokus_info['N'] == N)[~valid], conflicting_cells[~valid]
 
 def full_information_from_lines(line_1, line_2, separator=","):
     """
@@ -255,17 +275,18 @@ def generate_solved_sudoku(N=3, random_state = None):
     """
     Randomly generates a correct filled (N**2, N**2) puzzle.
     Specify a random_state for deterministic behaviour.
+    :param random_state: None, int or np.random.Generator. A generator is advanced, not reseeded.
     :return: Sudoku
     Current implementation always returns a Sudoku, if the generation is changed it might return None
     """
 
-    random.seed(a=random_state)
+    rng = random_generator(random_state)
 
     board = np.zeros((N*N, N*N), dtype='int16')  # initialize an empty board
-    board[0] = random.sample(range(1, N*N+1), k=N*N)  # fill the top row at random
+    board[0] = rng.permutation(np.arange(1, N*N+1))  # fill the top row at random
     sudoku = Sudoku(board, N=N)
 
-    solution = sudoku.solve(random_state=random_state)  # find a random solution. A solution is guaranteed to exist
+    solution = sudoku.solve(random_state=rng)  # find a random solution. A solution is guaranteed to exist
     return solution[0] if len(solution) > 0 else None
 
 
@@ -281,14 +302,14 @@ def generate_sudoku_from_a_full_puzzle(
     :param N: size of Sudoku, default is standard N=3
     :param proportion_of_missing_cells: float in the interval 0 to 1. Number of missing cells / number of all cells
         in the resulting sudoku.
-    :param random_state: None or int. Use int for deterministic behaviour.
+    :param random_state: None, int or np.random.Generator. Use int for deterministic behaviour.
     :param maximal_time: float, in seconds. Maximal time that the function is allowed to look for a required Sudoku.
     :return: (bool, Sudoku). First item is True if the required sudoku was found,
         second item is the found Sudoku, or a Sudoku with the minimal number of clues found in allotted time.
     """
 
     target_number_of_clues = int((N**4)*(1-proportion_of_missing_cells))
-    random.seed(random_state)
+    rng = random_generator(random_state)
 
     """def number_of_cells_to_remove(sudoku):
         current_number_of_clues = (sudoku != 0).sum()
@@ -301,10 +322,13 @@ def generate_sudoku_from_a_full_puzzle(
         else:
             return 1"""
 
+    # The grids are held as Boards; a Sudoku is only built for the uniqueness checks and for the result.
     if input_full_puzzle is None:
-        full_puzzle = generate_solved_sudoku(N=N, random_state=random_state)
+        full_puzzle = Board(generate_solved_sudoku(N=N, random_state=rng), N)
     else:
-        full_puzzle = copy.copy(input_full_puzzle)
+        full_puzzle = Board(input_full_puzzle, N)
+        if not validate_boards(full_puzzle.values[None], N, complete=True)[0][0]:
+            raise ValueError("input_full_puzzle has to be a solved sudoku")
 
     minimal_hints_sudoku = full_puzzle
     sudoku = full_puzzle
@@ -314,6 +338,15 @@ def generate_sudoku_from_a_full_puzzle(
     start_time = time.time()
     random_counter = 0
 
+    # For N > 3 maximal_time also bounds every single uniqueness check, which can otherwise take tens of seconds.
+    deadline = None if N == 3 else time.monotonic() + maximal_time
+
+    def can_remove_positions(sudoku, positions):
+        try:
+            return Sudoku(sudoku, N).can_remove_positions(positions, known_solution=full_puzzle, deadline=deadline)
+        except SearchBudgetExceeded:
+            return False  # out of time: keep the clues, so that the puzzle stays unique
+
     minimal_found = False  # Stopping only when a minimal puzzle was achieved for each cycle.
     #  Only present in N == 3 case, due to the difficulty of finding minimal puzzles for bigger N.
 
@@ -330,17 +363,14 @@ def generate_sudoku_from_a_full_puzzle(
             removed = False
             for i in range(5):
                 positions_of_removable_clues = np.argwhere(clues_are_removable == 1).tolist()
-                positions_to_remove = random.sample(positions_of_removable_clues, k=number_of_clues_to_remove)
-                if sudoku.can_remove_positions(positions_to_remove):
+                chosen = rng.choice(len(positions_of_removable_clues), size=number_of_clues_to_remove, replace=False)
+                positions_to_remove = [positions_of_removable_clues[index] for index in chosen]
+                if can_remove_positions(sudoku, positions_to_remove):
                     removed = True
-                    new_table = np.zeros((N**2, N**2))
-                    for i, j in itertools.product(range(N**2), range(N**2)):
-                        new_table[i][j] = sudoku[i][j]
                     for position in positions_to_remove:
                         i, j = position
-                        new_table[i][j] = 0
                         clues_are_removable[i][j] = 0
-                    sudoku = Sudoku(new_table, N=N)
+                    sudoku = sudoku.without(positions_to_remove)
                     break
 
         if number_of_clues_to_remove == 1:
@@ -348,17 +378,13 @@ def generate_sudoku_from_a_full_puzzle(
 
             while (clues_are_removable == 1).any():
                 positions_of_removable_clues = np.argwhere(clues_are_removable == 1).tolist()
-                position = random.choice(positions_of_removable_clues)
-                if sudoku.can_remove_positions([position]):
+                position = positions_of_removable_clues[rng.integers(len(positions_of_removable_clues))]
+                if can_remove_positions(sudoku, [position]):
                     removed = True
-                    new_table = np.zeros((N ** 2, N ** 2))
-                    for i, j in itertools.product(range(N ** 2), range(N ** 2)):
-                        new_table[i][j] = sudoku[i][j]
                     i, j = position
-                    new_table[i][j] = 0
                     clues_are_removable[i][j] = 0
 
-                    sudoku = Sudoku(new_table, N=N)
+                    sudoku = sudoku.without([position])
                     break
                 else:
                     i, j = position
@@ -376,6 +402,7 @@ def generate_sudoku_from_a_full_puzzle(
     if sudoku.number_of_clues() < minimal_hints_sudoku.number_of_clues():
         minimal_hints_sudoku = sudoku
 
+    minimal_hints_sudoku = Sudoku(minimal_hints_sudoku, N)
     solutions = minimal_hints_sudoku.solve(maximal_number_of_solutions=2)
     if len(solutions) != 1:
         print("Generated sudoku has "+str(len(solutions))+" solutions.")
@@ -383,7 +410,7 @@ def generate_sudoku_from_a_full_puzzle(
         print(minimal_hints_sudoku)
         print("Initial board is:")
         print(full_puzzle)
-        print("Random seed is "+str(random.getstate()))
+        print("Random generator state is "+str(rng.bit_generator.state))
 
     return minimal_hints_sudoku.number_of_clues() <= target_number_of_clues, minimal_hints_sudoku
 
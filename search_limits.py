@@ -0,0 +1,82 @@
+# Limits on the work a single solve may do: a deadline, a node budget and a cancellation token.
+#
+# Sudoku.solve(deadline=..., node_limit=..., cancel_token=...) builds a SearchLimits and hands it to the engine, which
+# calls check() once per guess. A search that hits a limit raises SearchBudgetExceeded instead of returning, so a cut
+# off search can never be mistaken for a complete answer (e.g. "no second solution, so the puzzle is unique").
+#
+# Does not (and should not) depend on any other project files.
+
+
+import time
+
+
+class CancellationToken:
+    """
+    Flag that can be set from elsewhere (a button callback, another thread) to stop searches that were given it.
+    """
+
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class SearchBudgetExceeded(Exception):
+    """
+    Raised by a search that was stopped by its SearchLimits before finishing.
+    Attributes:
+        reason: str. 'deadline', 'node_limit' or 'cancelled'.
+        solutions: list of solutions found before the search was stopped, in the output format of the function that
+            raised.
+    """
+
+    def __init__(self, reason, solutions=None):
+        super().__init__("Search stopped before finishing: " + reason)
+        self.reason = reason
+        self.solutions = [] if solutions is None else solutions
+
+
+class SearchLimits:
+    """
+    Attributes:
+        deadline: None or float. Value of time.monotonic() after which the search stops.
+        node_limit: None or int. Number of guesses after which the search stops.
+        cancel_token: None or CancellationToken.
+    """
+
+    def __init__(self, deadline=None, node_limit=None, cancel_token=None):
+        self.deadline = deadline
+        self.node_limit = node_limit
+        self.cancel_token = cancel_token
+
+    @classmethod
+    def from_options(cls, deadline=None, node_limit=None, cancel_token=None):
+        """
+        :return: SearchLimits, or None if no limit is set (engines then skip all checks).
+        """
+        if deadline is None and node_limit is None and cancel_token is None:
+            return None
+        return cls(deadline, node_limit, cancel_token)
+
+    def exceeded(self, nodes):
+        """
+        :param nodes: int. Number of guesses made so far.
+        :return: None, or the reason ('deadline', 'node_limit' or 'cancelled') why the search should stop.
+        """
+        if self.node_limit is not None and nodes >= self.node_limit:
+            return 'node_limit'
+        if self.cancel_token is not None and self.cancel_token.cancelled:
+            return 'cancelled'
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return 'deadline'
+        return None
+
+    def check(self, nodes):
+        """
+        :param nodes: int. Number of guesses made so far.
+        :return: None. Raises SearchBudgetExceeded if a limit was hit.
+        """
+        reason = self.exceeded(nodes)
+        if reason is not None:
+            raise SearchBudgetExceeded(reason)
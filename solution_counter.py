@@ -0,0 +1,218 @@
+# Exact solution counting for under-constrained boards.
+#
+# Enumerating solutions one by one (Sudoku.count_solutions with the bitmask engine) takes time proportional to their
+# number, which explodes on boards with many empty cells. This engine counts instead of enumerating:
+#
+# - The residual problem is a set of empty cells with candidate bitmasks, and two cells constrain each other only if
+#   they are peers and still share a candidate. Once the constraint graph falls apart into connected components, the
+#   components are counted separately and their counts multiplied.
+# - Counts of components are memoized. A component is keyed by a 64 bit hash of its (cell, candidates) pairs, and the
+#   memo is an LRU cache with a bounded number of entries, so identical residual subproblems reached along different
+#   branches (and in later calls of the same counter) are counted once.
+# - Naked singles, hidden singles and digits missing from a unit are propagated before every branching, as in the
+#   bitmask engine, but per component: a hidden single is only applied where the cells of the unit inside the component
+#   have exactly as many candidates as cells left.
+#
+# If a SearchLimits is hit, counting stops and the count so far is returned as a lower bound. Only counts of fully
+# counted components are cached.
+#
+# Boards are flat lists of N**4 ints in row-major order, 0 for empty cells.
+# Sudoku.count_solutions(engine='counting') wraps this module.
+#
+# Depends only on bitmask_solver.py and sudoku_geometry.py.
+
+
+import collections
+
+from bitmask_solver import BitmaskState, popcount
+from sudoku_geometry import geometry
+
+DEFAULT_CACHE_SIZE = 100000  # entries of about 150 bytes each
+
+
+class SolutionCounter:
+    """
+    Counter of solutions for boards of one size. Keeps its memo between calls of count().
+    Attributes:
+        N: int. Side of the small square.
+        cache: collections.OrderedDict from component hashes to counts, least recently used first.
+        cache_size: int. Maximal number of entries of cache.
+        cache_hits: int. Number of components whose count was taken from cache.
+        nodes: int. Number of branchings made.
+        limits: None or SearchLimits, checked before every branching against nodes.
+        stopped_reason: None, or the reason ('deadline', 'node_limit' or 'cancelled') why the last count() stopped.
+    """
+
+    def __init__(self, N, cache_size=DEFAULT_CACHE_SIZE, limits=None):
+        """
+        :param N: int. Side of the small square, or a sudoku_geometry.Geometry.
+        :param cache_size: int >= 0. Maximal number of memoized component counts.
+        :param limits: None or SearchLimits.
+        """
+        board_geometry = geometry(N)
+        self.N = N
+        self.peers = board_geometry.peers
+        self.units = board_geometry.units
+        self.units_of = board_geometry.cell_units
+        self.cache = collections.OrderedDict()
+        self.cache_size = cache_size
+        self.cache_hits = 0
+        self.nodes = 0
+        self.limits = limits
+        self.stopped_reason = None
+
+    def count(self, board, candidates=None) -> (int, bool):
+        """
+        :param board: flat sequence of N**4 ints, 0 for empty cells.
+        :param candidates: None or flat sequence of N**4 int bitmasks restricting the candidates of each cell.
+        :return: (count, exact)
+            count: int. Number of solutions of board, or a lower bound of it if a limit was hit.
+            exact: bool. False if a limit was hit, see self.stopped_reason.
+        """
+        self.stopped_reason = None
+        state = BitmaskState.from_board(board, self.N, candidates)
+        if state is None:
+            return 0, True
+        domains = {cell: mask for cell, mask in enumerate(state.candidates) if not state.values[cell]}
+        count = self._count(domains, list(domains))
+        return count, self.stopped_reason is None
+
+    def _count(self, domains, changed) -> int:
+        """
+        :param domains: dict from empty cells to their candidate bitmasks. Modified in place.
+        :param changed: list of cells whose candidates changed since domains were last propagated.
+        :return: int. Number of ways to fill the cells (a lower bound if counting was stopped).
+        """
+        if not self._propagate(domains, changed):
+            return 0
+        total = 1
+        for component in self._components(domains):
+            total *= self._count_component(component)
+            if not total:
+                break
+        return total
+
+    def _count_component(self, domains) -> int:
+        """
+        :param domains: dict from cells to candidate bitmasks of one connected component, all singles propagated.
+        :return: int. Number of ways to fill the cells of the component.
+        """
+        cache = self.cache
+        key = hash(tuple(sorted(domains.items())))
+        if key in cache:
+            cache.move_to_end(key)
+            self.cache_hits += 1
+            return cache[key]
+
+        cell = min(domains, key=lambda candidate_cell: popcount(domains[candidate_cell]))
+        mask = domains[cell]
+        total = 0
+        while mask:
+            if self.limits is not None:
+                self.stopped_reason = self.limits.exceeded(self.nodes)
+            if self.stopped_reason is not None:
+                return total
+            self.nodes += 1
+            bit = mask & -mask
+            mask ^= bit
+            branch = dict(domains)
+            branch[cell] = bit
+            total += self._count(branch, [cell])
+
+        if self.stopped_reason is None and self.cache_size > 0:
+            cache[key] = total
+            if len(cache) > self.cache_size:
+                cache.popitem(last=False)
+        return total
+
+    def _propagate(self, domains, changed) -> bool:
+        """
+        Assigns naked and hidden singles (removing them from domains) until a fixpoint.
+        :param domains: dict from empty cells to their candidate bitmasks. Modified in place.
+        :param changed: list of cells whose candidates changed, whose units are examined.
+        :return: bool. False if a contradiction was found.
+        """
+        peers = self.peers
+        units = self.units
+        units_of = self.units_of
+        while changed:
+            dirty_units = set()
+            singles = [cell for cell in changed if cell in domains and not domains[cell] & (domains[cell] - 1)]
+            for cell in changed:
+                dirty_units.update(units_of[cell])
+            while singles:
+                cell = singles.pop()
+                bit = domains.pop(cell, 0)
+                if not bit:
+                    continue
+                for peer in peers[cell]:
+                    mask = domains.get(peer)
+                    if mask is not None and mask & bit:
+                        mask ^= bit
+                        if not mask:
+                            return False
+                        domains[peer] = mask
+                        dirty_units.update(units_of[peer])
+                        if not mask & (mask - 1):
+                            singles.append(peer)
+
+            changed = []
+            for unit in dirty_units:
+                cells = [cell for cell in units[unit] if cell in domains]
+                seen = 0
+                seen_twice = 0
+                for cell in cells:
+                    mask = domains[cell]
+                    seen_twice |= seen & mask
+                    seen |= mask
+                number_of_digits = popcount(seen)
+                if number_of_digits < len(cells):
+                    return False  # too few digits left for the cells of the unit
+                if number_of_digits > len(cells):
+                    continue  # some of the digits belong to cells in other components
+                hidden = seen & ~seen_twice
+                for cell in cells:
+                    mask = domains[cell]
+                    if mask & hidden and mask & (mask - 1):
+                        bit = mask & hidden
+                        if bit & (bit - 1):
+                            return False  # two digits that have to go to the same cell
+                        domains[cell] = bit
+                        changed.append(cell)
+        return True
+
+    def _components(self, domains):
+        """
+        :param domains: dict from empty cells to their candidate bitmasks.
+        :return: [dict] the domains split into connected components of peers that share a candidate.
+        """
+        peers = self.peers
+        unvisited = set(domains)
+        components = []
+        while unvisited:
+            start = unvisited.pop()
+            component = {start: domains[start]}
+            frontier = [start]
+            while frontier:
+                cell = frontier.pop()
+                mask = domains[cell]
+                for peer in peers[cell]:
+                    if peer in unvisited and domains[peer] & mask:
+                        unvisited.discard(peer)
+                        component[peer] = domains[peer]
+                        frontier.append(peer)
+            components.append(component)
+        return components
+
+
+def count_solutions(board, N, candidates=None, cache_size=DEFAULT_CACHE_SIZE, limits=None) -> (int, bool):
+    """
+    Counts the solutions of a sudoku without enumerating them.
+    :param board: flat sequence of N**4 ints, 0 for empty cells.
+    :param N: int. Side of the small square, or a sudoku_geometry.Geometry.
+    :param candidates: None or flat sequence of N**4 int bitmasks restricting the candidates of each cell.
+    :param cache_size: int >= 0. Maximal number of memoized component counts.
+    :param limits: None or SearchLimits. If a limit is hit, counting stops and a lower bound is returned.
+    :return: (count, exact). count is the number of solutions, or a lower bound of it if exact is False.
+    """
+    return SolutionCounter(N, cache_size=cache_size, limits=limits).count(board, candidates)
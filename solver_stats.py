@@ -0,0 +1,86 @@
+# Statistics of a single solve, filled in by the solver engines.
+#
+# Pass a SolverStats instance to Sudoku.solve(stats=...) (or to the solve function of an engine module) and read it
+# after the call. Engines update it once per guess or per propagation pass, never per elimination, and skip all of it
+# when no stats object is given, so solving without statistics costs nothing extra.
+#
+# Does not (and should not) depend on any other project files.
+
+
+import collections
+
+
+class SolverStats:
+    """
+    Counters of a search. Engines fill in the counters that make sense for them, the rest stay 0.
+    Attributes:
+        nodes: int. Number of guesses made.
+        backtracks: int. Number of times the search went back to a pending guess.
+        max_depth: int. Maximal number of pending guesses at the same time.
+        eliminations: collections.Counter. Number of candidates removed from cells per propagation rule, including
+            the ones removed by the naked singles the rule caused and the candidates a cell loses when it is set.
+            'naked_singles' counts the candidates removed by guesses and the naked singles they caused. Removals made
+            by the givens are not counted.
+        copies: int. Number of board states copied.
+        max_trail_length: int. Maximal length of the undo trail of the bitmask engine.
+        propagation_time: float. Seconds spent applying guesses and propagating their consequences.
+        total_time: float. Seconds spent in the search. Summed over workers for engine='parallel'.
+        guesses_per_solution: [int]. Number of guesses used to find each solution, same as number_of_guesses_tracker.
+        restarts: int. Number of times a search was abandoned and started again with a new seed.
+        nogoods: int. Number of nogoods stored by engine='learning'.
+        backjumps: int. Number of guesses skipped by jumping back further than the latest one (engine='learning').
+    """
+
+    def __init__(self):
+        self.nodes = 0
+        self.backtracks = 0
+        self.max_depth = 0
+        self.eliminations = collections.Counter()
+        self.copies = 0
+        self.max_trail_length = 0
+        self.propagation_time = 0.0
+        self.total_time = 0.0
+        self.guesses_per_solution = []
+        self.restarts = 0
+        self.nogoods = 0
+        self.backjumps = 0
+
+    @property
+    def branching_time(self) -> float:
+        """
+        :return: float. Seconds spent in the search outside of propagation: choosing guesses and backtracking.
+        """
+        return self.total_time - self.propagation_time
+
+    def merge(self, other):
+        """
+        Adds the counters of other (e.g. stats of a subproblem) to self.
+        :param other: SolverStats
+        :return: None
+        """
+        self.nodes += other.nodes
+        self.backtracks += other.backtracks
+        self.max_depth = max(self.max_depth, other.max_depth)
+        self.eliminations.update(other.eliminations)
+        self.copies += other.copies
+        self.max_trail_length = max(self.max_trail_length, other.max_trail_length)
+        self.propagation_time += other.propagation_time
+        self.total_time += other.total_time
+        self.guesses_per_solution.extend(other.guesses_per_solution)
+        self.restarts += other.restarts
+        self.nogoods += other.nogoods
+        self.backjumps += other.backjumps
+
+    def as_dict(self) -> dict:
+        """
+        :return: dict of all counters, with branching_time and eliminations as a plain dict.
+        """
+        return {'nodes': self.nodes, 'backtracks': self.backtracks, 'max_depth': self.max_depth,
+                'eliminations': dict(self.eliminations), 'copies': self.copies,
+                'max_trail_length': self.max_trail_length, 'propagation_time': self.propagation_time,
+                'branching_time': self.branching_time, 'total_time': self.total_time,
+                'guesses_per_solution': list(self.guesses_per_solution), 'restarts': self.restarts,
+                'nogoods': self.nogoods, 'backjumps': self.backjumps}
+
+    def __repr__(self):
+        return "SolverStats(" + ", ".join(key + "=" + repr(value) for key, value in self.as_dict().items()) + ")"
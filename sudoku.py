@@ -8,9 +8,26 @@
 # Checking if a given puzzle has unique solution is time consuming even for standard 9x9 sudokus and might take quite
 # some time for 16x16 puzzles. Finding just one solution is usually significantly faster.
 #
+# Solving is delegated to one of several engines (see Sudoku.solve). The original ndarray based solver is kept as
+# engine='numpy'; the default engine='bitmask' (bitmask_solver.py) keeps the same output format but is much faster.
+# engine='dlx' (dlx_solver.py) solves the exact cover formulation with Dancing Links.
+# engine='parallel' (parallel_solver.py) splits the search tree of the bitmask engine across worker processes.
+# engine='learning' (learning_solver.py) learns nogoods from contradictions and backjumps over unrelated guesses.
+# engine='template' (template_solver.py) solves 9x9 boards by combining precomputed placements of each digit.
+# Sudoku.solve(portfolio=...) (portfolio_solver.py) races several engine configurations in worker processes and returns
+# the first answer, for the interactive path where latency matters more than CPU time.
+# Code that only needs to hold a grid uses the compact sudoku_board.Board instead of a Sudoku.
+# Sudoku.check() and Sudoku.conflicts() use board_validator.py, which checks whole stacks of grids at once.
+# Boards with rectangular boxes (6x6, 12x12) and variants (diagonal, windoku) are Sudokus whose N is a
+# sudoku_geometry.Geometry; all engines except 'template' work from its unit tables.
+# Sudoku.iter_solutions() yields solutions one at a time as plain arrays and Sudoku.count_solutions() counts them, both
+# in constant memory, for boards with too many solutions to keep as a list. count_solutions(engine='counting')
+# (solution_counter.py) counts without enumerating.
+#
 # Do not change the output formats since the UI relies heavily on this module.
 #
-# Does not (and should not) depend on any other project files.
+# Does not (and should not) depend on any other project files except the solver engine modules, which in turn do
+# not depend on the UI.
 #
 # TODO: (important) Rewrite this module in C++, as this module is the one that takes the most processing time/resources
 #  for sudoku generation and validation.
@@ -23,6 +40,45 @@ import copy
 import random
 import sys
 import itertools
+import time
+
+import bitmask_solver
+import board_validator
+import dlx_solver
+import learning_solver
+import parallel_solver
+import portfolio_solver
+import solution_counter
+import sudoku_geometry
+import template_solver
+from sudoku_board import Board
+from search_limits import SearchBudgetExceeded, SearchLimits
+
+# Engines that operate on flat boards: engine(board, N, maximal_number_of_solutions, random_state,
+# number_of_guesses_tracker, candidates) -> list of flat solutions.
+FLAT_ENGINES = {'bitmask': bitmask_solver.solve, 'dlx': dlx_solver.solve, 'parallel': parallel_solver.solve,
+                'portfolio': portfolio_solver.solve, 'learning': learning_solver.solve,
+                'template': template_solver.solve}
+
+
+def random_generator(random_state=None) -> np.random.Generator:
+    """
+    :param random_state: None, int or np.random.Generator.
+    :return: np.random.Generator. random_state itself if it is a generator, else a new generator seeded with it.
+    """
+    if isinstance(random_state, np.random.Generator):
+        return random_state
+    return np.random.default_rng(random_state)
+
+
+def engine_seed(random_state=None):
+    """
+    :param random_state: None, int or np.random.Generator.
+    :return: None or int seed for the engines, which keep their own random.Random. A generator is advanced by one draw.
+    """
+    if isinstance(random_state, np.random.Generator):
+        return int(random_state.integers(2 ** 63))
+    return random_state
 
 
 class Sudoku(np.ndarray):
@@ -30,25 +86,37 @@ class Sudoku(np.ndarray):
         """
         Class to operate with sudokus.
         Inherits from np.ndarray and supports all relevant operations.
-        :param array: (N**2,N**2) dimension array.
+        :param array: (N**2,N**2) dimension array, or a sudoku_board.Board.
             Elements between 1 and N**2 are for cells that are given.
             0 for elements that are not determined.
-            #TODO: (long term) Implement sudokus that have multiple possibilities for a clue
-        :param N: is the side of the small square.
-            #TODO: (long term) implement rectangular sudokus.
+        :param N: is the side of the small square, or a sudoku_geometry.Geometry for boards with rectangular boxes
+            (e.g. sudoku_geometry.layout(2, 3) for 6x6) or extra units (e.g. layout(3, 3, ('diagonal',))). Shapes
+            written as N**2 below are then the side of the board, geometry.size.
         :param computed:
         :param possibilities: None or (N**2, N**2, N**2+1) np.ndarray, dtype: bool
             if an array, [x, y, value] = True
                 if value is one of the possibilities for the cell with coordinates [x, y]
-            if None, all possibilities are allowed
+            if None, all possibilities are allowed (or those of the candidates of array if it is a Board)
             [x, y, 0] = False for all x, y.
+            Restricting the possibilities of a cell makes it a clue with several possibilities; the solver engines
+            get them as candidates.
+        Besides possibilities, a Sudoku keeps candidate_counts, the (N**4,) int16 ndarray of the number of
+        possibilities of each cell in row-major order. set_point and simplify update both; code that writes to
+        possibilities directly has to update candidate_counts as well.
         """
-        obj = np.asarray(array).copy().view(cls).astype('int16')
+        size = sudoku_geometry.geometry(N).size
+        obj = np.array(array, dtype='int16').view(cls)
+        if possibilities is None and isinstance(array, Board) and array.candidates is not None:
+            digits = np.arange(size + 1)
+            possibilities = ((array.candidate_masks()[:, None] << 1) >> digits & 1).astype(bool)
+            possibilities = possibilities.reshape(size, size, size + 1)
         if possibilities is not None:
             obj.possibilities = possibilities.copy()
+            obj.candidate_counts = possibilities.sum(axis=2, dtype=np.int16).reshape(size * size)
         else:
-            obj.possibilities = np.ones((N * N, N * N, N * N + 1), dtype=bool)
+            obj.possibilities = np.ones((size, size, size + 1), dtype=bool)
             obj.possibilities[:, :, 0] = 0
+            obj.candidate_counts = np.full(size * size, size, dtype=np.int16)
         obj.N = N
         obj.extendable = True
         # Finally, we return the newly created object:
@@ -60,10 +128,21 @@ class Sudoku(np.ndarray):
         :return: Sudoku
         Copies possibilities for the object as well.
         """
-        # cls = self.__class__
-        result = Sudoku(array=self, N=self.N, possibilities=self.possibilities)
+        # The counts are copied rather than summed again, this is called at every guess of the numpy engine.
+        result = np.array(self).view(Sudoku)
+        result.possibilities = self.possibilities.copy()
+        result.candidate_counts = self.candidate_counts.copy()
+        result.N = self.N
+        result.extendable = self.extendable
         return result
 
+    @property
+    def geometry(self) -> sudoku_geometry.Geometry:
+        """
+        :return: sudoku_geometry.Geometry of the board: its units, peers and size.
+        """
+        return sudoku_geometry.geometry(self.N)
+
     def set_point(self, coordinates: [int,int], value: int) -> None:
         """
         Sets position coordinates to be equal to value. Adjusts self.possibilities to account for the new value set.
@@ -71,68 +150,70 @@ class Sudoku(np.ndarray):
         :param value: int. 1 <= value <= self.N
         :return: None
         """
-        N = self.N
         i, j = coordinates
         if self[i, j] != 0 and self[i, j] != value and not self.possibilities[i, j, value]:
             raise Exception(
                 "Trying to set the value of %s to the coordinate %s in the table \n %s" % (value, coordinates, self))
 
-        self[i, j] = value
-        self.possibilities[i, j] = 0
-        for ind in range(N * N):
-            self.possibilities[ind, j, value] = 0
-            self.possibilities[i, ind, value] = 0
-        for di in range(N):
-            for dj in range(N):
-                self.possibilities[(i // N) * N + di, (j // N) * N + dj, value] = 0
-        self.possibilities[i, j, value] = 1
+        self._set_cells(np.array([i * self.geometry.size + j]), np.array([value]).ravel())
+
+    def _flat_views(self) -> (np.ndarray, np.ndarray):
+        """
+        :return: (N**4,) view of the values and (N**4, N**2+1) view of self.possibilities, cells in row-major order.
+            Writing to the views modifies the Sudoku.
+        """
+        board_geometry = self.geometry
+        return (np.asarray(self).reshape(board_geometry.number_of_cells),
+                self.possibilities.reshape(board_geometry.number_of_cells, board_geometry.size + 1))
 
+    def _set_cells(self, cells: np.ndarray, cell_values: np.ndarray) -> np.ndarray:
+        """
+        Sets all cells (flat indices) to cell_values at once and removes these values from the possibilities of their
+        peers, using the peer index tables from sudoku_geometry.
+        candidate_counts is only updated for the possibilities that are actually removed, so the cost is proportional
+        to k times the number of peers, not to the board size.
+        :param cells: (k,) int ndarray of flat cell indices.
+        :param cell_values: (k,) int ndarray of values between 1 and N**2.
+        :return: (k,) bool ndarray. True for the cells whose value also appears in one of their units.
+            Possibilities of such cells are cleared, so that the contradiction is visible in number_of_possibilities.
+        """
+        board_geometry = self.geometry
+        peer_index = board_geometry.peer_index
+        width = board_geometry.size + 1
+        values, possibilities = self._flat_views()
+        flat_possibilities = possibilities.reshape(-1)
+        counts = self.candidate_counts
+        values[cells] = cell_values
+        possibilities[cells] = 0
+
+        peer_possibilities = (peer_index[cells] * width + cell_values[:, None]).ravel()
+        removed = peer_possibilities[flat_possibilities[peer_possibilities]]
+        flat_possibilities[removed] = 0
+        # Counted again rather than decremented, a peer shared by two of the cells may lose the same value twice.
+        changed_cells = removed // width
+        counts[changed_cells] = possibilities[changed_cells].sum(axis=1)
+
+        possibilities[cells, cell_values] = 1
+        # A value also appears in a unit of its cell exactly if one of the peers of the cell has it.
+        conflicts = (values[peer_index[cells]] == cell_values[:, None]).any(axis=1)
+        possibilities[cells[conflicts]] = 0
+        counts[cells] = 1 - conflicts
+        return conflicts
 
     def check(self) -> bool:
         """
         Checks if a Sudoku satisfies all the rules of sudoku. Doesn't check if it is solved, only checks for contradictions.
         :return: bool
-        Takes (N**2)**2 basic operations.
+        Checks every unit (rows, columns, boxes and the extra units of variants) with board_validator.validate_boards.
         """
-        N = self.N
-        occurs = np.zeros(N * N + 1, dtype=bool)
-        for i in range(N * N):
-            occurs.fill(0)
-            correct = True
-            for j in range(N * N):
-                if self[i, j] != 0 and occurs[self[i, j]] == 0:
-                    occurs[self[i, j]] = 1
-                elif self[i, j] != 0:
-                    correct = False
-                    #   Debugging print
-                    #   print('i, j =' + str(i) + ',' + str(j))
-                    #   print(occurs)
-                    #   print('column ' + str(i))
-                    return False
-
-        for i in range(N * N):
-            occurs.fill(0)
-            correct = True
-            for j in range(N * N):
-                if occurs[self[j, i]] == 0:
-                    occurs[self[j, i]] = 1
-                elif self[j, i]:
-                    correct = False
-                    print('row ' + str(i))
-                    return False
-
-        for i in range(N):
-            for j in range(N):
-                occurs.fill(0)
-                for di in range(N):
-                    for dj in range(N):
-                        if occurs[self[N * i + di, N * j + dj]] == 0:
-                            occurs[self[N * i + di, N * j + dj]] = 1
-                        elif self[N * i + di, N * j + dj]:
-                            correct = False
-                            print('square (' + str(i) + ',' + str(j) + ')')
-                            return False
-        return correct
+        return bool(board_validator.validate_boards(np.asarray(self)[None], self.geometry)[0][0])
+
+    def conflicts(self) -> np.ndarray:
+        """
+        :return: (k, 2) int ndarray. Coordinates of the cells whose value is repeated in one of their units, in
+            row-major order. Empty if self.check() is True.
+        """
+        return np.argwhere(board_validator.validate_boards(np.asarray(self)[None], self.geometry)[1][0])
 
     def solved(self) -> bool:
         """
@@ -151,8 +232,25 @@ class Sudoku(np.ndarray):
         """
         return int((self != 0).sum())
 
-    def has_unique_solution(self):
-        solutions = self.solve(maximal_number_of_solutions=2)
+    def uniqueness_engine(self) -> str:
+        """
+        :return: str. Engine used for uniqueness checks by default. Dancing Links is much faster on 16x16 and larger
+            boards, while on 9x9 boards the cost of building its matrix outweighs the smaller search tree.
+        """
+        return 'dlx' if self.geometry.size >= 16 else 'bitmask'
+
+    def has_unique_solution(self, engine=None, known_solution=None, deadline=None, node_limit=None,
+                            cancel_token=None):
+        """
+        :param engine: None or an engine name accepted by self.solve. If None, uses self.uniqueness_engine().
+        :param known_solution: None or a solution of self (Sudoku or (N**2, N**2) array), e.g. the full grid a puzzle
+            was generated from. If given, the engine ('bitmask', 'dlx' or 'template') only has to look for a different solution.
+        :param deadline, node_limit, cancel_token: limits of the search, see self.solve. Raises SearchBudgetExceeded
+            if the check could not be finished within them.
+        :return: True if the solution is unique, False if there are multiple solutions, None if there are none.
+        """
+        solutions = self._solutions_for_uniqueness(engine, known_solution, deadline=deadline, node_limit=node_limit,
+                                                   cancel_token=cancel_token)
         if len(solutions) == 1:
             return True
         elif len(solutions)>1:
@@ -160,11 +258,35 @@ class Sudoku(np.ndarray):
         else:
             return None
 
-    def can_remove_positions(self, positions):
+    def _solutions_for_uniqueness(self, engine, known_solution, **limits):
+        """
+        :param limits: deadline, node_limit and cancel_token passed on to self.solve.
+        :return: [Sudoku]. Two solutions if self has several, one if it has a unique solution, none if it has none.
+        """
+        engine = engine or self.uniqueness_engine()
+        if known_solution is None:
+            return self.solve(maximal_number_of_solutions=2, engine=engine, **limits)
+        # The known solution is found last, so any other solution comes first.
+        known_solution = np.asarray(known_solution)
+        solutions = self.solve(maximal_number_of_solutions=1, engine=engine,
+                               known_solution=known_solution.ravel().tolist(), **limits)
+        if solutions and not np.array_equal(solutions[0], known_solution):
+            solutions.append(Sudoku.from_solved_values(known_solution.ravel().tolist(), self.N))
+        return solutions
+
+    def can_remove_positions(self, positions, engine=None, known_solution=None, deadline=None, node_limit=None,
+                             cancel_token=None):
         """
         Check if removing clues at all positions in positions results in a puzzle with unique solution.
             Does not modify the original Sudoku.
         :param positions: [(int, int)] list of positions to be removed
+        :param engine: None or an engine name accepted by self.solve. If None, uses self.uniqueness_engine().
+            Ignored if known_solution is given.
+        :param known_solution: None or the unique solution of self (Sudoku or (N**2, N**2) array), e.g. the full grid
+            a puzzle is being generated from. If given, the bitmask engine only searches for solutions that differ
+            from it at one of the positions, which is much faster.
+        :param deadline, node_limit, cancel_token: limits of the search, see self.solve. Raises SearchBudgetExceeded
+            if the check could not be finished within them.
         :return: bool. True if after removing positions the sudoku has unique solution, else False.
         """
 
@@ -175,7 +297,11 @@ class Sudoku(np.ndarray):
             new_table[i][j] = 0
 
         new_sudoku = Sudoku(new_table, N=self.N)
-        solutions = new_sudoku.solve(maximal_number_of_solutions=2)
+        limits = SearchLimits.from_options(deadline, node_limit, cancel_token)
+        if known_solution is not None:
+            return not new_sudoku._has_solution_differing_at(positions, known_solution, limits)
+        solutions = new_sudoku.solve(maximal_number_of_solutions=2, engine=engine or self.uniqueness_engine(),
+                                     deadline=deadline, node_limit=node_limit, cancel_token=cancel_token)
         if len(solutions) > 1:
             return False
         if len(solutions) == 1:
@@ -183,88 +309,294 @@ class Sudoku(np.ndarray):
         else:
             raise Exception("Given table has no solutions")
 
-
-    def simplify(self, initial_simplification: bool = False) -> bool:
+    def _has_solution_differing_at(self, positions, known_solution, limits=None):
+        """
+        :param positions: [(int, int)] positions of removed clues. Self with these clues put back has to have
+            known_solution as its unique solution.
+        :param known_solution: Sudoku or (N**2, N**2) array.
+        :param limits: None or SearchLimits.
+        :return: bool. True if self has a solution different from known_solution.
+        """
+        # Any other solution has to differ from known_solution at one of the positions, so the search guesses those
+        # first and cuts every branch where they all got their known values.
+        size = self.geometry.size
+        solutions = bitmask_solver.solve(
+            np.asarray(self).ravel().tolist(), self.N, candidates=self.candidate_masks().tolist(),
+            known_solution=np.asarray(known_solution).ravel().tolist(),
+            divergence_cells=[i * size + j for i, j in positions], limits=limits)
+        return len(solutions) > 0
+
+    def simplify(self, initial_simplification: bool = False, cells: np.ndarray = None) -> bool:
         """
         Sets the values to all positions in Sudoku that have only one possibility
         :param initial_simplification: bool
             If not initial_simplification, the function assumes possibilities already account for values that are set
                 and only adjusts possibilities for cells that are set during the function execution.
             If initial_simplification, the function also adjusts possibilities for cells that were set before.
+        :param cells: None or int ndarray of flat (row-major) cell indices. If given, only these cells are checked
+            for single possibilities, else all cells are checked.
         :return: bool
             True if a simplification occurs
             False if no simplification occurs
         Initial simplification only needs to be done once. Possibilities persist through copy.copy(sudoku)
-        Initial simplification potentially increases the number of operations from (N**2)**2 to (N**2)**3
+        All singles found in one call are set at once with a few fancy-indexed operations on precomputed peer tables.
         """
-        simplified = False
-        N = self.N
-        for i in range(N * N):
-            for j in range(N * N):
-                if self.possibilities[i, j, 1:].sum() == 1 and not self[i, j]:
-                    simplified = True
-                    value = np.nonzero(self.possibilities[i, j, 1:])[0] + 1
-                    self.set_point([i, j], value)
-                if initial_simplification:
-                    if self[i, j] != 0:
-                        simplified = True
-                        self.set_point([i, j], self[i, j])
+        return self._simplify_step(initial_simplification, cells).size > 0
 
-        return simplified
+    def _simplify_step(self, initial_simplification: bool = False, cells: np.ndarray = None) -> np.ndarray:
+        """
+        Same as self.simplify().
+        :return: int ndarray of flat indices of the cells that were set.
+        """
+        values, possibilities = self._flat_views()
+        set_cells = [np.zeros(0, dtype=np.intp)]
+        if initial_simplification:
+            given = np.flatnonzero(values)
+            if given.size:
+                self._set_cells(given, values[given].astype(np.intp))
+                set_cells.append(given)
+
+        counts = self.candidate_counts
+        if cells is None:
+            singles = np.flatnonzero((values == 0) & (counts == 1))
+        else:
+            singles = cells[(values[cells] == 0) & (counts[cells] == 1)]
+        if singles.size:
+            conflicts = self._set_cells(singles, possibilities[singles, 1:].argmax(axis=1) + 1)
+            # Two singles of the same unit got the same value: the cells stay empty and without possibilities.
+            values[singles[conflicts]] = 0
+            set_cells.append(singles)
 
-    def full_simplify(self, initial_simplification: bool = False) -> bool:
+        return np.concatenate(set_cells)
+
+    def full_simplify(self, initial_simplification: bool = False, cells: np.ndarray = None) -> bool:
         """
-        Applies self.simplify() until no more simplifications occur
+        Applies self.simplify() until no more simplifications occur.
+        After the first step only the peers of the cells set in the previous step are checked, since only their
+        possibilities could have changed. The cost is proportional to the number of cells set, not to the board size.
         :param initial_simplification: bool
+        :param cells: None or int ndarray of flat cell indices whose possibilities changed since the last
+            simplification. If None, the first step checks all cells.
         :return: bool
             True if a simplification occurred
             False if no simplification occurred
         """
-        simplified_step = self.simplify(initial_simplification=initial_simplification)
-        simplified = simplified_step
-        while simplified_step:
-            simplified_step = self.simplify()
+        peer_index = self.geometry.peer_index
+        set_cells = self._simplify_step(initial_simplification=initial_simplification, cells=cells)
+        simplified = set_cells.size > 0
+        while set_cells.size:
+            set_cells = self._simplify_step(cells=np.unique(peer_index[set_cells]))
         return simplified
 
     def number_of_possibilities(self) -> np.ndarray:
         """
         :return: For a given Sudoku, computes (N**2, N**2) ndarray that shows the number of possibilities in each coordinate.
         """
-        return self.possibilities.sum(axis=2)
+        size = self.geometry.size
+        return self.candidate_counts.reshape(size, size).astype(int)
+
+
+    def candidate_masks(self) -> np.ndarray:
+        """
+        :return: (N**4,) int64 ndarray, flat (row-major) bitmasks of self.possibilities.
+            Bit d-1 of a mask is set if d is one of the possibilities for the cell.
+        """
+        size = self.geometry.size
+        return self.possibilities[:, :, 1:].reshape(size * size, size) @ (1 << np.arange(size, dtype='int64'))
+
+    @classmethod
+    def from_solved_values(cls, values, N) -> "Sudoku":
+        """
+        :param values: flat sequence of N**4 ints between 1 and N**2.
+        :param N: int or sudoku_geometry.Geometry, see Sudoku.
+        :return: Sudoku with possibilities set to the values only, same as the solutions found by the numpy engine.
+        """
+        size = sudoku_geometry.geometry(N).size
+        board = np.reshape(np.asarray(values, dtype='int16'), (size, size))
+        return Sudoku(board, N, possibilities=np.eye(size + 1, dtype=bool)[board])
+
+    def iter_solutions(self, random_state=None, stats=None, deadline=None, node_limit=None, cancel_token=None,
+                       **search_options):
+        """
+        Generator of the solutions, one at a time, in the same order as self.solve(engine='bitmask') returns them.
+        Only the current branch of the search is kept, so enumerating any number of solutions runs in constant memory,
+        and breaking out of the loop stops the search.
+        :param random_state: None, int or np.random.Generator, see self.solve.
+        :param stats: None or solver_stats.SolverStats, see self.solve.
+        :param deadline: see self.solve.
+        :param node_limit: see self.solve.
+        :param cancel_token: see self.solve. If a limit is hit, SearchBudgetExceeded is raised from the loop after
+            the solutions found before it were yielded.
+        :param search_options: passed on to bitmask_solver.Search (rules, search, known_solution).
+        :return: generator of (N**2, N**2) int16 ndarrays with the values of the solutions. Use
+            Sudoku.from_solved_values to get a Sudoku with possibilities.
+        """
+        tree_search = self._bitmask_search(random_state, stats, deadline, node_limit, cancel_token, search_options)
+        side = self.geometry.size
+        while True:
+            solution = tree_search.next_solution()
+            if solution is None:
+                return
+            yield np.reshape(np.array(solution, dtype='int16'), (side, side))
+
+    def count_solutions(self, limit=None, random_state=None, stats=None, deadline=None, node_limit=None,
+                        cancel_token=None, engine='bitmask', **search_options) -> int:
+        """
+        Counts the solutions without keeping them.
+        :param limit: None or int. Counting stops once limit solutions were found.
+        :param random_state, stats, deadline, node_limit, cancel_token, search_options: see self.iter_solutions.
+        :param engine: 'bitmask' or 'counting'.
+            'bitmask': enumerates the solutions with self.iter_solutions, time grows with their number.
+            'counting': counts independent parts of the board separately and memoizes the counts of subproblems
+                (solution_counter.py), much faster when there are many solutions. Takes cache_size as an option,
+                the limits count branchings instead of guesses and random_state and stats are ignored. Always counts
+                all solutions, limit only caps the result. Use solution_counter.count_solutions to get a lower bound
+                instead of SearchBudgetExceeded when a limit is hit.
+        :return: int. Number of solutions, at most limit.
+            If the counting is stopped by deadline, node_limit or cancel_token, raises SearchBudgetExceeded instead.
+        """
+        if engine == 'counting':
+            counter = solution_counter.SolutionCounter(
+                self.N, limits=SearchLimits.from_options(deadline, node_limit, cancel_token), **search_options)
+            count, exact = counter.count(np.asarray(self).ravel().tolist(), self.candidate_masks().tolist())
+            if not exact:
+                raise SearchBudgetExceeded(counter.stopped_reason)
+            return count if limit is None else min(count, limit)
+        elif engine != 'bitmask':
+            raise ValueError("Unknown counting engine " + str(engine))
+        tree_search = self._bitmask_search(random_state, stats, deadline, node_limit, cancel_token, search_options)
+        count = 0
+        while (limit is None or count < limit) and tree_search.next_solution() is not None:
+            count += 1
+        return count
+
+    def _bitmask_search(self, random_state, stats, deadline, node_limit, cancel_token, search_options):
+        """
+        :return: bitmask_solver.Search of self, with the options of self.iter_solutions.
+        """
+        return bitmask_solver.Search(np.asarray(self).ravel().tolist(), self.N,
+                                     candidates=self.candidate_masks().tolist(), random_state=engine_seed(random_state),
+                                     stats=stats, limits=SearchLimits.from_options(deadline, node_limit, cancel_token),
+                                     **search_options)
 
+    def solve_stepwise(self, maximal_number_of_solutions=1, random_state=None, **search_options) -> "StepwiseSolve":
+        """
+        Prepares a search with the bitmask engine that runs in slices, see StepwiseSolve.
+        :param maximal_number_of_solutions: int >= 1 or 'all'. Same as in self.solve.
+        :param random_state: None, int or np.random.Generator, see self.solve.
+        :param search_options: passed on to bitmask_solver.Search (rules, search, known_solution, stats, limits).
+        :return: StepwiseSolve. Call its step() until it returns True.
+        """
+        return StepwiseSolve(self, maximal_number_of_solutions, random_state, **search_options)
 
-    def solve(self, maximal_number_of_solutions=1, random_state=None, number_of_guesses_tracker=None) -> "[Sudoku]":
+    def solve(self, maximal_number_of_solutions=1, random_state=None, number_of_guesses_tracker=None,
+              engine='bitmask', stats=None, deadline=None, node_limit=None, cancel_token=None, portfolio=None,
+              **engine_options) -> "[Sudoku]":
         """
         Finds a solution solutions of a given sudoku;
         :param maximal_number_of_solutions: int >= 1 or 'all'. The number of solutions fetched. Use 1 to get a
             single solution, and 2 to check if solution is unique.
         :param random_state: None or int for deterministic behaviour. If None, and the solution is not unique,
                 returned solution (or the order of solutions if maximal_number_of_solutions != 1) might be different.
+                Can also be a np.random.Generator, which is then advanced. No global random state is used, so
+                solves can run concurrently in threads.
         :param number_of_guesses_tracker: None or []. if array=[] is provided, array will be modified to to have
             the same length as output and display the number of guesses used to compute each solution.
             This will be 'best case' number of guesses.
+        :param engine: 'bitmask', 'dlx', 'parallel', 'portfolio', 'learning', 'template' or 'numpy'.
+            'bitmask': pure-integer engine from bitmask_solver.py, much faster than 'numpy'.
+            'dlx': Dancing Links exact cover engine from dlx_solver.py. Prunes more per node than the other engines,
+                so it makes fewer guesses on hard puzzles.
+            'parallel': the 'bitmask' search split across worker processes by parallel_solver.py. Only worth the
+                process start-up for long searches on large boards.
+            'learning': the 'bitmask' search with nogood learning and backjumping from learning_solver.py. Best with
+                restarts='luby' on hard 25x25 boards, where the nogoods carry over from one attempt to the next.
+            'template': 9x9 boards only. Combines precomputed placements (templates) of each digit with vectorized
+                bit operations, see template_solver.py. Decides most bank puzzles without guessing.
+            'portfolio': several configurations of 'bitmask' and 'dlx' race in worker processes of
+                portfolio_solver.py, the first one to finish wins. Worth it for hard 16x16 and larger boards.
+            'numpy': original engine operating on self.possibilities, kept as a reference.
+                Uses the same guessing strategy as 'bitmask' with rules=(), branching='mrv' and value_order='random'.
+        :param engine_options: passed on to the engine, see the solve function of its module. The 'bitmask' engine
+            takes rules (collection of propagation rules from bitmask_solver.ALL_RULES applied before every guess on
+            top of naked singles, pass () for naked singles only; the default adds bitmask_solver.ALL_DIFFERENT on 25x25
+            and larger boards), search ('trail' or 'copy'), probe_budget and
+            probe_depth (lookahead of the bitmask_solver.FAILED_LITERALS rule) and restarts ('luby' or 'geometric',
+            restarts with a new seed once an attempt runs over its cap), restart_base, max_restarts, branching (choice
+            of the cell to guess in, from bitmask_solver.BRANCHING_HEURISTICS) and value_order (choice of the digit,
+            from bitmask_solver.VALUE_ORDERINGS); the defaults of the last two depend on N. The 'parallel'
+            engine takes rules, processes, node_budget, root_budget and executor. 'bitmask', 'dlx' and 'template' take
+            known_solution (flat list of values of a solution that is then found last).
+            The 'learning' engine takes branching, value_order, restarts, restart_base, max_restarts, max_nogoods and
+            max_nogood_size. The 'portfolio' engine takes portfolio, see below.
+        :param stats: None or solver_stats.SolverStats, filled in with the nodes, backtracks, eliminations, timings
+            and guesses of the search. Costs nothing when None.
+        :param deadline: None or float. time.monotonic() value at which the search is stopped.
+        :param node_limit: None or int. Number of guesses after which the search is stopped.
+        :param cancel_token: None or search_limits.CancellationToken. The search stops once it is cancelled.
+        :param portfolio: None, 'default' or a sequence of configurations (dicts with 'engine' and engine options, see
+            portfolio_solver.DEFAULT_PORTFOLIO). If given, the configurations race with engine='portfolio' and the
+            first result is returned. For puzzles with several solutions, which ones are returned depends on timing.
         :return List of Sudokus that are solutions of the original Sudoku.
             Stops if it finds at least maximal_number_of_solutions of different solutions.
             If no solutions exist, return empty list.
+            If the search is stopped by deadline, node_limit or cancel_token, raises SearchBudgetExceeded instead
+            (its solutions attribute holds the Sudokus found before that).
         """
-
-        random.seed(random_state)
+        limits = SearchLimits.from_options(deadline, node_limit, cancel_token)
+        if portfolio is not None:
+            engine = 'portfolio'
+            engine_options['portfolio'] = portfolio_solver.DEFAULT_PORTFOLIO if portfolio == 'default' else portfolio
+        if engine in FLAT_ENGINES:
+            try:
+                solutions = FLAT_ENGINES[engine](
+                    np.asarray(self).ravel().tolist(), self.N, maximal_number_of_solutions=maximal_number_of_solutions,
+                    random_state=engine_seed(random_state), number_of_guesses_tracker=number_of_guesses_tracker,
+                    candidates=self.candidate_masks().tolist(), stats=stats, limits=limits, **engine_options)
+            except SearchBudgetExceeded as error:
+                error.solutions = [Sudoku.from_solved_values(values, self.N) for values in error.solutions]
+                raise
+            return [Sudoku.from_solved_values(values, self.N) for values in solutions]
+        elif engine != 'numpy':
+            raise ValueError("Unknown solver engine " + str(engine))
+        elif engine_options:
+            raise ValueError("The numpy engine takes no options, got " + str(sorted(engine_options)))
+
+        start_time = time.perf_counter()
+        rng = random_generator(random_state)
         answers = []
         sudokus = []
         sudoku = copy.copy(self)
-        N = self.N
         sudoku.simplify(initial_simplification=True)
         if sudoku.solved():
             answers.append(sudoku)
             if number_of_guesses_tracker is not None:
                 number_of_guesses_tracker.append(0)
+            if stats is not None:
+                stats.guesses_per_solution.append(0)
+
+        # Flat indices of the cells whose possibilities changed since the last full_simplify of the current sudoku.
+        changed_cells = None
+        number_of_guesses = 0
+        peer_index = self.geometry.peer_index
+        size = self.geometry.size
 
         while (not sudoku.solved()) or len(sudokus) > 0:
-            sudoku.full_simplify()
+            if stats is None:
+                sudoku.full_simplify(cells=changed_cells)
+            else:
+                propagation_start = time.perf_counter()
+                number_of_candidates = int(sudoku.candidate_counts.sum())
+                sudoku.full_simplify(cells=changed_cells)
+                stats.eliminations[bitmask_solver.NAKED_SINGLES] += number_of_candidates - int(
+                    sudoku.candidate_counts.sum())
+                stats.propagation_time += time.perf_counter() - propagation_start
             if sudoku.solved():
                 answers.append(sudoku)
                 if number_of_guesses_tracker is not None:
                     number_of_guesses_tracker.append(len(sudokus))
+                if stats is not None:
+                    stats.guesses_per_solution.append(len(sudokus))
 
                 # Debugging print("found a solution")
 
@@ -272,38 +604,98 @@ class Sudoku(np.ndarray):
                     break
                 if len(sudokus) > 0:
                     # Debugging print("backtracking to find other solutions")
-                    sudoku = sudokus[-1]
-                    sudokus.pop()
+                    sudoku, changed_cells = sudokus.pop()
+                    if stats is not None:
+                        stats.backtracks += 1
             else:
-                possibilities_number = sudoku.number_of_possibilities()
+                counts = sudoku.candidate_counts
 
-                if (possibilities_number == 0).any():
+                if not counts.all():
                     """print("backtracking since there is no way to put a number on position(s)" + str(
                         np.unravel_index(np.argmin(possibilities_number, axis=None), (N*N, N*N))) + "\n")"""
                     if len(sudokus) == 0:
                         # Debugging print("sudoku not solvable")
                         break
                     else:
-                        sudoku = sudokus[-1]
-                        sudokus.pop()
+                        sudoku, changed_cells = sudokus.pop()
+                        if stats is not None:
+                            stats.backtracks += 1
                 else:
 
-                    possibilities_number = np.where(possibilities_number <= 1, N*N+1, possibilities_number)
-                    min_index = np.unravel_index(np.argmin(possibilities_number, axis=None), (N*N, N*N))
+                    if limits is not None:
+                        reason = limits.exceeded(number_of_guesses)
+                        if reason is not None:
+                            raise SearchBudgetExceeded(reason, answers)
+                    number_of_guesses += 1
+                    # Set cells have a single possibility and empty ones at least two after full_simplify.
+                    min_cell = int(np.argmin(np.where(counts <= 1, size + 1, counts)))
+                    min_index = divmod(min_cell, size)
                     values = np.nonzero(sudoku.possibilities[min_index] == True)[0]
                     # value = values[0] # use this for deterministic behaviour
-                    value = np.random.choice(values)
+                    value = rng.choice(values)
                     new_sudoku = copy.copy(sudoku)
                     sudoku.possibilities[min_index[0], min_index[1], value] = 0
-                    sudokus.append(sudoku)
+                    sudoku.candidate_counts[min_cell] -= 1
+                    sudokus.append((sudoku, np.array([min_cell])))
                     sudoku = new_sudoku
                     sudoku.set_point(min_index, value)
+                    changed_cells = np.append(peer_index[min_cell], min_cell)
+                    if stats is not None:
+                        stats.nodes += 1
+                        stats.copies += 1
+                        stats.max_depth = max(stats.max_depth, len(sudokus))
 
                     # Debugging print("setting value " + str(value) + " at point " + str(min_index) + "\n")
 
+        if stats is not None:
+            stats.total_time += time.perf_counter() - start_time
         return answers
 
 
+class StepwiseSolve:
+    """
+    Search of the bitmask engine that is run in slices of a limited number of guesses, so that a caller can spread it
+    over several calls (e.g. from tkinter's after()) without threads. Finds the same solutions as Sudoku.solve with the
+    same random_state and options.
+    Attributes:
+        solutions: [Sudoku]. Solutions found so far.
+        number_of_guesses: [int]. Same as number_of_guesses_tracker of Sudoku.solve.
+        finished: bool. True once maximal_number_of_solutions were found or the whole tree was searched.
+    """
+
+    def __init__(self, sudoku, maximal_number_of_solutions=1, random_state=None, **search_options):
+        """
+        Use Sudoku.solve_stepwise rather than creating instances directly.
+        """
+        self.N = sudoku.N
+        self.maximal_number_of_solutions = maximal_number_of_solutions
+        self.search = bitmask_solver.Search(np.asarray(sudoku).ravel().tolist(), sudoku.N,
+                                            candidates=sudoku.candidate_masks().tolist(),
+                                            random_state=engine_seed(random_state), **search_options)
+        self.solutions = []
+        self.number_of_guesses = []
+        self.finished = maximal_number_of_solutions != 'all' and maximal_number_of_solutions < 1
+
+    def step(self, node_budget=1000) -> bool:
+        """
+        Continues the search for at most node_budget guesses.
+        :param node_budget: int >= 1.
+        :return: bool. self.finished
+        """
+        node_limit = self.search.nodes + node_budget
+        while not self.finished:
+            solution = self.search.next_solution(node_budget=node_limit - self.search.nodes)
+            if solution is None:
+                self.finished = self.search.finished
+                break
+            self.solutions.append(Sudoku.from_solved_values(solution, self.N))
+            self.number_of_guesses.append(self.search.guesses)
+            if self.maximal_number_of_solutions != 'all' and \
+                    len(self.solutions) >= self.maximal_number_of_solutions:
+                self.finished = True
+        return self.finished
+
+
 def main():
     # Testing the solve method: remove random drop numbers from a specific full N^2 x N^2 sudoku, record all answers
     # (with some debugging information) in the out.txt
@@ -327,13 +719,14 @@ def main():
             sudoku[i, j] = 0
         #sudoku[1:, :] = 0
         print("Case #" + str(test_case) +"\n", sudoku, sudoku.check())
-        answers = sudoku.solve(maximal_number_of_solutions='all')
-        print("Case number " + str(test_case)+" has "+str(len(answers))+" solutions. They are:\n")
-        for sudoku in answers:
-            print(sudoku)
+        # Solutions are counted and then streamed, a 16x16 board with 150 empty cells can have too many to keep.
+        number_of_solutions = sudoku.count_solutions(engine='counting')
+        print("Case number " + str(test_case)+" has "+str(number_of_solutions)+" solutions. They are:\n")
+        for solution in sudoku.iter_solutions():
+            print(solution)
 
         #print("possibilities number : \n", sudoku.number_of_possibilities())
-        if not sudoku.solved():
+        if number_of_solutions == 0:
             print("###########################################")
 
     f_out.close()
@@ -0,0 +1,196 @@
+# Compact board type: a sudoku grid without the search state of a Sudoku.
+#
+# Sudoku (sudoku.py) subclasses np.ndarray and carries the (N**2, N**2, N**2+1) possibilities of the numpy engine, so
+# every grid it holds costs N**6 bytes more than its values, every slice or arithmetic result is a Sudoku without
+# possibilities, and pickling silently drops everything but the values. Most of the project only needs the grid: the
+# game keeps the initial board and its solutions, the GUI reads cells, the puzzle bank and the generator pass boards
+# around. Board keeps the values in one flat bytearray (one byte per cell, row-major, 0 for empty cells) and optional
+# candidate restrictions in a second one (one bitmask per cell), and takes its geometry from sudoku_geometry, where it
+# is computed once per N and shared by all boards of that size. Like the engines, Board takes a sudoku_geometry.Geometry
+# as N for rectangular boxes and variants.
+#
+# NumPy views of the buffers are made on demand without copying, so callers that need arrays (and np.asarray(board))
+# get them for free, and writing to a view writes to the board. Sudoku(board, N) accepts a Board directly, including
+# its candidate restrictions. Boards pickle as their two buffers.
+#
+# Depends only on sudoku_geometry.py.
+
+
+import numpy as np
+
+from sudoku_geometry import Geometry, geometry
+
+# Values are stored in one byte each, so the side N**2 of the board can be at most 255.
+MAX_N = 15
+MAX_SIZE = 255
+
+
+def mask_dtype(size) -> np.dtype:
+    """
+    :param size: int. N**2, the number of digits.
+    :return: np.dtype of the candidate bitmasks of a board with size digits.
+    """
+    if size <= 32:
+        return np.dtype('<u4')
+    if size <= 64:
+        return np.dtype('<u8')
+    raise ValueError("Candidate restrictions are supported for at most 64 digits, got " + str(size))
+
+
+class _Row(np.ndarray):
+    """
+    uint8 view of one row of a Board, returned by board[i]. Single cells read as ints, so board[i][j] behaves like the
+    values of the (N**2, N**2) int arrays boards used to be; writes go to the board.
+    """
+
+    def __getitem__(self, index):
+        value = super().__getitem__(index)
+        return int(value) if isinstance(value, np.generic) else value
+
+
+class Board:
+    """
+    Square sudoku grid of side N**2 with one byte per cell.
+    Attributes:
+        N: int. Side of the small square, or a sudoku_geometry.Geometry. With a Geometry, N**2 below stands for the
+            side of the board, geometry.size.
+        cells: bytearray of the N**4 values in row-major order, 0 for empty cells.
+        candidates: None or bytearray of N**4 little-endian bitmasks (see mask_dtype) restricting the digits allowed in
+            each cell, bit d-1 for digit d. None allows every digit in every cell.
+    Indexing (board[i][j], board[i, j], board[i] = row) reads and writes the values like a (N**2, N**2) array. Single
+    cells read as ints; rows, slices and np.asarray(board) are uint8 arrays, so arithmetic on them wraps around.
+    """
+    __slots__ = ('N', 'cells', 'candidates')
+
+    def __init__(self, values, N, candidates=None):
+        """
+        :param values: (N**2, N**2) or (N**4,) array-like of ints between 0 and N**2, or bytes-like of N**4 values.
+            Copied.
+        :param N: int. Side of the small square, at most MAX_N, or a sudoku_geometry.Geometry of side at most
+            MAX_SIZE.
+        :param candidates: None, (N**2, N**2) or (N**4,) array-like of int bitmasks, or bytes-like in the format of
+            the candidates attribute. Copied.
+        """
+        if not isinstance(N, Geometry) and not 1 <= N <= MAX_N:
+            raise ValueError("N has to be between 1 and " + str(MAX_N) + ", got " + str(N))
+        size = geometry(N).size
+        if size > MAX_SIZE:
+            raise ValueError("Boards can have a side of at most " + str(MAX_SIZE) + ", got " + str(size))
+        number_of_cells = size * size
+        self.N = N
+        if isinstance(values, (bytes, bytearray)):
+            self.cells = bytearray(values)
+            if len(self.cells) != number_of_cells:
+                raise ValueError("A board of N=" + str(N) + " needs " + str(number_of_cells) + " values")
+            if max(self.cells) > size:
+                raise ValueError("Values have to be between 0 and " + str(size))
+        else:
+            array = np.ravel(values)
+            if array.size != number_of_cells:
+                raise ValueError("A board of N=" + str(N) + " needs " + str(number_of_cells) + " values")
+            if array.size and (array.min() < 0 or array.max() > size):
+                raise ValueError("Values have to be between 0 and " + str(size))
+            self.cells = bytearray(number_of_cells)
+            np.frombuffer(self.cells, dtype=np.uint8)[:] = array
+        if candidates is None:
+            self.candidates = None
+        elif isinstance(candidates, (bytes, bytearray)):
+            self.candidates = bytearray(candidates)
+            if len(self.candidates) != number_of_cells * mask_dtype(size).itemsize:
+                raise ValueError("A board of N=" + str(N) + " needs " + str(number_of_cells) + " candidate masks")
+        else:
+            masks = np.ravel(candidates)
+            if masks.size != number_of_cells:
+                raise ValueError("A board of N=" + str(N) + " needs " + str(number_of_cells) + " candidate masks")
+            dtype = mask_dtype(size)
+            self.candidates = bytearray(number_of_cells * dtype.itemsize)
+            np.frombuffer(self.candidates, dtype=dtype)[:] = masks
+
+    @property
+    def geometry(self):
+        """
+        :return: sudoku_geometry.Geometry shared by all boards of this N.
+        """
+        return geometry(self.N)
+
+    @property
+    def size(self) -> int:
+        return geometry(self.N).size
+
+    @property
+    def shape(self) -> (int, int):
+        return self.size, self.size
+
+    @property
+    def values(self) -> np.ndarray:
+        """
+        :return: (N**2, N**2) uint8 ndarray viewing self.cells. Writing to it modifies the board.
+        """
+        size = self.size
+        return np.frombuffer(self.cells, dtype=np.uint8).reshape(size, size)
+
+    def __array__(self, dtype=None, copy=None):
+        """
+        :param dtype: None or dtype of the result.
+        :param copy: None, True or False, as passed by NumPy 2. None and False give a view of self.cells when no
+            conversion is needed. False raises ValueError if dtype needs a copy.
+        :return: (N**2, N**2) ndarray of the values.
+        """
+        values = self.values
+        if dtype is not None and np.dtype(dtype) != values.dtype:
+            if copy is False:
+                raise ValueError("Converting a Board to " + str(np.dtype(dtype)) + " needs a copy")
+            return values.astype(dtype)
+        return values.copy() if copy else values
+
+    def __getitem__(self, index):
+        value = self.values[index]
+        if isinstance(value, np.generic):
+            return int(value)
+        if isinstance(index, (int, np.integer)):
+            return value.view(_Row)
+        return value
+
+    def __setitem__(self, index, value):
+        self.values[index] = value
+
+    def __len__(self):
+        return self.size
+
+    def __reduce__(self):
+        return Board, (self.cells, self.N, self.candidates)
+
+    def __repr__(self):
+        return "Board(N=" + str(self.N) + ",\n" + str(self.values) + ")"
+
+    def copy(self) -> "Board":
+        return Board(self.cells, self.N, self.candidates)
+
+    def flat_values(self) -> list:
+        """
+        :return: [int] the N**4 values in row-major order, the board format of the solver engines.
+        """
+        return list(self.cells)
+
+    def number_of_clues(self) -> int:
+        return len(self.cells) - self.cells.count(0)
+
+    def without(self, positions) -> "Board":
+        """
+        :param positions: iterable of (int, int) coordinates.
+        :return: Board. Copy of self with the cells at positions emptied.
+        """
+        board = self.copy()
+        size = self.size
+        for i, j in positions:
+            board.cells[i * size + j] = 0
+        return board
+
+    def candidate_masks(self) -> np.ndarray:
+        """
+        :return: (N**4,) int64 ndarray, flat (row-major) bitmasks of the digits allowed in each cell, in the format of
+            Sudoku.candidate_masks. Without candidate restrictions every digit is allowed everywhere.
+        """
+        if self.candidates is None:
+            return np.full(len(self.cells), geometry(self.N).full_mask, dtype='int64')
+        return np.frombuffer(self.candidates, dtype=mask_dtype(self.size)).astype('int64')
@@ -5,7 +5,7 @@
 # Currently computes a solution on SudokuGame instance creation, making it slow (especially for 16x16 sudokus).
 # Think whether this can be changed.
 #
-# should only depend on sudoku.py
+# should only depend on sudoku.py, sudoku_board.py and board_validator.py
 #
 
 
@@ -13,7 +13,9 @@ import itertools
 import numpy as np
 import pickle
 
+from board_validator import validate_boards
 from sudoku import Sudoku
+from sudoku_board import Board
 
 
 def to_list(element):
@@ -28,31 +30,57 @@ def to_list(element):
         return [element]
 
 
+# Games with allow_multiple_solutions keep at most this many solutions.
+MAXIMAL_NUMBER_OF_STORED_SOLUTIONS = 1000
+
+
 class SudokuGame():
     """
     Class responsible for a single sudoku game, including remembering user input.
     """
+    # True if self.solutions holds only the first MAXIMAL_NUMBER_OF_STORED_SOLUTIONS solutions. Set on the class as
+    # well, for games saved before it existed.
+    solutions_capped = False
 
-    def __init__(self, initial_board, N=3, allow_multiple_solutions=False):
+    def __init__(self, initial_board, N=3, allow_multiple_solutions=False, portfolio=None, deadline=None,
+                 node_limit=None, cancel_token=None):
         """
-        :param initial_board: Initial sudoku set up, integer array of shape (N**2, N**2).
+        :param initial_board: Initial sudoku set up, integer array of shape (N**2, N**2) or sudoku_board.Board.
             0's for missing values, numbers 1 to N**2 for fixed values
             TODO: implement multiple possibilities given values
         :param N: Size of the small squares in sudoku, default is N=3 for the standard sudoku
-        :param allow_multiple_solutions:
+        :param allow_multiple_solutions: bool. If True, keeps up to MAXIMAL_NUMBER_OF_STORED_SOLUTIONS solutions.
             TODO: implement dealing with boards that have multiple solutions, for now some functionality might not work
              as expected if initial set up has multiple solutions
+        :param portfolio: None, or a portfolio accepted by Sudoku.solve to race several configurations in worker
+            processes (portfolio_solver.py) when looking for the solution. Only worth it on machines with several CPUs.
+            None solves in this process with the bitmask engine.
+        :param deadline, node_limit, cancel_token: limits of the search for the solutions, see Sudoku.solve. If a limit
+            is hit, SearchBudgetExceeded is raised and no game is created.
         """
-        self.initial_board = initial_board.copy()
+        # The initial board and the solutions are kept as compact Boards, which is what gets pickled by save_game.
+        # Games saved before kept (N**2, N**2) arrays instead; both are only read with [i][j] indexing.
+        self.initial_board = Board(initial_board, N)
         self.N = N
-        self.solutions = Sudoku(initial_board, self.N).solve(
-            maximal_number_of_solutions=('all' if allow_multiple_solutions else 1)
-        )
+        sudoku = Sudoku(self.initial_board, self.N)
+        limits = {'deadline': deadline, 'node_limit': node_limit, 'cancel_token': cancel_token}
+        if allow_multiple_solutions:
+            # Under-constrained boards can have millions of solutions, so only the first ones are kept; see
+            # number_of_solutions for the total.
+            solutions = itertools.islice(sudoku.iter_solutions(**limits), MAXIMAL_NUMBER_OF_STORED_SOLUTIONS + 1)
+            self.solutions = [Board(solution, N) for solution in solutions]
+            self.solutions_capped = len(self.solutions) > MAXIMAL_NUMBER_OF_STORED_SOLUTIONS
+            del self.solutions[MAXIMAL_NUMBER_OF_STORED_SOLUTIONS:]
+        elif portfolio is not None:
+            self.solutions = [Board(solution, N) for solution in sudoku.solve(portfolio=portfolio, **limits)]
+        else:
+            # Restarts cut the long tail of loading times of hard 16x16 puzzles.
+            self.solutions = [Board(solution, N) for solution in sudoku.solve(restarts='luby', **limits)]
         self.allow_multiple_solutions = allow_multiple_solutions
 
         self.guesses = [[0]*(N*N) for j in range(N*N)]
         for i, j in itertools.product(range(N * N), range(N * N)):
-            self.guesses[i][j] = to_list(self.initial_board[i][j])
+            self.guesses[i][j] = to_list(int(self.initial_board[i][j]))
 
         self._computer_help_enabled = False
 
@@ -60,6 +88,15 @@ class SudokuGame():
 
         self._version = 0.1
 
+    def number_of_solutions(self) -> int:
+        """
+        :return: int. Number of solutions of the initial board. Counted with the counting engine without storing the
+            solutions if self.solutions was capped.
+        """
+        if not self.solutions_capped:
+            return len(self.solutions)
+        return Sudoku(self.initial_board, self.N).count_solutions(engine='counting')
+
     def enable_create_sudoku_mode(self):
         self._create_sudoku_mode = True
 
@@ -155,21 +192,14 @@ class SudokuGame():
 
     def check_if_solution_is_full_and_correct(self):
         N = self.N
-        answers = np.zeros((N*N, N*N))
-        correct = True
+        answers = np.zeros((N*N, N*N), dtype=int)
         for i, j in itertools.product(range(N*N), range(N*N)):
             if len(self.guesses[i][j]) != 1 or self.guesses[i][j][0] == 0:
-                correct = False
-                break
-            else:
-                answers[i][j] = self.guesses[i][j][0]
+                return 'Not all cells filled'
+            answers[i][j] = self.guesses[i][j][0]
 
-        if not correct:
-            return 'Not all cells filled'
-        else:
-            answers_sudoku = Sudoku(answers, N)
-            correct = answers_sudoku.check()
-        return correct
+        valid, _, _ = validate_boards(answers[None], N, complete=True)
+        return bool(valid[0])
 
     def save_game(self, file_path):
         """
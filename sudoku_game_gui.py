@@ -17,14 +17,17 @@ from collections import OrderedDict
 
 import random
 import itertools
+import time
 import numpy as np
 import os
 
 from sudoku import Sudoku
+from search_limits import SearchBudgetExceeded, SearchLimits
 from sudoku_game import SudokuGame
 import sudoku_game
 from game_settings import UI_settings
 import puzzle_generator
+import solution_counter
 import pop_up_messages
 
 
@@ -95,7 +98,7 @@ class GameFrame(Frame):
         if i == -1 or j == -1:
             pass
         else:
-            value = self.game.solutions[0][i][j]
+            value = int(self.game.solutions[0][i][j])
             self.game.guesses[i][j] = [value]
             self.sudoku_ui.draw_sudoku()
 
@@ -142,12 +145,32 @@ class GameFrame(Frame):
 
         sudoku = Sudoku(table, N)
         complexity_tracker = []
-        solutions = sudoku.solve(maximal_number_of_solutions=2, number_of_guesses_tracker=complexity_tracker)
+        try:
+            solutions = sudoku.solve(maximal_number_of_solutions=2, number_of_guesses_tracker=complexity_tracker,
+                                     rules=(),  # complexity in the puzzle bank counts guesses with naked singles only
+                                     deadline=time.monotonic() + 20)
+        except SearchBudgetExceeded:
+            text = "Could not check the puzzle within 20 seconds, would you like to play it anyway?"
+            if tk.messagebox.askyesno(message=text):
+                # The game looks for a solution on creation, which is bounded as well so the window cannot freeze.
+                try:
+                    new_game = SudokuGame(table, N=self.ui_settings.N, deadline=time.monotonic() + 20)
+                except SearchBudgetExceeded:
+                    tk.messagebox.showwarning(message='Could not find a solution of the puzzle within 20 seconds, '
+                                                      'try adding more numbers.')
+                    return None
+                self.parent.go_to_sudoku_solver(new_game)
+            return None
         if len(solutions) == 0:
             tk.messagebox.showwarning(message='The puzzle has no solutions, check it!')
             return None
         elif len(solutions) > 1:
-            all_ok = tk.messagebox.askyesno(message="The puzzle has multiple solutions, do you want to proceed?")
+            number_of_solutions, exact = solution_counter.count_solutions(
+                np.asarray(sudoku).ravel().tolist(), N, candidates=sudoku.candidate_masks().tolist(),
+                limits=SearchLimits(deadline=time.monotonic() + 5))
+            text = ("The puzzle has " + ("" if exact else "at least ") + str(number_of_solutions) +
+                    " solutions, do you want to proceed?")
+            all_ok = tk.messagebox.askyesno(message=text)
 
         if all_ok:
             if len(solutions) == 1 and self.create_sudoku_ui.include_new_game_in_the_puzzle_bank.get():
@@ -0,0 +1,194 @@
+# Precomputed board geometry of sudokus, shared by the solver engines.
+#
+# Cells are numbered in row-major order: cell = i * size + j for the cell with coordinates [i, j], where size is the
+# side of the board and the number of digits. Everything an engine needs to know about a board is derived from one
+# table, the list of its units (groups of size cells that hold every digit once): rows, columns, boxes of box_rows x
+# box_columns cells (square N x N boxes for standard sudokus, 2x3 boxes for 6x6 and 3x4 boxes for 12x12 boards) and
+# the extra units of variants such as diagonal sudoku and windoku. Peers, unit masks, box/line style intersections and
+# the ndarray tables of the numpy engine are computed from the units once per layout and cached, so engines can look
+# up units and peers of a cell without doing any arithmetic in their inner loops.
+#
+# A new variant only needs an entry in VARIANTS, a function returning its extra units. The engines that work from the
+# tables (bitmask_solver.py and the engines built on it, dlx_solver.py and the numpy engine of sudoku.py) accept a
+# Geometry wherever they take N.
+#
+# Does not (and should not) depend on any other project files.
+
+
+import functools
+import math
+
+import numpy as np
+
+
+def _diagonal_units(box_rows, box_columns) -> tuple:
+    """
+    :return: the two main diagonals of a board with boxes of box_rows x box_columns cells.
+    """
+    size = box_rows * box_columns
+    return (tuple(i * size + i for i in range(size)), tuple(i * size + size - 1 - i for i in range(size)))
+
+
+def _windoku_units(box_rows, box_columns) -> tuple:
+    """
+    :return: the windows of windoku: (N - 1)**2 extra N x N boxes, one cell away from the edges and from each other.
+    """
+    if box_rows != box_columns:
+        raise ValueError("Windoku needs square boxes, got " + str(box_rows) + "x" + str(box_columns))
+    N = box_rows
+    size = N * N
+    starts = [1 + k * (N + 1) for k in range(N - 1)]
+    return tuple(tuple((top + di) * size + left + dj for di in range(N) for dj in range(N))
+                 for top in starts for left in starts)
+
+
+# Extra units of sudoku variants: name -> function of (box_rows, box_columns) returning a tuple of cell tuples.
+VARIANTS = {'diagonal': _diagonal_units, 'windoku': _windoku_units}
+
+
+class Geometry:
+    """
+    Units and peers of a (size, size) sudoku with boxes of box_rows x box_columns cells and the extra units of its
+    variants. Use geometry(N) or layout(box_rows, box_columns, variants) rather than creating instances directly.
+    Attributes:
+        N: Side of the small square for square boxes (int). For rectangular boxes the square root of size (float),
+            only used to pick size dependent defaults of the engines.
+        box_rows, box_columns: int. Shape of the boxes.
+        variants: tuple of names from VARIANTS.
+        size: int. box_rows * box_columns, the side of the board and the number of digits.
+        number_of_cells: int. size**2.
+        row_of, column_of, box_of: tuples of length size**2, index of the row/column/box of each cell. Boxes are
+            numbered in row-major order.
+        rows, columns, boxes: tuples of size tuples of cells in each row/column/box.
+        extra_units: tuple of the units of the variants, tuples of size cells each.
+        units: rows + columns + boxes + extra_units.
+        cell_units: tuple of length size**2, tuple of the indices (in units) of the units of each cell, in increasing
+            order: the row, column and box of the cell, then its extra units.
+        peers: tuple of length size**2. peers[cell] is a tuple of all other cells that share a unit with cell.
+        full_mask: int. Bitmask with size lowest bits set (all digits possible).
+        unit_bits_of: tuple of length size**2. Bitmask over units (bit u for units[u]) of the units of each cell.
+        intersections: tuple of (segment, rest_of_first, rest_of_second) tuples of cells, one for every pair of units
+            sharing at least two cells (a box and a row or column crossing it, a diagonal and a box, ...). Used for
+            locked candidates (pointing and claiming).
+        intersection_unit_bits: tuple of bitmasks over units, the two units of each intersection.
+        peer_index: (size**2, P) intp ndarray, same as peers, where P is the largest number of peers of a cell. Rows
+            of cells with fewer peers (only in variants) repeat their first peer.
+        unit_membership: (len(units), size**2) int32 ndarray. unit_membership[unit, cell] = 1 if cell is in the unit,
+            else 0. Multiplying it by one-hot encoded values or possibilities gives per-unit digit counts.
+    """
+
+    def __init__(self, box_rows, box_columns=None, variants=()):
+        """
+        :param box_rows: int >= 1. Number of rows of a box, N for square boxes.
+        :param box_columns: None or int >= 1. Number of columns of a box, box_rows if None.
+        :param variants: iterable of names from VARIANTS.
+        """
+        if box_columns is None:
+            box_columns = box_rows
+        unknown_variants = set(variants) - set(VARIANTS)
+        if unknown_variants:
+            raise ValueError("Unknown sudoku variants " + str(sorted(unknown_variants)))
+        size = box_rows * box_columns
+        self.N = box_rows if box_rows == box_columns else math.sqrt(size)
+        self.box_rows = box_rows
+        self.box_columns = box_columns
+        self.variants = tuple(variants)
+        self.size = size
+        self.number_of_cells = size * size
+        self.full_mask = (1 << size) - 1
+
+        cells = range(self.number_of_cells)
+        boxes_per_row = size // box_columns
+        self.row_of = tuple(cell // size for cell in cells)
+        self.column_of = tuple(cell % size for cell in cells)
+        self.box_of = tuple((cell // size) // box_rows * boxes_per_row + (cell % size) // box_columns
+                            for cell in cells)
+
+        self.rows = tuple(tuple(cell for cell in cells if self.row_of[cell] == r) for r in range(size))
+        self.columns = tuple(tuple(cell for cell in cells if self.column_of[cell] == c) for c in range(size))
+        self.boxes = tuple(tuple(cell for cell in cells if self.box_of[cell] == b) for b in range(size))
+        self.extra_units = tuple(unit for variant in self.variants
+                                 for unit in VARIANTS[variant](box_rows, box_columns))
+        self.units = self.rows + self.columns + self.boxes + self.extra_units
+
+        units_of_cell = [[] for _ in cells]
+        for unit_number, unit in enumerate(self.units):
+            for cell in unit:
+                units_of_cell[cell].append(unit_number)
+        self.cell_units = tuple(tuple(cell_units) for cell_units in units_of_cell)
+        self.unit_bits_of = tuple(sum(1 << unit_number for unit_number in cell_units)
+                                  for cell_units in units_of_cell)
+
+        peers = []
+        for cell in cells:
+            cell_peers = set()
+            for unit_number in units_of_cell[cell]:
+                cell_peers.update(self.units[unit_number])
+            cell_peers.discard(cell)
+            peers.append(tuple(sorted(cell_peers)))
+        self.peers = tuple(peers)
+
+        intersections = []
+        intersection_unit_bits = []
+        unit_sets = [set(unit) for unit in self.units]
+        for first in range(len(self.units)):
+            for second in range(first + 1, len(self.units)):
+                segment = tuple(cell for cell in self.units[first] if cell in unit_sets[second])
+                if len(segment) >= 2 and len(segment) < size:
+                    intersections.append((segment,
+                                          tuple(cell for cell in self.units[first] if cell not in segment),
+                                          tuple(cell for cell in self.units[second] if cell not in segment)))
+                    intersection_unit_bits.append((1 << first) | (1 << second))
+        self.intersections = tuple(intersections)
+        self.intersection_unit_bits = tuple(intersection_unit_bits)
+
+        width = max(len(cell_peers) for cell_peers in self.peers)
+        self.peer_index = np.array([cell_peers + cell_peers[:1] * (width - len(cell_peers))
+                                    for cell_peers in self.peers], dtype=np.intp).reshape(self.number_of_cells, width)
+        self.unit_membership = np.zeros((len(self.units), self.number_of_cells), dtype=np.int32)
+        for unit_number, unit in enumerate(self.units):
+            self.unit_membership[unit_number, list(unit)] = 1
+
+    def __reduce__(self):
+        # Pickled as its layout, so that worker processes rebuild it from their own cache.
+        return layout, (self.box_rows, self.box_columns, self.variants)
+
+    def __repr__(self):
+        return "Geometry(" + str(self.box_rows) + "x" + str(self.box_columns) + " boxes, variants=" + \
+            str(self.variants) + ")"
+
+
+def layout(box_rows, box_columns=None, variants=()) -> Geometry:
+    """
+    :param box_rows: int >= 1. Number of rows of a box.
+    :param box_columns: None or int >= 1. Number of columns of a box, box_rows if None.
+    :param variants: iterable of names from VARIANTS, e.g. ('diagonal',).
+    :return: Geometry shared by all boards with this layout, however the arguments are spelled. Variants are kept in
+        sorted order, which also fixes the numbering of the extra units.
+    """
+    if box_columns is None:
+        box_columns = box_rows
+    variants = tuple(sorted(set(variants)))
+    if box_columns != box_rows or variants:
+        return _layout_geometry(box_rows, box_columns, variants)
+    return geometry(box_rows)
+
+
+@functools.lru_cache(maxsize=None)
+def _layout_geometry(box_rows, box_columns, variants) -> Geometry:
+    return Geometry(box_rows, box_columns, variants)
+
+
+@functools.lru_cache(maxsize=None)
+def _square_geometry(N) -> Geometry:
+    return Geometry(N)
+
+
+def geometry(N) -> Geometry:
+    """
+    :param N: int >= 1 (side of the small square) or a Geometry.
+    :return: Geometry shared by all boards of size (N**2, N**2), or N itself if it is a Geometry.
+    """
+    if isinstance(N, Geometry):
+        return N
+    return _square_geometry(N)
@@ -0,0 +1,470 @@
+# Template (pattern overlay) engine for 9x9 sudokus.
+#
+# In a solved 9x9 sudoku the cells holding one digit form a template: one cell in every row, column and box. There are
+# 46,656 templates, enumerated once and kept as a packed bit matrix of two uint64 words per template (bit k of word w
+# is cell 64 * w + k), stored word by word so that every operation runs over contiguous arrays. A board is solved digit
+# by digit: the templates of a digit are filtered against the givens with vectorized AND operations (a template must
+# not use a cell given another digit, a peer of a cell given the digit or a cell whose candidates exclude it, which also
+# forces it through the cells given the digit), and a solution is one template per digit such that the nine templates
+# are disjoint.
+# The search picks the digit with the fewest templates left, tries each of them, and filters the templates of the
+# other digits against it, again with a handful of vectorized operations. Between choices the templates are filtered
+# further with the template view of hidden and naked singles (see _propagate), and digits left with a single template
+# are placed. A branch is cut as soon as a digit has no template left or some cell is not covered by any template of
+# the digits still to place.
+#
+# Every node does a few NumPy operations per digit and no per-cell Python work, so the whole uniqueness check of a bank
+# puzzle takes a few milliseconds (about 3 ms on the median 9x9 bank puzzle, against about 0.6 ms for the bitmask
+# engine, which stays the default). Most puzzles are decided by propagation alone. count_solutions_batch decides a
+# whole stack of boards: the templates of every digit of every board are filtered against the givens together, with
+# array operations over chunks of boards (see digit_templates_batch), and only the search runs board by board.
+#
+# Boards are flat lists of 81 ints in row-major order, 0 for empty cells, same as in bitmask_solver.py.
+# Sudoku.solve(engine='template') wraps this module and keeps the output format of the original solver.
+#
+# Depends only on search_limits.py and sudoku_geometry.py.
+
+
+import functools
+import random
+import time
+
+import numpy as np
+
+from search_limits import SearchBudgetExceeded
+from sudoku_geometry import geometry
+
+SIZE = 9
+NUMBER_OF_CELLS = 81
+# Cell sets are packed into two words: cells 0-63 in the first, cells 64-80 in the second.
+WORDS = 2
+# Boards filtered together by digit_templates_batch. Each board needs a (9, 5184) uint64 array of clashes, and small
+# chunks keep them in cache.
+BATCH_CHUNK = 8
+
+
+def pack_cells(cells) -> [np.uint64]:
+    """
+    :param cells: iterable of flat cell indices.
+    :return: list of WORDS np.uint64 words with the bits of cells set.
+    """
+    words = [0] * WORDS
+    for cell in cells:
+        words[cell // 64] |= 1 << (cell % 64)
+    return [np.uint64(word) for word in words]
+
+
+@functools.lru_cache(maxsize=None)
+def templates() -> (np.ndarray, np.ndarray):
+    """
+    Enumerates all placements of one digit in a 9x9 sudoku, computed once.
+    :return: (bits, columns, through)
+        bits: (WORDS, 46656) uint64 ndarray, bits[w] is word w of the cells of each template packed as in pack_cells.
+        columns: (46656, 9) uint8 ndarray, the column of the template in each row.
+        through: (81, 5184) int32 ndarray, the indices of the templates that use each cell.
+    """
+    placements = []
+    columns = [0] * SIZE
+
+    def place(row, used_columns):
+        if row == SIZE:
+            placements.append(columns.copy())
+            return
+        # Rows of the same band have to use different stacks.
+        band_start = row - row % 3
+        used_stacks = {columns[band_row] // 3 for band_row in range(band_start, row)}
+        for column in range(SIZE):
+            if not used_columns >> column & 1 and column // 3 not in used_stacks:
+                columns[row] = column
+                place(row + 1, used_columns | 1 << column)
+
+    place(0, 0)
+    columns = np.array(placements, dtype=np.uint8)
+    cells = np.arange(SIZE) * SIZE + columns
+    bits = np.zeros((WORDS, len(columns)), dtype=np.uint64)
+    for word in range(WORDS):
+        in_word = cells // 64 == word
+        bits[word] = np.bitwise_or.reduce(
+            np.where(in_word, np.uint64(1) << (cells % 64).astype(np.uint64), np.uint64(0)), axis=1)
+    through = np.array([np.flatnonzero(columns[:, cell // SIZE] == cell % SIZE) for cell in range(NUMBER_OF_CELLS)],
+                       dtype=np.int32)
+    for table in (bits, columns, through):
+        table.setflags(write=False)
+    return bits, columns, through
+
+
+@functools.lru_cache(maxsize=None)
+def _peer_masks() -> [int]:
+    """
+    :return: [int] for every cell, the int bitmask over cells of its peers (cells sharing a row, column or box).
+    """
+    masks = []
+    for cell in range(NUMBER_OF_CELLS):
+        row, column = divmod(cell, SIZE)
+        box_row, box_column = row - row % 3, column - column % 3
+        mask = 0
+        for other in range(SIZE):
+            mask |= 1 << (row * SIZE + other) | 1 << (other * SIZE + column)
+            mask |= 1 << ((box_row + other // 3) * SIZE + box_column + other % 3)
+        masks.append(mask & ~(1 << cell))
+    return masks
+
+
+def digit_templates(board, candidates=None) -> [np.ndarray]:
+    """
+    :param board: flat sequence of 81 ints, 0 for empty cells.
+    :param candidates: None or flat sequence of 81 int bitmasks restricting the candidates of each cell.
+    :return: list of 9 int ndarrays, the indices (into templates()) of the templates of each digit that agree with the
+        givens and candidates of board.
+    """
+    bits, _, through = templates()
+    peer_masks = _peer_masks()
+    # Cells forbidden for each digit and cells given each digit as int bitmasks over cells, and one cell given each
+    # digit (-1 if none).
+    forbidden = [0] * (SIZE + 1)
+    given = [0] * (SIZE + 1)
+    given_cell = [-1] * (SIZE + 1)
+    for cell, value in enumerate(board):
+        value = int(value)
+        if value:
+            forbidden[value] |= peer_masks[cell]
+            given[value] |= 1 << cell
+            given_cell[value] = cell
+        if candidates is not None:
+            mask = int(candidates[cell])
+            for digit in range(1, SIZE + 1):
+                if not mask >> (digit - 1) & 1:
+                    forbidden[digit] |= 1 << cell
+    result = []
+    word_mask = (1 << 64) - 1
+    for digit in range(1, SIZE + 1):
+        cells = forbidden[digit]
+        for other_digit in range(1, SIZE + 1):
+            if other_digit != digit:
+                cells |= given[other_digit]
+        # Templates of a given digit have to go through its given cells, so only those through one of them are tested.
+        indices = through[given_cell[digit]] if given_cell[digit] >= 0 else None
+        clash = None
+        for word in range(WORDS):
+            word_cells = np.uint64(cells >> (64 * word) & word_mask)
+            word_bits = bits[word] if indices is None else bits[word, indices]
+            clash = word_bits & word_cells if clash is None else clash | word_bits & word_cells
+        agree = np.flatnonzero(clash == 0)
+        result.append(agree if indices is None else indices[agree].astype(np.intp))
+    return result
+
+
+def digit_templates_batch(boards, candidates=None) -> [[np.ndarray]]:
+    """
+    Same as digit_templates for a stack of boards. The cells forbidden for each digit are computed for all boards at
+    once, and the templates of all given digits of BATCH_CHUNK boards are tested against them with one AND per word.
+    :param boards: (M, 81) int ndarray, 0 for empty cells.
+    :param candidates: None or (M, 81) int ndarray of bitmasks restricting the candidates of each cell.
+    :return: list of M lists of 9 int ndarrays, the indices of the templates of each digit of each board.
+    """
+    bits, _, through = templates()
+    through_bits = _through_bits()
+    boards = np.asarray(boards, dtype=np.intp)
+    digits = np.arange(1, SIZE + 1)
+    given = boards[:, None, :] == digits[None, :, None]  # (M, 9, 81): cell given the digit
+    forbidden = (given.astype(np.float32) @ _peer_matrix()) > 0
+    forbidden |= (boards != 0)[:, None, :] & ~given
+    if candidates is not None:
+        candidates = np.asarray(candidates, dtype=np.int64)
+        forbidden |= (candidates[:, None, :] >> (digits[None, :, None] - 1) & 1) == 0
+    # Packing the 81 cells little-endian into 16 bytes gives the WORDS words of pack_cells.
+    packed = np.zeros(forbidden.shape[:2] + (8 * WORDS,), dtype=np.uint8)
+    packed[:, :, :(NUMBER_OF_CELLS + 7) // 8] = np.packbits(forbidden, axis=2, bitorder='little')
+    forbidden_words = packed.view('<u8')
+
+    # As in digit_templates, the templates of a given digit only have to be tested if they go through one of its given
+    # cells. Digits without givens are tested against all templates.
+    has_given = given.any(axis=2)
+    given_cell = given.argmax(axis=2)
+    result = []
+    for start in range(0, len(boards), BATCH_CHUNK):
+        chunk = forbidden_words[start:start + BATCH_CHUNK]
+        chunk_given_cells = given_cell[start:start + BATCH_CHUNK]
+        clash = through_bits[0][chunk_given_cells] & chunk[:, :, 0, None]
+        for word in range(1, WORDS):
+            clash |= through_bits[word][chunk_given_cells] & chunk[:, :, word, None]
+        agree = clash == 0
+        for board_number in range(len(chunk)):
+            board_templates = []
+            for digit in range(SIZE):
+                if has_given[start + board_number, digit]:
+                    board_templates.append(through[chunk_given_cells[board_number, digit]][agree[board_number, digit]]
+                                           .astype(np.intp))
+                else:
+                    word_clash = bits[0] & chunk[board_number, digit, 0]
+                    for word in range(1, WORDS):
+                        word_clash |= bits[word] & chunk[board_number, digit, word]
+                    board_templates.append(np.flatnonzero(word_clash == 0))
+            result.append(board_templates)
+    return result
+
+
+@functools.lru_cache(maxsize=None)
+def _peer_matrix() -> np.ndarray:
+    """
+    :return: (81, 81) float32 ndarray, 1 where two cells are peers.
+    """
+    matrix = np.zeros((NUMBER_OF_CELLS, NUMBER_OF_CELLS), dtype=np.float32)
+    for cell, mask in enumerate(_peer_masks()):
+        matrix[cell] = [mask >> other & 1 for other in range(NUMBER_OF_CELLS)]
+    matrix.setflags(write=False)
+    return matrix
+
+
+@functools.lru_cache(maxsize=None)
+def _through_bits() -> np.ndarray:
+    """
+    :return: (WORDS, 81, 5184) uint64 ndarray, the packed words of the templates through each cell, in the order of
+        templates()[2]. Rows are contiguous, so the templates through many cells are gathered row by row.
+    """
+    bits, _, through = templates()
+    through_bits = np.ascontiguousarray(bits[:, through])
+    through_bits.setflags(write=False)
+    return through_bits
+
+
+def _solution(chosen, board_columns) -> [int]:
+    """
+    :param chosen: iterable of (digit, template index) of all nine digits.
+    :return: [int] flat list of the 81 values.
+    """
+    solution = [0] * NUMBER_OF_CELLS
+    for digit, template in chosen:
+        for row, column in enumerate(board_columns[template]):
+            solution[row * SIZE + column] = digit
+    return solution
+
+
+def solve(board, N, maximal_number_of_solutions=1, random_state=None, number_of_guesses_tracker=None,
+          candidates=None, known_solution=None, stats=None, limits=None):
+    """
+    Finds solutions of a 9x9 sudoku by combining digit templates. Templates of the branching digit are tried in random
+    order.
+    :param board: flat sequence of 81 ints, 0 for empty cells.
+    :param N: int or sudoku_geometry.Geometry. Has to describe a standard 9x9 sudoku (N=3).
+    :param maximal_number_of_solutions: int >= 1 or 'all'.
+    :param random_state: None or int for deterministic behaviour.
+    :param number_of_guesses_tracker: None or []. Same meaning as in Sudoku.solve: for each solution, the number of
+        choices on its path that still had untried alternatives.
+    :param candidates: None or flat sequence of 81 int bitmasks restricting the candidates of each cell.
+    :param known_solution: None or flat sequence of 81 values of a solution of board. Its templates are tried last, so
+        the known solution is the last one found, and the first solution found differs from it unless the solution is
+        unique.
+    :param stats: None or SolverStats. Records nodes (choices between several templates), backtracks, max_depth,
+        total_time and guesses_per_solution.
+    :param limits: None or SearchLimits, checked before every choice between several templates. If a limit is hit,
+        raises SearchBudgetExceeded with the solutions found so far.
+    :return: [[int]] list of solutions, each a flat list of 81 values.
+    """
+    board_geometry = geometry(N)
+    if (board_geometry.box_rows, board_geometry.box_columns) != (3, 3) or board_geometry.variants:
+        raise ValueError("The template engine only solves standard 9x9 sudokus (N=3), got " + str(board_geometry))
+    if maximal_number_of_solutions != 'all' and maximal_number_of_solutions < 1:
+        return []
+    start_time = time.perf_counter()
+    answers = _search(digit_templates(board, candidates), maximal_number_of_solutions, random_state,
+                      number_of_guesses_tracker, known_solution, stats, limits)
+    if stats is not None:
+        stats.total_time += time.perf_counter() - start_time
+    return answers
+
+
+def _search(templates_of_digits, maximal_number_of_solutions, random_state, number_of_guesses_tracker,
+            known_solution, stats, limits):
+    """
+    The search of solve, starting from the templates of each digit that agree with the board.
+    :param templates_of_digits: list of 9 int ndarrays, as returned by digit_templates.
+    Other parameters and the return value are the same as in solve, except that stats.total_time is left to the caller.
+    """
+    bits, board_columns, _ = templates()
+    rng = random.Random(random_state)
+    known_templates = None
+    if known_solution is not None:
+        known_templates = {}
+        for digit in range(1, SIZE + 1):
+            known = pack_cells(cell for cell, value in enumerate(known_solution) if int(value) == digit)
+            matches = bits[0] == known[0]
+            for word in range(1, WORDS):
+                matches &= bits[word] == known[word]
+            known_templates[digit] = int(np.flatnonzero(matches)[0])
+
+    answers = []
+    nodes = 0
+    # A state is (remaining, occupied, placed): remaining maps each digit still to place to its templates that are
+    # disjoint from the ones placed so far (see _propagate), occupied is the int bitmask of the cells of the placed
+    # templates and placed maps the placed digits to their templates. None for a dead end.
+    state = _propagate({digit: (indices, [bits[word, indices] for word in range(WORDS)])
+                        for digit, indices in enumerate(templates_of_digits, start=1)}, 0, {})
+    frames = []  # [state, digit, templates of digit in the order they are tried, index of the current one]
+
+    while True:
+        dead_end = False
+        if state is None:
+            dead_end = True
+        elif not state[0]:
+            solution = _solution(state[2].items(), board_columns)
+            answers.append(solution)
+            guesses = sum(1 for frame in frames if frame[3] < len(frame[2]) - 1)
+            if number_of_guesses_tracker is not None:
+                number_of_guesses_tracker.append(guesses)
+            if stats is not None:
+                stats.guesses_per_solution.append(guesses)
+            if maximal_number_of_solutions != 'all' and len(answers) >= maximal_number_of_solutions:
+                break
+            dead_end = True
+        else:
+            remaining = state[0]
+            digit = min(remaining, key=lambda remaining_digit: remaining[remaining_digit][0].size)
+            order = remaining[digit][0].tolist()
+            if not order:
+                dead_end = True
+            elif len(order) > 1:
+                if limits is not None:
+                    reason = limits.exceeded(nodes)
+                    if reason is not None:
+                        raise SearchBudgetExceeded(reason, answers)
+                nodes += 1
+                rng.shuffle(order)
+                if known_templates is not None:
+                    order.sort(key=lambda template: template == known_templates[digit])
+                if stats is not None:
+                    stats.nodes += 1
+                    stats.max_depth = max(stats.max_depth, len(frames) + 1)
+            if not dead_end:
+                frames.append([state, digit, order, 0])
+                state = _place(state, digit, order[0], bits)
+
+        if dead_end:
+            while frames:
+                frame = frames[-1]
+                frame[3] += 1
+                if frame[3] < len(frame[2]):
+                    if stats is not None:
+                        stats.backtracks += 1
+                    state = _place(frame[0], frame[1], frame[2][frame[3]], bits)
+                    break
+                frames.pop()
+            else:
+                break
+    return answers
+
+
+def count_solutions_batch(boards, limit=2, candidates=None) -> np.ndarray:
+    """
+    Counts the solutions of many 9x9 boards, e.g. the puzzles of a bank, up to limit each. The templates of all boards
+    are filtered together with digit_templates_batch, then each board is searched from its templates.
+    :param boards: (M, 9, 9) or (M, 81) array-like, 0 for empty cells.
+    :param limit: int >= 1. Counting stops at limit, so limit=2 is a uniqueness test: 0 for no solution, 1 for a unique
+        solution, 2 for several.
+    :param candidates: None or (M, 81) array-like of int bitmasks restricting the candidates of each cell.
+    :return: (M,) int ndarray of the capped numbers of solutions.
+    """
+    boards = np.asarray(boards).reshape(-1, NUMBER_OF_CELLS)
+    if candidates is not None:
+        candidates = np.asarray(candidates).reshape(-1, NUMBER_OF_CELLS)
+    counts = [len(_search(templates_of_digits, limit, None, None, None, None, None))
+              for templates_of_digits in digit_templates_batch(boards, candidates)]
+    return np.array(counts, dtype=int)
+
+
+def _place(state, digit, template, bits):
+    """
+    :param state: (remaining, occupied, placed), see solve.
+    :param digit: int. Digit placed with template.
+    :param template: int. Index of the template in templates().
+    :return: state after placing the template and propagating, see _propagate. None if that is a dead end.
+    """
+    remaining, occupied, placed_templates = state
+    placed_templates = dict(placed_templates)
+    placed_templates[digit] = template
+    placed = [bits[word, template] for word in range(WORDS)]
+    new_remaining = {}
+    for other_digit, (indices, words) in remaining.items():
+        if other_digit == digit:
+            continue
+        clash = words[0] & placed[0]
+        for word in range(1, WORDS):
+            clash |= words[word] & placed[word]
+        disjoint = clash == 0
+        if not disjoint.all():
+            indices = indices[disjoint]
+            if indices.size == 0:
+                return None
+            words = [word_bits[disjoint] for word_bits in words]
+        new_remaining[other_digit] = (indices, words)
+    return _propagate(new_remaining, occupied | _cells(placed), placed_templates)
+
+
+def _cells(words) -> int:
+    """
+    :param words: WORDS packed words of a cell set.
+    :return: int bitmask over cells of the same set.
+    """
+    cells = 0
+    for word in range(WORDS):
+        cells |= int(words[word]) << (64 * word)
+    return cells
+
+
+def _propagate(remaining, occupied, placed):
+    """
+    Filters the templates of the digits still to place until a fixpoint: a cell that only one digit can still cover
+    has to be covered by it, and a cell that every template of a digit covers can not be covered by any other digit.
+    These are the hidden and naked singles of the template view. Digits left with a single template are placed.
+    :param remaining: dict from digits still to place to (indices, words): indices of their templates in templates()
+        and the WORDS packed words of these templates. Modified in place.
+    :param occupied: int bitmask over cells of the templates placed so far.
+    :param placed: dict from placed digits to their templates. Modified in place.
+    :return: (remaining, occupied, placed), or None if a digit is left without templates or a free cell can not be
+        covered.
+    """
+    full = (1 << NUMBER_OF_CELLS) - 1
+    word_mask = (1 << 64) - 1
+    while True:
+        unions = {}
+        commons = {}
+        once = 0  # cells covered by the templates of at least one digit
+        twice = 0  # cells covered by the templates of at least two digits
+        for digit, (indices, words) in remaining.items():
+            union = 0
+            common = 0
+            for word in range(WORDS):
+                union |= int(np.bitwise_or.reduce(words[word])) << (64 * word)
+                common |= int(np.bitwise_and.reduce(words[word])) << (64 * word)
+            unions[digit] = union
+            commons[digit] = common
+            twice |= once & union
+            once |= union
+        if (occupied | once) != full:
+            return None
+        only_one = once & ~twice
+        all_commons = 0
+        for common in commons.values():
+            all_commons |= common
+        changed = False
+        for digit, (indices, words) in remaining.items():
+            required = only_one & unions[digit] & ~commons[digit]
+            blocked = (all_commons & ~commons[digit]) & unions[digit]
+            if not required and not blocked:
+                continue
+            keep = None
+            for word in range(WORDS):
+                word_required = np.uint64(required >> (64 * word) & word_mask)
+                word_blocked = np.uint64(blocked >> (64 * word) & word_mask)
+                word_keep = (words[word] & (word_required | word_blocked)) == word_required
+                keep = word_keep if keep is None else keep & word_keep
+            indices = indices[keep]
+            if indices.size == 0:
+                return None
+            remaining[digit] = (indices, [word_bits[keep] for word_bits in words])
+            changed = True
+        if not changed:
+            for digit in [digit for digit, (indices, words) in remaining.items() if indices.size == 1]:
+                placed[digit] = int(remaining.pop(digit)[0][0])
+                occupied |= unions[digit]
+            return remaining, occupied, placed
@@ -3,9 +3,31 @@
 # TODO: add more relevant tests so that changing implementations in the future is easy.
 
 
+import concurrent.futures
+import copy
+import time
+import pickle
+import random
+import threading
 import unittest
 from sudoku import Sudoku
+from sudoku_board import Board
+from sudoku_game import SudokuGame
 import puzzle_generator
+import sudoku_game
+import all_different
+import bitmask_solver
+import learning_solver
+import parallel_solver
+import portfolio_solver
+import batch_solver
+import board_validator
+import solution_counter
+import sudoku_geometry
+import template_solver
+from solver_stats import SolverStats
+from search_limits import CancellationToken, SearchBudgetExceeded, SearchLimits
+import numpy as np
 
 
 class SudokuClassTest(unittest.TestCase):
@@ -91,8 +113,718 @@ class SudokuClassTest(unittest.TestCase):
 
         self.assertTrue(sudoku.can_remove_positions([(3, 0), (3, 2), (2, 1), (2, 3)]))
 
+    def test_uniqueness_with_known_solution(self):
+        for sudoku in [self.test_sudokus[0], self.test_sudokus[2]]:
+            known_solution = sudoku.solve()[0]
+            positions = np.argwhere(np.asarray(sudoku) != 0).tolist()
+            for number_of_positions in [0, 1, 2, 4, len(positions)]:
+                for start in range(0, len(positions), 5):
+                    removed = (positions[start:] + positions[:start])[:number_of_positions]
+                    self.assertEqual(sudoku.can_remove_positions(removed),
+                                     sudoku.can_remove_positions(removed, known_solution=known_solution))
+
+        for engine in ['bitmask', 'dlx']:
+            sudoku = self.test_sudokus[1]
+            known_solution = sudoku.solve(random_state=0)[0]
+            self.assertFalse(sudoku.has_unique_solution(engine=engine, known_solution=known_solution))
+            other_solution = sudoku.solve(engine=engine, known_solution=known_solution.ravel().tolist())[0]
+            self.assertFalse(np.array_equal(other_solution, known_solution))
+            sudoku = self.test_sudokus[0]
+            self.assertTrue(sudoku.has_unique_solution(engine=engine, known_solution=sudoku.solve()[0]))
+
     def test_number_of_solutions(self):
-        pass
+        self.assertEqual(self.test_sudokus[0].count_solutions(), 1)
+        self.assertEqual(self.test_sudokus[1].count_solutions(), 4)
+        self.assertEqual(self.test_sudokus[1].count_solutions(limit=2), 2)
+        self.assertEqual(Sudoku(np.zeros((4, 4)), N=2).count_solutions(), 288)
+
+        sudoku = self.test_sudokus[1]
+        expected = sudoku.solve(maximal_number_of_solutions='all', random_state=1)
+        solutions = list(sudoku.iter_solutions(random_state=1))
+        self.assertEqual(len(solutions), len(expected))
+        for solution, expected_solution in zip(solutions, expected):
+            self.assertEqual(solution.shape, (16, 16))
+            self.assertTrue(np.array_equal(solution, expected_solution))
+
+        # Stopping early must not search the rest of the tree.
+        first = next(Sudoku(np.zeros((9, 9)), N=3).iter_solutions(random_state=0))
+        self.assertTrue(Sudoku(first, N=3).check())
+
+        # Games keep at most MAXIMAL_NUMBER_OF_STORED_SOLUTIONS solutions and count the rest.
+        game = SudokuGame(self.test_boards[1], N=4, allow_multiple_solutions=True)
+        self.assertEqual((len(game.solutions), game.solutions_capped, game.number_of_solutions()), (4, False, 4))
+        board = np.array(puzzle_generator.generate_solved_sudoku(N=3, random_state=3))
+        board[:4] = 0
+        game = SudokuGame(board, N=3, allow_multiple_solutions=True)
+        self.assertEqual(len(game.solutions), sudoku_game.MAXIMAL_NUMBER_OF_STORED_SOLUTIONS)
+        self.assertTrue(game.solutions_capped)
+        self.assertEqual(game.number_of_solutions(), Sudoku(board, N=3).count_solutions(engine='counting'))
+        self.assertGreater(game.number_of_solutions(), sudoku_game.MAXIMAL_NUMBER_OF_STORED_SOLUTIONS)
+
+    def test_solution_counter(self):
+        for sudoku in self.test_sudokus:
+            self.assertEqual(sudoku.count_solutions(engine='counting'), sudoku.count_solutions())
+        empty = Sudoku(np.zeros((4, 4)), N=2)
+        self.assertEqual(empty.count_solutions(engine='counting'), 288)
+        self.assertEqual(empty.count_solutions(engine='counting', limit=5), 5)
+        contradictory = np.array(self.test_boards[0])
+        contradictory[0, 0] = 2
+        self.assertEqual(solution_counter.count_solutions(contradictory.ravel().tolist(), 3), (0, True))
+
+        board = np.array(puzzle_generator.generate_solved_sudoku(N=3, random_state=3))
+        board[6:] = 0
+        board[:, :2] = 0
+        expected = Sudoku(board, N=3).count_solutions()
+        for cache_size in [0, 10, solution_counter.DEFAULT_CACHE_SIZE]:
+            counter = solution_counter.SolutionCounter(3, cache_size=cache_size)
+            self.assertEqual(counter.count(board.ravel().tolist()), (expected, True))
+            self.assertLessEqual(len(counter.cache), cache_size)
+        self.assertGreater(counter.cache_hits, 0)
+
+        count, exact = solution_counter.count_solutions(board.ravel().tolist(), 3, limits=SearchLimits(node_limit=20))
+        self.assertFalse(exact)
+        self.assertLess(count, expected)
+        with self.assertRaises(SearchBudgetExceeded):
+            Sudoku(board, N=3).count_solutions(engine='counting', node_limit=20)
+
+    def test_full_simplify_propagates_singles(self):
+        sudoku = self.test_sudokus[0]
+        sudoku.full_simplify(initial_simplification=True)
+        self.assertTrue(sudoku.solved())
+        self.assertTrue(sudoku.check())
+        self.assertTrue((sudoku.number_of_possibilities() == 1).all())
+
+        sudoku = self.test_sudokus[2]
+        sudoku.set_point([0, 0], 1)
+        self.assertFalse(sudoku.possibilities[0, 1:, 1].any())
+        self.assertFalse(sudoku.possibilities[1:, 0, 1].any())
+        self.assertFalse(sudoku.possibilities[1, 1, 1])
+        self.assertTrue(sudoku.possibilities[1, 2, 1])
+
+    def test_candidate_counts_follow_possibilities(self):
+        for sudoku in self.test_sudokus:
+            copied = copy.copy(sudoku)
+            copied.full_simplify(initial_simplification=True)
+            self.assertTrue((copied.number_of_possibilities() == copied.possibilities.sum(axis=2)).all())
+            self.assertTrue((sudoku.number_of_possibilities() == sudoku.possibilities.sum(axis=2)).all())
+            for solution in sudoku.solve(maximal_number_of_solutions='all', engine='numpy', random_state=0):
+                self.assertTrue((solution.number_of_possibilities() == 1).all())
+
+        # Two singles of the same unit with the same value: both cells are left without possibilities.
+        sudoku = Sudoku(np.zeros((4, 4), dtype=int), N=2)
+        sudoku._set_cells(np.array([0, 1]), np.array([3, 3]))
+        self.assertEqual(sudoku.number_of_possibilities()[0].tolist(), [0, 0, 3, 3])
+        self.assertTrue((sudoku.number_of_possibilities() == sudoku.possibilities.sum(axis=2)).all())
+
+    def test_engines_match_numpy_engine(self):
+        for sudoku in self.test_sudokus:
+            numpy_solutions = sudoku.solve(maximal_number_of_solutions='all', engine='numpy')
+            guesses = []
+            bitmask_solutions = sudoku.solve(maximal_number_of_solutions='all', engine='bitmask',
+                                             number_of_guesses_tracker=guesses)
+            self.assertEqual(sorted(solution.tobytes() for solution in numpy_solutions),
+                             sorted(solution.tobytes() for solution in bitmask_solutions))
+            dlx_solutions = sudoku.solve(maximal_number_of_solutions='all', engine='dlx')
+            self.assertEqual(sorted(solution.tobytes() for solution in numpy_solutions),
+                             sorted(solution.tobytes() for solution in dlx_solutions))
+            self.assertEqual(len(guesses), len(bitmask_solutions))
+            for solution in bitmask_solutions:
+                self.assertTrue(solution.check())
+                self.assertTrue((solution.number_of_possibilities() == 1).all())
+        self.assertEqual(len(self.test_sudokus[1].solve(maximal_number_of_solutions='all')), 4)
+
+    def test_dlx_engine(self):
+        for engine in ['dlx', 'bitmask']:
+            self.assertTrue(self.test_sudokus[0].has_unique_solution(engine=engine))
+            self.assertFalse(self.test_sudokus[1].has_unique_solution(engine=engine))
+            self.assertFalse(self.test_sudokus[2].can_remove_positions([(3, 0), (3, 1)], engine=engine))
+
+        guesses = []
+        solutions = self.test_sudokus[1].solve(maximal_number_of_solutions=2, engine='dlx', random_state=0,
+                                               number_of_guesses_tracker=guesses)
+        self.assertEqual(len(guesses), 2)
+        self.assertGreater(guesses[1], 0)  # a second solution can only be found after a guess
+
+        contradictory = Sudoku([[1, 1, 0, 0], [0, 0, 0, 0], [0, 0, 0, 0], [0, 0, 0, 0]], N=2)
+        self.assertEqual(contradictory.solve(engine='dlx'), [])
+
+    def test_propagation_rules(self):
+        all_solutions = sorted(solution.tobytes() for solution in
+                               self.test_sudokus[1].solve(maximal_number_of_solutions='all', rules=()))
+        for rule in bitmask_solver.ALL_RULES:
+            solutions = self.test_sudokus[1].solve(maximal_number_of_solutions='all', rules=(rule,))
+            self.assertEqual(all_solutions, sorted(solution.tobytes() for solution in solutions))
+
+        # Hidden single: 1 can only go to the top left cell of the first box.
+        state = bitmask_solver.BitmaskState.from_board([0, 0, 0, 0, 0, 0, 1, 0, 0, 1, 0, 0, 0, 0, 0, 0], N=2)
+        self.assertTrue(state.propagate([bitmask_solver.HIDDEN_SINGLES]))
+        self.assertEqual(state.values[0], 1)
+
+        # Dead unit: 1 has no place in the first row.
+        for rules, consistent in [([bitmask_solver.HIDDEN_SINGLES], True), ([bitmask_solver.DEAD_UNITS], False)]:
+            state = bitmask_solver.BitmaskState.from_board([0] * 16, N=2)
+            for cell in range(4):
+                state.eliminate(cell, 1)
+            self.assertEqual(state.propagate(rules), consistent)
+
+        # Naked pair {1, 2} in the first row removes 1 and 2 from the rest of the row.
+        state = bitmask_solver.BitmaskState.from_board([0] * 16, N=2)
+        state.candidates[0] = state.candidates[1] = 0b0011
+        self.assertTrue(state.propagate([bitmask_solver.NAKED_SUBSETS]))
+        self.assertEqual(state.candidates[2] & 0b0011, 0)
+        self.assertEqual(state.candidates[3] & 0b0011, 0)
+
+        # Pointing: 1 of the first box can only be in the first row, so it is removed from the rest of the row.
+        state = bitmask_solver.BitmaskState.from_board([0] * 16, N=2)
+        state.eliminate(4, 1)
+        state.eliminate(5, 1)
+        self.assertTrue(state.propagate([bitmask_solver.LOCKED_CANDIDATES]))
+        self.assertEqual(state.candidates[2] & 1, 0)
+        self.assertEqual(state.candidates[3] & 1, 0)
+
+        # Failed literal: setting 1 in the top left cell leaves 3 as the only candidate of the next two cells.
+        for trail, stats in [(None, None), ([], SolverStats())]:
+            state = bitmask_solver.BitmaskState.from_board([0] * 16, N=2)
+            state.trail = trail
+            state.candidates[0] = 0b0011
+            state.candidates[1] = state.candidates[2] = 0b0101
+            self.assertTrue(state.propagate([bitmask_solver.FAILED_LITERALS], stats))
+            self.assertEqual(state.values[0], 2)
+            self.assertIs(state.trail, trail)
+        self.assertGreater(stats.eliminations[bitmask_solver.FAILED_LITERALS], 0)
+        probed = self.test_sudokus[1].solve(
+            maximal_number_of_solutions='all', rules=bitmask_solver.DEFAULT_RULES + (bitmask_solver.FAILED_LITERALS,),
+            probe_budget=1000, probe_depth=100)
+        self.assertEqual(all_solutions, sorted(solution.tobytes() for solution in probed))
+
+        # All-different: {1, 2} are taken by the first two cells of the first row, so the others are left with 3 and 4.
+        stats = SolverStats()
+        state = bitmask_solver.BitmaskState.from_board([0] * 16, N=2)
+        state.trail = []
+        state.candidates[0] = state.candidates[1] = 0b0011
+        self.assertTrue(state.propagate([bitmask_solver.ALL_DIFFERENT], stats))
+        self.assertEqual(state.candidates[2], 0b1100)
+        self.assertEqual(state.candidates[3], 0b1100)
+        self.assertGreater(stats.eliminations[bitmask_solver.ALL_DIFFERENT], 0)
+        self.assertEqual(state.copy().matchings, state.matchings)
+        self.assertIsNot(state.copy().matchings[0], state.matchings[0])
+        self.assertEqual(all_different.filter_unit([0b011, 0b011, 0b111], [0, 0, 0]), [0b011, 0b011, 0b100])
+        self.assertIsNone(all_different.filter_unit([0b001, 0b001, 0b110], [0, 0, 0]))
+        # Stale matchings (a digit that is no longer a candidate, a digit matched twice) are repaired.
+        matching = [0b100, 0b001, 0b001]
+        self.assertEqual(all_different.filter_unit([0b011, 0b011, 0b111], matching), [0b011, 0b011, 0b100])
+        self.assertEqual(sorted(matching), [0b001, 0b010, 0b100])
+        self.assertEqual(bitmask_solver.default_rules(3), bitmask_solver.DEFAULT_RULES)
+        self.assertIn(bitmask_solver.ALL_DIFFERENT, bitmask_solver.default_rules(bitmask_solver.ALL_DIFFERENT_MIN_N))
+
+        with self.assertRaises(ValueError):
+            self.test_sudokus[0].solve(rules=('unknown_rule',))
+
+    def test_layouts_and_variants(self):
+        six = sudoku_geometry.layout(2, 3)
+        self.assertEqual((six.size, len(six.units)), (6, 18))
+        self.assertEqual(six.boxes[1], (3, 4, 5, 9, 10, 11))
+        diagonal = sudoku_geometry.layout(3, 3, ('diagonal',))
+        windoku = sudoku_geometry.layout(3, 3, ('windoku',))
+        self.assertEqual(diagonal.extra_units[1][:3], (8, 16, 24))
+        self.assertEqual(windoku.extra_units[0], (10, 11, 12, 19, 20, 21, 28, 29, 30))
+        self.assertIs(sudoku_geometry.layout(3), sudoku_geometry.geometry(3))
+        self.assertIs(pickle.loads(pickle.dumps(windoku)), windoku)
+        both = sudoku_geometry.layout(3, 3, ('diagonal', 'windoku'))
+        self.assertIs(sudoku_geometry.layout(3, 3, ['windoku', 'diagonal', 'windoku']), both)
+        self.assertIs(sudoku_geometry.layout(3, None, ()), sudoku_geometry.layout(3, 3))
+        with self.assertRaises(ValueError):
+            sudoku_geometry.layout(3, 3, ('unknown',))
+        with self.assertRaises(ValueError):
+            sudoku_geometry.layout(2, 3, ('windoku',))
+
+        rng = random.Random(0)
+        for board_layout in [six, sudoku_geometry.layout(3, 4), diagonal, windoku]:
+            size = board_layout.size
+            full = bitmask_solver.solve([0] * size * size, board_layout, random_state=0)[0]
+            for unit in board_layout.units:
+                self.assertEqual(sorted(full[cell] for cell in unit), list(range(1, size + 1)))
+            board = list(full)
+            for cell in rng.sample(range(size * size), size * size * 3 // 5):
+                board[cell] = 0
+            sudoku = Sudoku(np.reshape(board, (size, size)), board_layout)
+            all_solutions = sorted(solution.tobytes() for solution in
+                                   sudoku.solve(maximal_number_of_solutions='all', rules=()))
+            self.assertIn(np.array(full, dtype='int16').tobytes(), all_solutions)
+            for engine, options in [('bitmask', {'rules': bitmask_solver.ALL_RULES}), ('dlx', {}), ('learning', {}),
+                                    ('numpy', {}), ('bitmask', {'branching': bitmask_solver.MRV_DEGREE}),
+                                    ('bitmask', {'branching': bitmask_solver.DOM_WDEG}),
+                                    ('learning', {'branching': bitmask_solver.DOM_WDEG})]:
+                solutions = sudoku.solve(maximal_number_of_solutions='all', engine=engine, **options)
+                self.assertEqual(all_solutions, sorted(solution.tobytes() for solution in solutions))
+                self.assertTrue(all(solution.check() for solution in solutions))
+            self.assertEqual(sudoku.count_solutions(engine='counting'), len(all_solutions))
+            counts = batch_solver.solve_batch(np.reshape(board, (1, size, size)), max_solutions='all',
+                                              N=board_layout)[1]
+            self.assertEqual(counts.tolist(), [len(all_solutions)])
+
+        # Branching heuristics count the extra units of variants: MRV_DEGREE breaks ties by the filled cells in all
+        # units of a cell, and DOM_WDEG weighs the diagonals of failed guesses too.
+        full = bitmask_solver.solve([0] * 81, diagonal, random_state=1)[0]
+        for _ in range(20):
+            board = [value if rng.random() < 0.3 else 0 for value in full]
+            state = bitmask_solver.BitmaskState.from_board(board, diagonal)
+            cell = state.select_cell(branching=bitmask_solver.MRV_DEGREE)
+            if cell < 0:
+                continue
+            empty = [other for other in range(81) if not state.values[other]]
+
+            def key(other):
+                filled = sum(1 for unit in diagonal.cell_units[other] for peer in diagonal.units[unit]
+                             if state.values[peer])
+                return bin(state.candidates[other]).count('1'), filled
+            self.assertEqual(key(cell), min(key(other) for other in empty))
+        search = bitmask_solver.Search([0] * 81, diagonal, branching=bitmask_solver.DOM_WDEG)
+        search._add_conflict(search.state, 0)
+        # The row, column, box and main diagonal of cell 0 gain weight.
+        self.assertEqual([weight for weight in search.unit_weights if weight > 1], [2] * 4)
+        self.assertEqual(search.unit_weights[-2:], [2, 1])
+
+        # Boards hold grids of other layouts as well.
+        full = bitmask_solver.solve([0] * 36, six, random_state=0)[0]
+        board = pickle.loads(pickle.dumps(Board(np.reshape(full, (6, 6)), six).without([(0, 0), (5, 5)])))
+        self.assertEqual((board.shape, board.number_of_clues(), board.geometry), ((6, 6), 34, six))
+        self.assertEqual(Sudoku(board, six).solve()[0].ravel().tolist(), full)
+        with self.assertRaises(ValueError):
+            Board(np.full((6, 6), 7), six)
+
+        # A standard solution breaks the diagonals, and a clue with two possibilities has its own solutions.
+        solution = self.test_sudokus[0].solve()[0]
+        self.assertTrue(solution.check())
+        self.assertFalse(Sudoku(solution, diagonal).check())
+        self.assertEqual(Sudoku(solution, diagonal).solve(), [])
+        possibilities = np.ones((9, 9, 10), dtype=bool)
+        possibilities[:, :, 0] = False
+        possibilities[0, 0] = [False, True, True] + [False] * 7
+        solutions = Sudoku(np.zeros((9, 9)), 3, possibilities=possibilities).solve(maximal_number_of_solutions=20)
+        self.assertTrue(all(solution[0, 0] in (1, 2) for solution in solutions))
+
+    def test_trail_search(self):
+        for sudoku in self.test_sudokus:
+            board = sudoku.ravel().tolist()
+            results = []
+            for search in ['trail', 'copy']:
+                guesses = []
+                solutions = bitmask_solver.solve(board, sudoku.N, maximal_number_of_solutions='all', random_state=1,
+                                                 number_of_guesses_tracker=guesses, search=search)
+                results.append((solutions, guesses))
+            self.assertEqual(results[0], results[1])
+
+        state = bitmask_solver.BitmaskState.from_board(self.test_sudokus[1].ravel().tolist(), N=4)
+        state.trail = []
+        before = (state.candidates.copy(), state.values.copy(), state.row_used.copy(), state.column_used.copy(),
+                  state.box_used.copy(), state.empty)
+        cell = state.select_cell()
+        state.assign(cell, bitmask_solver.digits_of(state.candidates[cell])[0])
+        state.propagate(bitmask_solver.ALL_RULES)
+        self.assertLess(state.empty, before[-1])
+        state.undo(0)
+        self.assertEqual(before, (state.candidates, state.values, state.row_used, state.column_used,
+                                  state.box_used, state.empty))
+
+    def test_branching_heuristics(self):
+        sudoku = self.test_sudokus[1]
+        board = sudoku.ravel().tolist()
+        all_solutions = sorted(bitmask_solver.solve(board, 4, maximal_number_of_solutions='all'))
+        known_solution = all_solutions[0]
+        for branching in bitmask_solver.BRANCHING_HEURISTICS:
+            for value_order in bitmask_solver.VALUE_ORDERINGS:
+                solutions = bitmask_solver.solve(board, 4, maximal_number_of_solutions='all', random_state=0,
+                                                 branching=branching, value_order=value_order)
+                self.assertEqual(sorted(solutions), all_solutions)
+                solutions = bitmask_solver.solve(board, 4, maximal_number_of_solutions='all', random_state=0,
+                                                 known_solution=known_solution, branching=branching,
+                                                 value_order=value_order)
+                self.assertEqual(solutions[-1], known_solution)
+        self.assertEqual(bitmask_solver.default_heuristics(2), bitmask_solver.DEFAULT_HEURISTICS[3])
+        self.assertEqual(bitmask_solver.default_heuristics(5), bitmask_solver.DEFAULT_HEURISTICS[4])
+        with self.assertRaises(ValueError):
+            bitmask_solver.solve(board, 4, branching='unknown')
+        with self.assertRaises(ValueError):
+            bitmask_solver.solve(board, 4, value_order='unknown')
+
+        # Cells 2 and 14 both have two candidates, cell 14 has more empty peers.
+        state = bitmask_solver.BitmaskState.from_board([1, 0, 0, 0,
+                                                        0, 0, 0, 2,
+                                                        0, 0, 0, 0,
+                                                        0, 3, 0, 0], N=2)
+        self.assertEqual(state.select_cell(cells=[2, 14]), 2)
+        self.assertEqual(state.select_cell(cells=[2, 14], branching=bitmask_solver.MRV_DEGREE), 14)
+        weights = [1] * 12
+        self.assertEqual(state.select_cell(cells=[2, 14], branching=bitmask_solver.DOM_WDEG, unit_weights=weights), 2)
+        weights[3] = 10  # the last row had many conflicts
+        self.assertEqual(state.select_cell(cells=[2, 14], branching=bitmask_solver.DOM_WDEG, unit_weights=weights),
+                         14)
+
+    def test_learning(self):
+        for sudoku in self.test_sudokus:
+            board = sudoku.ravel().tolist()
+            all_solutions = sorted(bitmask_solver.solve(board, sudoku.N, maximal_number_of_solutions='all'))
+            for options in [{}, {'max_nogoods': 0}, {'restarts': 'luby', 'restart_base': 1, 'max_restarts': 5}]:
+                stats = SolverStats()
+                guesses = []
+                solutions = learning_solver.solve(board, sudoku.N, maximal_number_of_solutions='all', random_state=0,
+                                                  number_of_guesses_tracker=guesses, stats=stats, **options)
+                self.assertEqual(sorted(solutions), all_solutions)
+                self.assertEqual(len(guesses), len(solutions))
+                self.assertEqual(stats.guesses_per_solution, guesses)
+            solutions = learning_solver.solve(board, sudoku.N, maximal_number_of_solutions=1)
+            self.assertEqual(len(solutions), 1)
+            self.assertIn(solutions[0], all_solutions)
+            self.assertTrue(Sudoku(np.reshape(solutions[0], sudoku.shape), sudoku.N).check())
+
+        # A hard 9x9 puzzle with a unique solution, the test boards are solved with almost no search.
+        hard = [int(value) for value in
+                '800000000003600000070090200050007000000045700000100030001000068008500010090000400']
+        stats = SolverStats()
+        solutions = learning_solver.solve(hard, 3, maximal_number_of_solutions='all', random_state=0, stats=stats)
+        self.assertEqual(solutions, bitmask_solver.solve(hard, 3, maximal_number_of_solutions='all'))
+        self.assertGreater(stats.nogoods, 0)
+        self.assertGreater(stats.backjumps, 0)
+
+        sudoku = self.test_sudokus[1]
+        board = sudoku.ravel().tolist()
+        self.assertEqual(len(sudoku.solve(maximal_number_of_solutions=2, engine='learning')), 2)
+        with self.assertRaises(SearchBudgetExceeded):
+            learning_solver.solve(hard, 3, maximal_number_of_solutions='all', limits=SearchLimits(node_limit=3))
+        with self.assertRaises(ValueError):
+            learning_solver.solve(board, 4, branching='unknown')
+
+        # Only the most active half of the nogoods survives eviction, permanent ones are always kept.
+        store = learning_solver.NogoodStore(max_nogoods=4)
+        store.learn([1, 2], permanent=True)
+        for literal in range(3, 8):
+            store.learn([literal, literal + 100])
+        self.assertLessEqual(len(store.nogoods), 5)
+        self.assertIn([1, 2], [nogood.literals for nogood in store.nogoods.values()])
+        self.assertIn([7, 107], [nogood.literals for nogood in store.nogoods.values()])
+        store.learn([9])
+        self.assertEqual(store.units, {9})
+
+    def test_template_engine(self):
+        hard = [int(value) for value in
+                '800000000003600000070090200050007000000045700000100030001000068008500010090000400']
+        hard_solution = bitmask_solver.solve(hard, 3)[0]
+        # Emptying the first two rows of the solved board gives a board with several solutions.
+        several = [0] * 18 + hard_solution[18:]
+        boards = [self.test_sudokus[0].ravel().tolist(), hard, several, [0] * 81]
+        for board in boards[:3]:
+            all_solutions = sorted(bitmask_solver.solve(board, 3, maximal_number_of_solutions='all'))
+            stats = SolverStats()
+            guesses = []
+            solutions = template_solver.solve(board, 3, maximal_number_of_solutions='all', random_state=0,
+                                              number_of_guesses_tracker=guesses, stats=stats)
+            self.assertEqual(sorted(solutions), all_solutions)
+            self.assertEqual(stats.guesses_per_solution, guesses)
+            if len(all_solutions) > 1:
+                # The known solution is found last.
+                solutions = template_solver.solve(board, 3, maximal_number_of_solutions='all',
+                                                  known_solution=all_solutions[0])
+                self.assertEqual(solutions[-1], all_solutions[0])
+        self.assertEqual(template_solver.count_solutions_batch(boards).tolist(), [1, 1, 2, 2])
+        for batch_templates, board in zip(template_solver.digit_templates_batch(boards), boards):
+            for batch_indices, indices in zip(batch_templates, template_solver.digit_templates(board)):
+                self.assertEqual(batch_indices.tolist(), indices.tolist())
+        self.assertEqual(template_solver.count_solutions_batch(np.reshape(boards[:2], (2, 9, 9)), limit=1).tolist(),
+                         [1, 1])
+
+        # Candidate restrictions are respected: forbidding the digit of the solution in one cell leaves no solution.
+        candidates = [(1 << 9) - 1] * 81
+        candidates[1] &= ~(1 << (hard_solution[1] - 1))
+        self.assertEqual(template_solver.solve(hard, 3, candidates=candidates), [])
+        counts = template_solver.count_solutions_batch([hard, hard], candidates=[[(1 << 9) - 1] * 81, candidates])
+        self.assertEqual(counts.tolist(), [1, 0])
+
+        sudoku = Sudoku(np.reshape(several, (9, 9)), 3)
+        self.assertFalse(sudoku.has_unique_solution(engine='template'))
+        self.assertTrue(self.test_sudokus[0].has_unique_solution(engine='template'))
+        self.assertTrue(Sudoku(np.reshape(hard, (9, 9)), 3).has_unique_solution(
+            engine='template', known_solution=np.reshape(hard_solution, (9, 9))))
+        with self.assertRaises(SearchBudgetExceeded):
+            template_solver.solve([0] * 81, 3, maximal_number_of_solutions='all', limits=SearchLimits(node_limit=3))
+        with self.assertRaises(ValueError):
+            self.test_sudokus[1].solve(engine='template')
+        self.assertEqual(template_solver.solve(hard, sudoku_geometry.layout(3, 3)), [hard_solution])
+        with self.assertRaises(ValueError):
+            template_solver.solve(hard, sudoku_geometry.layout(3, 3, ('diagonal',)))
+
+    def test_restarts(self):
+        self.assertEqual([bitmask_solver.luby(i) for i in range(1, 16)], [1, 1, 2, 1, 1, 2, 4, 1, 1, 2, 1, 1, 2, 4, 8])
+        self.assertEqual(bitmask_solver.restart_caps('geometric', base=10, max_restarts=3), [10, 15, 22])
+        with self.assertRaises(ValueError):
+            bitmask_solver.restart_caps('unknown')
+
+        sudoku = self.test_sudokus[1]
+        board = sudoku.ravel().tolist()
+        all_solutions = sorted(bitmask_solver.solve(board, 4, maximal_number_of_solutions='all'))
+        for restarts in ['luby', 'geometric']:
+            stats = SolverStats()
+            guesses = []
+            solutions = bitmask_solver.solve(board, 4, maximal_number_of_solutions='all', random_state=0,
+                                             number_of_guesses_tracker=guesses, stats=stats, restarts=restarts,
+                                             restart_base=1, max_restarts=5)
+            self.assertEqual(sorted(solutions), all_solutions)  # the last attempt completes the search
+            self.assertTrue(0 < stats.restarts <= 5)
+            self.assertEqual(len(guesses), len(solutions))
+            self.assertEqual(stats.guesses_per_solution, guesses)
+            # Same results as without restarts if the first attempt finishes within its cap.
+            self.assertEqual(bitmask_solver.solve(board, 4, maximal_number_of_solutions=2, random_state=3,
+                                                  restarts=restarts, restart_base=10 ** 6),
+                             bitmask_solver.solve(board, 4, maximal_number_of_solutions=2, random_state=3))
+        with self.assertRaises(SearchBudgetExceeded):
+            bitmask_solver.solve(board, 4, maximal_number_of_solutions='all', restarts='luby', restart_base=1,
+                                 limits=SearchLimits(node_limit=3))
+
+    def test_parallel_search(self):
+        sudoku = self.test_sudokus[1]
+        board = sudoku.ravel().tolist()
+        serial_solutions = bitmask_solver.solve(board, sudoku.N, maximal_number_of_solutions='all', random_state=3)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            for maximal_number_of_solutions in [1, 2, 'all']:
+                results = []
+                for node_budget in [1000, 3]:
+                    guesses = []
+                    solutions = parallel_solver.solve(
+                        board, sudoku.N, maximal_number_of_solutions=maximal_number_of_solutions, random_state=3,
+                        number_of_guesses_tracker=guesses, node_budget=node_budget, root_budget=2,
+                        executor=executor)
+                    self.assertEqual(len(guesses), len(solutions))
+                    if maximal_number_of_solutions == 'all':
+                        self.assertEqual(sorted(solutions), sorted(serial_solutions))
+                    else:
+                        self.assertEqual(len(solutions), maximal_number_of_solutions)
+                        self.assertTrue(all(solution in serial_solutions for solution in solutions))
+                    results.append(solutions)
+                # The split of the tree depends only on the budgets, not on how tasks are scheduled.
+                self.assertEqual(results[1], parallel_solver.solve(
+                    board, sudoku.N, maximal_number_of_solutions=maximal_number_of_solutions, random_state=3,
+                    node_budget=3, root_budget=2, executor=executor))
+
+        tree_search = bitmask_solver.Search(board, sudoku.N, random_state=0)
+        solutions = []
+        while True:
+            solution = tree_search.next_solution(node_budget=1)
+            if solution is None:
+                break
+            solutions.append(solution)
+        self.assertFalse(tree_search.finished)
+        subproblems = tree_search.split()
+        self.assertEqual([path for path, _, _ in subproblems], sorted(path for path, _, _ in subproblems))
+        solutions += [solution for path, values, candidates in subproblems
+                      for solution in bitmask_solver.solve(values, sudoku.N, 'all', candidates=candidates)]
+        self.assertEqual(sorted(solutions), sorted(serial_solutions))
+        self.assertEqual(len(sudoku.solve(maximal_number_of_solutions=2, engine='parallel', processes=2)), 2)
+
+        # Running tasks return soon after the stop event is set instead of spending their whole budget.
+        stop_event = threading.Event()
+        stop_event.set()
+        found, subproblems, nodes, _ = parallel_solver._explore(
+            3, (), [0] * 81, None, 0, 10 ** 6, 'all', bitmask_solver.default_rules(3), False, stop_event)
+        self.assertLessEqual(nodes, parallel_solver.STOP_CHECK_INTERVAL)
+        self.assertEqual(subproblems, [])
+
+    def test_portfolio(self):
+        sudoku = self.test_sudokus[0]
+        expected = sudoku.solve(maximal_number_of_solutions=2)
+        portfolio = [{'engine': 'bitmask', 'rules': ()}, {'engine': 'dlx'}]
+        for _ in range(2):  # the second call reuses the worker processes
+            stats = SolverStats()
+            guesses = []
+            solutions = sudoku.solve(maximal_number_of_solutions=2, portfolio=portfolio, processes=2, stats=stats,
+                                     number_of_guesses_tracker=guesses)
+            self.assertEqual(len(solutions), 1)
+            self.assertTrue((solutions[0] == expected[0]).all())
+            self.assertEqual(stats.guesses_per_solution, guesses)
+        game = SudokuGame(self.test_boards[0], N=3, portfolio=portfolio)  # games only race when asked to
+        self.assertTrue((np.asarray(game.solutions[0]) == expected[0]).all())
+        board = self.test_sudokus[1].ravel().tolist()
+        all_solutions = bitmask_solver.solve(board, 4, maximal_number_of_solutions='all')
+        solutions = portfolio_solver.solve(board, 4, maximal_number_of_solutions=3, portfolio=portfolio, processes=2)
+        self.assertTrue(len(solutions) == 3 and all(solution in all_solutions for solution in solutions))
+
+        token = CancellationToken()
+        token.cancel()
+        with self.assertRaises(SearchBudgetExceeded):
+            sudoku.solve(portfolio='default', cancel_token=token)
+        with self.assertRaises(SearchBudgetExceeded):
+            portfolio_solver.solve(board, 4, maximal_number_of_solutions='all', portfolio=portfolio, processes=2,
+                                   limits=SearchLimits(node_limit=2))
+        with self.assertRaises(ValueError):
+            portfolio_solver.solve(board, 4, portfolio=[{'engine': 'numpy'}])
+
+    def test_solver_stats(self):
+        sudoku = self.test_sudokus[1]
+        results = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            for engine, options in [('numpy', {}), ('bitmask', {'search': 'trail'}), ('bitmask', {'search': 'copy'}),
+                                    ('dlx', {}), ('parallel', {'executor': executor, 'node_budget': 3})]:
+                stats = SolverStats()
+                guesses = []
+                solutions = sudoku.solve(maximal_number_of_solutions='all', random_state=0,
+                                         number_of_guesses_tracker=guesses, engine=engine, stats=stats, **options)
+                self.assertEqual(len(solutions), 4)
+                self.assertEqual(stats.guesses_per_solution, guesses)
+                self.assertGreater(stats.nodes, 0)
+                self.assertEqual(stats.backtracks, stats.nodes)  # every guess is undone in a complete search
+                self.assertGreater(stats.total_time, 0)
+                self.assertGreaterEqual(stats.branching_time, 0)
+                results[engine, options.get('search')] = stats
+
+        trail_stats, copy_stats = results['bitmask', 'trail'], results['bitmask', 'copy']
+        self.assertEqual((trail_stats.nodes, trail_stats.max_depth, trail_stats.eliminations),
+                         (copy_stats.nodes, copy_stats.max_depth, copy_stats.eliminations))
+        self.assertEqual(set(trail_stats.eliminations), {bitmask_solver.NAKED_SINGLES, bitmask_solver.HIDDEN_SINGLES})
+        self.assertEqual((trail_stats.copies, copy_stats.copies), (0, copy_stats.nodes))
+        self.assertGreater(trail_stats.max_trail_length, 0)
+        self.assertEqual(results['numpy', None].copies, results['numpy', None].nodes)
+        self.assertEqual(results['parallel', None].nodes, results['bitmask', 'trail'].nodes)
+        self.assertEqual(SolverStats().as_dict()['eliminations'], {})
+
+        # Eliminations count removed candidates, not changes: one propagation removes exactly as many as it reports.
+        hard = [int(value) for value in
+                '800000000003600000070090200050007000000045700000100030001000068008500010090000400']
+        hard_solution = bitmask_solver.solve(hard, 3)[0]
+        state = bitmask_solver.BitmaskState.from_board(hard, 3)
+        state.trail = []
+        for cell in [cell for cell in range(81) if not hard[cell]][:2]:
+            self.assertTrue(state.assign(cell, hard_solution[cell]))
+        number_of_candidates = sum(bin(mask).count('1') for mask in state.candidates)
+        stats = SolverStats()
+        self.assertTrue(state.propagate(bitmask_solver.ALL_RULES, stats))
+        self.assertGreater(len(stats.eliminations), 1)
+        self.assertEqual(sum(stats.eliminations.values()),
+                         number_of_candidates - sum(bin(mask).count('1') for mask in state.candidates))
+
+    def test_search_limits(self):
+        sudoku = self.test_sudokus[1]
+        token = CancellationToken()
+        token.cancel()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            for engine, options in [('numpy', {}), ('bitmask', {}), ('dlx', {}),
+                                    ('parallel', {'executor': executor, 'node_budget': 2})]:
+                for limits, reason in [({'node_limit': 1}, 'node_limit'), ({'cancel_token': token}, 'cancelled'),
+                                       ({'deadline': time.monotonic() - 1}, 'deadline')]:
+                    with self.assertRaises(SearchBudgetExceeded) as context:
+                        sudoku.solve(maximal_number_of_solutions='all', random_state=0, engine=engine, **limits,
+                                     **options)
+                    self.assertEqual(context.exception.reason, reason)
+                    self.assertLess(len(context.exception.solutions), 4)
+                solutions = sudoku.solve(maximal_number_of_solutions='all', engine=engine, node_limit=10 ** 6,
+                                         cancel_token=CancellationToken(), **options)
+                self.assertEqual(len(solutions), 4)
+
+        with self.assertRaises(SearchBudgetExceeded):
+            sudoku.has_unique_solution(node_limit=1)
+        with self.assertRaises(SearchBudgetExceeded):
+            SudokuGame(self.test_boards[1], N=4, allow_multiple_solutions=True, cancel_token=token)
+        with self.assertRaises(SearchBudgetExceeded):
+            SudokuGame(self.test_boards[1], N=4, deadline=time.monotonic() - 1)
+        with self.assertRaises(SearchBudgetExceeded):
+            full_sudoku = sudoku.solve()[0]
+            full_sudoku.can_remove_positions(np.argwhere(np.ones((8, 16))).tolist(), known_solution=full_sudoku,
+                                             cancel_token=token)
+
+    def test_solve_stepwise(self):
+        sudoku = self.test_sudokus[1]
+        for maximal_number_of_solutions in [1, 3, 'all']:
+            guesses = []
+            expected = sudoku.solve(maximal_number_of_solutions=maximal_number_of_solutions, random_state=2,
+                                    number_of_guesses_tracker=guesses)
+            stepwise = sudoku.solve_stepwise(maximal_number_of_solutions=maximal_number_of_solutions, random_state=2)
+            number_of_steps = 1
+            while not stepwise.step(node_budget=1):
+                number_of_steps += 1
+            self.assertGreater(number_of_steps, 1)
+            self.assertEqual(stepwise.number_of_guesses, guesses)
+            self.assertTrue(all(np.array_equal(a, b) for a, b in zip(stepwise.solutions, expected)))
+            self.assertEqual(len(stepwise.solutions), len(expected))
+
+    def test_concurrent_solves_are_reproducible(self):
+        sudoku = self.test_sudokus[1]
+        generated = puzzle_generator.generate_solved_sudoku(N=3, random_state=5)
+        cases = [(seed, engine) for seed in range(4) for engine in ['numpy', 'bitmask']]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as pool:
+            solves = [pool.submit(sudoku.solve, maximal_number_of_solutions=3, random_state=seed, engine=engine)
+                      for seed, engine in cases]
+            generations = [pool.submit(puzzle_generator.generate_solved_sudoku, N=3, random_state=5)
+                           for _ in range(4)]
+            for future, (seed, engine) in zip(solves, cases):
+                expected = sudoku.solve(maximal_number_of_solutions=3, random_state=seed, engine=engine)
+                self.assertTrue(all(np.array_equal(a, b) for a, b in zip(future.result(), expected)))
+            for future in generations:
+                self.assertTrue(np.array_equal(future.result(), generated))
+
+        for engine in ['numpy', 'bitmask', 'dlx']:
+            first = sudoku.solve(maximal_number_of_solutions=3, random_state=np.random.default_rng(7), engine=engine)
+            second = sudoku.solve(maximal_number_of_solutions=3, random_state=np.random.default_rng(7), engine=engine)
+            self.assertTrue(all(np.array_equal(a, b) for a, b in zip(first, second)))
+
+    def test_solve_batch(self):
+        board = np.array(self.test_boards[0])
+        under_constrained = board.copy()
+        under_constrained[:2] = 0
+        contradictory = board.copy()
+        contradictory[0, 0] = 2
+        boards = np.array([board, under_constrained, contradictory, self.test_sudokus[0].solve()[0]])
+        for rules in [(), bitmask_solver.DEFAULT_RULES]:
+            solutions, solution_counts, guess_counts = batch_solver.solve_batch(boards, max_solutions=2,
+                                                                                random_state=0, rules=rules)
+            self.assertEqual(solution_counts.tolist()[2:], [0, 1])
+            self.assertEqual(guess_counts[2], -1)
+            self.assertFalse(solutions[2].any())
+            for board_number in [0, 1, 3]:
+                guesses = []
+                expected = Sudoku(boards[board_number], N=3).solve(
+                    maximal_number_of_solutions=2, random_state=0, rules=rules, number_of_guesses_tracker=guesses)
+                self.assertEqual(solution_counts[board_number], len(expected))
+                self.assertTrue((solutions[board_number] == expected[0]).all())
+                self.assertEqual(guess_counts[board_number], guesses[0])
+
+        with self.assertRaises(ValueError):
+            batch_solver.solve_batch(np.zeros((2, 5, 5)))
+
+    def test_validate_boards(self):
+        solution = np.asarray(self.test_sudokus[0].solve()[0])
+        conflicting = solution.copy()
+        conflicting[0, 0] = solution[0, 1]
+        boards = np.array([solution, conflicting, self.test_boards[0]])
+        valid, conflicting_cells, conflicting_units = board_validator.validate_boards(boards)
+        self.assertEqual(valid.tolist(), [True, False, True])
+        self.assertEqual([Sudoku(board, N=3).check() for board in boards], valid.tolist())
+        self.assertFalse(conflicting_cells[[0, 2]].any())
+        column = int(np.flatnonzero(solution[:, 0] == solution[0, 1])[0])
+        self.assertEqual(np.argwhere(conflicting_cells[1]).tolist(), [[0, 0], [0, 1], [column, 0]])
+        self.assertEqual(np.flatnonzero(conflicting_units[1]).tolist(), [0, 9, 18])  # row 0, column 0, box 0
+        self.assertEqual(Sudoku(conflicting, N=3).conflicts().tolist(), [[0, 0], [0, 1], [column, 0]])
+
+        valid, _, _ = board_validator.validate_boards(boards, complete=True)
+        self.assertEqual(valid.tolist(), [True, False, False])
+
+        # Extra units of variants are checked as well.
+        diagonal = sudoku_geometry.layout(2, 2, ('diagonal',))
+        board = np.array([[1, 2, 3, 4], [3, 4, 1, 2], [2, 1, 4, 3], [4, 3, 2, 1]])
+        valid, conflicting_cells, conflicting_units = board_validator.validate_boards(board[None], diagonal)
+        self.assertFalse(valid[0])
+        number_of_units = len(diagonal.units)
+        self.assertEqual(np.flatnonzero(conflicting_units[0]).tolist(), [number_of_units - 2, number_of_units - 1])
+        self.assertTrue(board_validator.validate_boards(board[None], 2)[0][0])
+
+        game = SudokuGame(self.test_boards[0], N=3)
+        self.assertEqual(game.check_if_solution_is_full_and_correct(), 'Not all cells filled')
+        game.guesses = [[[int(value)] for value in row] for row in conflicting]
+        self.assertFalse(game.check_if_solution_is_full_and_correct())
+        game.guesses = [[[int(value)] for value in row] for row in solution]
+        self.assertTrue(game.check_if_solution_is_full_and_correct())
+
+        with self.assertRaises(ValueError):
+            board_validator.validate_boards(np.zeros((2, 5, 5)))
+        with self.assertRaises(ValueError):
+            puzzle_generator.generate_sudoku_from_a_full_puzzle(conflicting, N=3)
 
     def test_number_of_hints(self):
         self.assertTrue(81 - 10 == self.test_sudokus[0].number_of_clues())
@@ -109,6 +841,54 @@ class SudokuClassTest(unittest.TestCase):
             self.assertFalse((sudoku == 0).any()) # checks if the tables are fully filled
             self.assertTrue(sudoku.check()) # checks that there are no contradictions
 
+    def test_board(self):
+        grid = np.asarray(self.test_sudokus[0])
+        board = Board(grid, N=3)
+        self.assertFalse(hasattr(board, '__dict__'))
+        self.assertEqual(board.shape, (9, 9))
+        self.assertTrue((np.asarray(board) == grid).all())
+        self.assertEqual(board.number_of_clues(), self.test_sudokus[0].number_of_clues())
+        self.assertEqual(board[0][1], grid[0][1])
+        self.assertIs(type(board[0][0]), int)  # uint8 cells would wrap around: 0 - 1 == 255
+        self.assertEqual(board[0][0] - 1, grid[0][0] - 1)
+        self.assertIs(type(board[0, 0]), int)
+        view = np.asarray(board)
+        copied = np.array(board)
+        board[0, 0] = 9
+        self.assertEqual(view[0, 0], 9)  # views share the buffer of the board
+        self.assertNotEqual(copied[0, 0], 9)
+        self.assertEqual(board.__array__(copy=True)[0, 0], 9)
+        self.assertFalse(np.shares_memory(board.__array__(copy=True), view))
+        self.assertEqual(board.__array__(dtype='int16').dtype, np.int16)
+        with self.assertRaises(ValueError):
+            board.__array__(dtype='int16', copy=False)
+        self.assertEqual(board.without([(0, 0)])[0, 0], 0)
+        self.assertEqual(board[0, 0], 9)
+        with self.assertRaises(ValueError):
+            Board(np.full((9, 9), 10), N=3)
+        with self.assertRaises(ValueError):
+            Board(np.zeros((4, 4)), N=3)
+
+        board = puzzle_generator.sudoku_from_string(','.join(str(value) for value in grid.ravel()), N=3)
+        self.assertTrue((np.asarray(board) == grid).all())
+        solutions = Sudoku(board, N=3).solve(maximal_number_of_solutions=2)
+        self.assertEqual(len(solutions), 1)
+
+        # Candidate restrictions carry over to Sudoku and through pickling.
+        empty = np.zeros((4, 4), dtype=int)
+        masks = np.full(16, 0b1111)
+        masks[0] = 0b0100
+        board = Board(empty, N=2, candidates=masks)
+        board = pickle.loads(pickle.dumps(board))
+        self.assertEqual(board.candidate_masks().tolist(), masks.tolist())
+        for solution in Sudoku(board, N=2).solve(maximal_number_of_solutions=5):
+            self.assertEqual(solution[0, 0], 3)
+
+        game = SudokuGame(grid, N=3)
+        loaded = pickle.loads(pickle.dumps(game))
+        self.assertTrue((np.asarray(loaded.initial_board) == grid).all())
+        self.assertTrue((np.asarray(loaded.solutions[0]) == solutions[0]).all())
+
     def test_generate_sudoku_from_a_full_puzzle(self):
         a, n, p = 3, 14311, 237932
         number_of_tests = 3 # Each loop takes about 10 seconds.